@@ -15,12 +15,42 @@ class Settings:
     data_dir: str
     faiss_index_path: str
     faiss_mapping_path: str
+    index_snapshot_dir: str
+    index_snapshot_keep: int
+    faiss_index_type: str
+    faiss_nlist: int
+    faiss_nprobe: int
+    faiss_hnsw_m: int
+    faiss_ef_construction: int
+    faiss_ef_search: int
+    faiss_pq_m: int
+    faiss_train_sample: int
+    faiss_mmap: bool
+    query_cache_size: int
+    query_cache_ttl_seconds: float
+    chunk_store_max_items: int
+    retrieval_mode: str
+    rrf_k: int
+    hybrid_candidates: int
+    retrieval_workers: int
+    embedding_store_enabled: bool
+    embedding_store_dir: str
     llm_provider: str
     llm_base_url: str
     llm_model: str
     llm_json_model: str
     llm_embedding_model: str
     llm_embedding_dim: Optional[int]
+    local_embedder: str
+    hash_embedder_workers: int
+    embedding_batch_size: int
+    embedding_batch_tokens: int
+    embedding_concurrency: int
+    embedding_max_retries: int
+    http_max_connections: int
+    http_max_keepalive: int
+    http_keepalive_expiry: float
+    http2_enabled: bool
     llm_timeout: float
     llm_quiz_timeout: float
     llm_max_tokens: int
@@ -31,6 +61,10 @@ class Settings:
     llm_tool_timeout: float
     auto_rebuild_index: bool
     index_rebuild_debounce_seconds: float
+    index_watch_interval_seconds: float
+    index_rebuild_batch_size: int
+    index_checkpoint_seconds: float
+    index_compact_threshold: float
 
 
 def _build_database_url(
@@ -67,7 +101,32 @@ def load_settings() -> Settings:
         )
 
     faiss_index_path = os.path.join(data_dir, "faiss.index")
-    faiss_mapping_path = os.path.join(data_dir, "mapping.json")
+    faiss_mapping_path = os.path.join(data_dir, "mapping.npy")
+    index_snapshot_dir = os.path.join(data_dir, "index")
+    index_snapshot_keep = int(os.getenv("INDEX_SNAPSHOT_KEEP", "2"))
+    faiss_index_type = os.getenv("FAISS_INDEX_TYPE", "flat")
+    faiss_nlist = int(os.getenv("FAISS_NLIST", "0"))
+    faiss_nprobe = int(os.getenv("FAISS_NPROBE", "8"))
+    faiss_hnsw_m = int(os.getenv("FAISS_HNSW_M", "32"))
+    faiss_ef_construction = int(os.getenv("FAISS_EF_CONSTRUCTION", "80"))
+    faiss_ef_search = int(os.getenv("FAISS_EF_SEARCH", "64"))
+    faiss_pq_m = int(os.getenv("FAISS_PQ_M", "16"))
+    faiss_train_sample = int(os.getenv("FAISS_TRAIN_SAMPLE", "50000"))
+    faiss_mmap = os.getenv("FAISS_MMAP", "0").strip().lower() in {"1", "true", "yes", "on"}
+    query_cache_size = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    query_cache_ttl_seconds = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+    chunk_store_max_items = int(os.getenv("CHUNK_STORE_MAX_ITEMS", "100000"))
+    retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid").strip().lower()
+    rrf_k = int(os.getenv("RRF_K", "60"))
+    hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    retrieval_workers = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+    embedding_store_enabled = os.getenv("EMBEDDING_STORE_ENABLED", "1").strip().lower() in {
+        "1",
+        "true",
+        "yes",
+        "on",
+    }
+    embedding_store_dir = os.path.join(data_dir, "embeddings")
     llm_provider = os.getenv("LLM_PROVIDER", "deepseek")
     llm_base_url = os.getenv("LLM_BASE_URL", "https://api.deepseek.com")
     llm_model = os.getenv("LLM_MODEL", "deepseek-reasoner")
@@ -75,6 +134,16 @@ def load_settings() -> Settings:
     llm_embedding_model = os.getenv("LLM_EMBEDDING_MODEL", "")
     embedding_dim_raw = os.getenv("LLM_EMBEDDING_DIM", "").strip()
     llm_embedding_dim = int(embedding_dim_raw) if embedding_dim_raw else None
+    local_embedder = os.getenv("LOCAL_EMBEDDER", "hash")
+    hash_embedder_workers = int(os.getenv("HASH_EMBEDDER_WORKERS", "0"))
+    embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    embedding_batch_tokens = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8000"))
+    embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    embedding_max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+    http_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    http_max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+    http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+    http2_enabled = os.getenv("HTTP2_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
     llm_timeout = float(os.getenv("LLM_TIMEOUT", "30"))
     llm_quiz_timeout = float(os.getenv("LLM_QUIZ_TIMEOUT", str(llm_timeout)))
     llm_max_tokens = int(os.getenv("LLM_MAX_TOKENS", "512"))
@@ -90,6 +159,10 @@ def load_settings() -> Settings:
         "on",
     }
     index_rebuild_debounce_seconds = float(os.getenv("INDEX_REBUILD_DEBOUNCE_SECONDS", "2"))
+    index_watch_interval_seconds = float(os.getenv("INDEX_WATCH_INTERVAL_SECONDS", "1"))
+    index_rebuild_batch_size = int(os.getenv("INDEX_REBUILD_BATCH_SIZE", "1000"))
+    index_checkpoint_seconds = float(os.getenv("INDEX_CHECKPOINT_SECONDS", "60"))
+    index_compact_threshold = float(os.getenv("INDEX_COMPACT_THRESHOLD", "0.2"))
 
     return Settings(
         mysql_host=mysql_host,
@@ -101,12 +174,42 @@ def load_settings() -> Settings:
         data_dir=data_dir,
         faiss_index_path=faiss_index_path,
         faiss_mapping_path=faiss_mapping_path,
+        index_snapshot_dir=index_snapshot_dir,
+        index_snapshot_keep=index_snapshot_keep,
+        faiss_index_type=faiss_index_type,
+        faiss_nlist=faiss_nlist,
+        faiss_nprobe=faiss_nprobe,
+        faiss_hnsw_m=faiss_hnsw_m,
+        faiss_ef_construction=faiss_ef_construction,
+        faiss_ef_search=faiss_ef_search,
+        faiss_pq_m=faiss_pq_m,
+        faiss_train_sample=faiss_train_sample,
+        faiss_mmap=faiss_mmap,
+        query_cache_size=query_cache_size,
+        query_cache_ttl_seconds=query_cache_ttl_seconds,
+        chunk_store_max_items=chunk_store_max_items,
+        retrieval_mode=retrieval_mode,
+        rrf_k=rrf_k,
+        hybrid_candidates=hybrid_candidates,
+        retrieval_workers=retrieval_workers,
+        embedding_store_enabled=embedding_store_enabled,
+        embedding_store_dir=embedding_store_dir,
         llm_provider=llm_provider,
         llm_base_url=llm_base_url,
         llm_model=llm_model,
         llm_json_model=llm_json_model,
         llm_embedding_model=llm_embedding_model,
         llm_embedding_dim=llm_embedding_dim,
+        local_embedder=local_embedder,
+        hash_embedder_workers=hash_embedder_workers,
+        embedding_batch_size=embedding_batch_size,
+        embedding_batch_tokens=embedding_batch_tokens,
+        embedding_concurrency=embedding_concurrency,
+        embedding_max_retries=embedding_max_retries,
+        http_max_connections=http_max_connections,
+        http_max_keepalive=http_max_keepalive,
+        http_keepalive_expiry=http_keepalive_expiry,
+        http2_enabled=http2_enabled,
         llm_timeout=llm_timeout,
         llm_quiz_timeout=llm_quiz_timeout,
         llm_max_tokens=llm_max_tokens,
@@ -117,4 +220,8 @@ def load_settings() -> Settings:
         llm_tool_timeout=llm_tool_timeout,
         auto_rebuild_index=auto_rebuild_index,
         index_rebuild_debounce_seconds=index_rebuild_debounce_seconds,
+        index_watch_interval_seconds=index_watch_interval_seconds,
+        index_rebuild_batch_size=index_rebuild_batch_size,
+        index_checkpoint_seconds=index_checkpoint_seconds,
+        index_compact_threshold=index_compact_threshold,
     )
@@ -1,14 +1,17 @@
 import json
 import logging
 import os
+from pathlib import Path
 
-from fastapi import BackgroundTasks, Depends, FastAPI, File, Header, HTTPException, UploadFile, Query
+from fastapi import Depends, FastAPI, File, Header, HTTPException, UploadFile, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 import re
+from typing import Literal
 
 from app.db.models import Chunk, Document
 from app.db.session import SessionLocal, get_db
@@ -26,12 +29,32 @@ from app.schemas.research import (
 )
 from app.schemas.source import SourceResolveRequest, SourceResolveResponse
 from app.services.document_parser import build_chunks, extract_text
-from app.services.doc_summary import SummaryCache, SummaryResult, build_context, generate_summary
+from app.services.chunk_store import ChunkStore
+from app.services.doc_summary import (
+    SummaryCache,
+    SummaryResult,
+    build_context,
+    generate_summary,
+    generate_summary_async,
+)
+from app.services.embedding_store import EmbeddingStore
+from app.services.embeddings import QueryEmbeddingCache
+from app.services.index_factory import build_index_spec
 from app.services.index_manager import IndexManager
+from app.services.index_scheduler import IndexScheduler
+from app.services.index_watcher import IndexWatcher
+from app.services.lexical_index import tokenize_query
 from app.services.llm.mock import MockLLM
-from app.services.provider_factory import build_embedder, build_llm_client
+from app.services import http_pool
+from app.services.provider_factory import (
+    build_async_embedder,
+    build_async_llm_client,
+    build_embedder,
+    build_llm_client,
+    configure_http_pool,
+)
 from app.services.profile_service import build_profile_response
-from app.services.quiz_service import QuizSubmitError, generate_quiz, submit_quiz
+from app.services.quiz_service import QuizSubmitError, generate_quiz_async, submit_quiz
 from app.services.quiz_recent_service import list_recent_quizzes
 from app.services.research_service import (
     ResearchError,
@@ -60,12 +83,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 settings = load_settings()
+configure_http_pool(settings)
+embedder = build_embedder(settings)
 index_manager = IndexManager(
-    embedder=build_embedder(settings),
+    embedder=embedder,
     index_path=settings.faiss_index_path,
     mapping_path=settings.faiss_mapping_path,
+    snapshot_dir=settings.index_snapshot_dir,
+    snapshot_keep=settings.index_snapshot_keep,
+    rebuild_batch_size=settings.index_rebuild_batch_size,
+    checkpoint_seconds=settings.index_checkpoint_seconds,
+    spec=build_index_spec(settings),
+    mmap=settings.faiss_mmap,
+    query_cache=QueryEmbeddingCache(
+        max_items=settings.query_cache_size,
+        ttl_seconds=settings.query_cache_ttl_seconds,
+    ),
+    chunk_store=ChunkStore(max_items=settings.chunk_store_max_items),
+    rrf_k=settings.rrf_k,
+    retrieval_workers=settings.retrieval_workers,
+    embedding_store=(
+        EmbeddingStore.for_embedder(Path(settings.embedding_store_dir), embedder)
+        if settings.embedding_store_enabled
+        else None
+    ),
 )
+index_scheduler = IndexScheduler(
+    index_manager,
+    SessionLocal,
+    debounce_seconds=settings.index_rebuild_debounce_seconds,
+    compact_threshold=settings.index_compact_threshold,
+)
+index_watcher = IndexWatcher(index_manager, interval_seconds=settings.index_watch_interval_seconds)
 llm_client = build_llm_client(settings)
+# /chat, /chat/stream, /quiz/generate and /docs/{id}/summary await these, so a
+# pending provider call holds no threadpool worker.
+async_llm_client = build_async_llm_client(llm_client)
+async_embedder = build_async_embedder(embedder)
 tool_registry = build_tool_registry(settings)
 summary_cache = SummaryCache()
 MAX_CONTEXT_LENGTH = 4000
@@ -75,38 +129,32 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 def load_index_on_startup():
     index_manager.load_if_exists()
+    index_scheduler.start()
+    index_watcher.start()
     if not settings.auto_rebuild_index:
         return
     db = SessionLocal()
     try:
-        if index_manager.needs_rebuild(db):
-            index_manager.rebuild_with_lock(
-                db,
-                reason="startup",
-                debounce_seconds=0.0,
-                force=True,
-            )
+        # Workers take turns on the snapshot lock, so only the first one rebuilds.
+        index_manager.sync_lexical(db)
+        index_manager.refresh(db)
     except Exception:
         logger.exception("Index auto-rebuild on startup failed.")
     finally:
         db.close()
 
 
-def _schedule_index_rebuild(reason: str) -> None:
-    if not settings.auto_rebuild_index:
-        return
-    db = SessionLocal()
-    try:
-        index_manager.rebuild_with_lock(
-            db,
-            reason=reason,
-            debounce_seconds=settings.index_rebuild_debounce_seconds,
-            force=False,
-        )
-    except Exception:
-        logger.exception("Index auto-rebuild failed (%s).", reason)
-    finally:
-        db.close()
+@app.on_event("shutdown")
+async def stop_index_scheduler():
+    index_watcher.stop()
+    index_scheduler.stop()
+    index_manager.close()
+    # HashEmbedder's process pool and RealEmbedder's batch threads.
+    close_embedder = getattr(embedder, "close", None)
+    if close_embedder is not None:
+        close_embedder()
+    http_pool.close()
+    await http_pool.aclose()
 
 
 @app.get("/health")
@@ -118,7 +166,6 @@ def health():
 async def upload_document(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None,
 ):
     if not file.filename:
         raise HTTPException(status_code=400, detail="Filename is required")
@@ -150,8 +197,8 @@ async def upload_document(
 
     db.add_all(chunk_rows)
     db.commit()
-    if background_tasks is not None:
-        background_tasks.add_task(_schedule_index_rebuild, "upload")
+    if settings.auto_rebuild_index:
+        index_scheduler.enqueue_add(document.id)
 
     return {
         "document_id": document.id,
@@ -251,7 +298,6 @@ def list_document_chunks(
 def delete_document(
     doc_id: int,
     db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None,
 ):
     document = db.query(Document).filter(Document.id == doc_id).first()
     if not document:
@@ -259,26 +305,46 @@ def delete_document(
     db.delete(document)
     db.commit()
     summary_cache.invalidate(doc_id)
-    if background_tasks is not None:
-        background_tasks.add_task(_schedule_index_rebuild, "delete")
+    if settings.auto_rebuild_index:
+        index_scheduler.enqueue_delete(doc_id)
     return {"status": "deleted", "document_id": doc_id}
 
 
 @app.post("/index/rebuild")
-def rebuild_index(db: Session = Depends(get_db)):
-    result = index_manager.rebuild_with_lock(
-        db,
-        reason="manual",
-        debounce_seconds=0.0,
-        force=True,
-    )
-    return result or {"status": "skipped"}
+def rebuild_index(wait: bool = False):
+    # Coalesces with any rebuild already queued. By default the build runs in the
+    # background and GET /index/status reports its progress.
+    generation = index_scheduler.request_rebuild("manual")
+    if not wait:
+        return {
+            "status": "started",
+            "generation": generation,
+            "build": index_manager.status()["build"],
+        }
+    if not index_scheduler.wait_for(generation, fail_fast=True):
+        if index_scheduler.last_error:
+            # The scheduler keeps retrying in the background.
+            return {"status": "failed", "error": index_scheduler.last_error}
+        return {"status": "pending"}
+    return index_scheduler.last_result or {"status": "skipped"}
+
+
+@app.get("/index/status")
+def index_status():
+    return {
+        **index_manager.status(),
+        "scheduler": index_scheduler.status(),
+        "watcher": index_watcher.status(),
+    }
 
 
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1)
     top_k: int = Field(5, ge=1)
     document_id: int | None = None
+    nprobe: int | None = Field(None, ge=1)
+    ef_search: int | None = Field(None, ge=1)
+    mode: Literal["vector", "hybrid"] = "vector"
 
 
 @app.post("/search")
@@ -286,10 +352,54 @@ def search(request: SearchRequest, db: Session = Depends(get_db)):
     if not index_manager.is_ready():
         raise HTTPException(status_code=409, detail="Index not built. Call POST /index/rebuild first.")
 
-    results = index_manager.search(request.query, request.top_k, db, request.document_id)
+    if request.mode == "hybrid":
+        return index_manager.hybrid_search(
+            request.query,
+            request.top_k,
+            db,
+            request.document_id,
+            candidates=settings.hybrid_candidates,
+        )
+    results = index_manager.search(
+        request.query,
+        request.top_k,
+        db,
+        request.document_id,
+        nprobe=request.nprobe,
+        ef_search=request.ef_search,
+    )
     return results
 
 
+class SearchBatchRequest(BaseModel):
+    queries: list[str] = Field(..., min_length=1, max_length=64)
+    top_k: int = Field(5, ge=1)
+    document_id: int | None = None
+    nprobe: int | None = Field(None, ge=1)
+    ef_search: int | None = Field(None, ge=1)
+
+
+@app.post("/search/batch")
+def search_batch(request: SearchBatchRequest, db: Session = Depends(get_db)):
+    if not index_manager.is_ready():
+        raise HTTPException(status_code=409, detail="Index not built. Call POST /index/rebuild first.")
+
+    results = index_manager.search_many(
+        request.queries,
+        request.top_k,
+        db,
+        document_id=request.document_id,
+        nprobe=request.nprobe,
+        ef_search=request.ef_search,
+    )
+    return {
+        "items": [
+            {"query": query, "results": items}
+            for query, items in zip(request.queries, results)
+        ]
+    }
+
+
 class ChatRequest(BaseModel):
     query: str = Field(..., min_length=1)
     top_k: int = Field(5, ge=1)
@@ -316,12 +426,12 @@ def _error_response(status: int, code: str, message: str, details: dict | None =
 
 
 @app.post("/docs/{doc_id}/summary", response_model=DocSummaryResponse)
-def generate_doc_summary(
+async def generate_doc_summary(
     doc_id: int,
     payload: DocSummaryRequest,
     db: Session = Depends(get_db),
 ):
-    document = db.query(Document).filter(Document.id == doc_id).first()
+    document = await run_in_threadpool(lambda: db.query(Document).filter(Document.id == doc_id).first())
     if not document:
         return _error_response(404, "DOC_NOT_FOUND", "Document not found", {"document_id": doc_id})
 
@@ -336,8 +446,8 @@ def generate_doc_summary(
                 cached=True,
             )
 
-    chunks = (
-        db.query(Chunk)
+    chunks = await run_in_threadpool(
+        lambda: db.query(Chunk)
         .filter(Chunk.document_id == doc_id)
         .order_by(Chunk.chunk_index.asc())
         .all()
@@ -350,7 +460,7 @@ def generate_doc_summary(
         return _error_response(409, "DOC_EMPTY", "Document has no usable content", {"document_id": doc_id})
 
     try:
-        result, trace = generate_summary(llm_client, context)
+        result, trace = await generate_summary_async(async_llm_client, context)
     except Exception as exc:
         logger.warning("LLM summary failed, falling back to MockLLM: %s", exc)
         result, trace = generate_summary(MockLLM(), context)
@@ -364,8 +474,117 @@ def generate_doc_summary(
     )
 
 
+class ChatPlan(BaseModel):
+    """Retrieval outcome for one chat turn.
+
+    ``response`` is set when no generation is needed; ``no_candidates`` means
+    retrieval found nothing and the answer comes from ``_no_candidates_response``.
+    """
+
+    response: dict | None = None
+    no_candidates: bool = False
+    query: str = ""
+    forced_tool: str | None = None
+    hybrid: bool = False
+    lexical_fallback_used: bool = False
+    document_id: int | None = None
+    match_mode: str = "none"
+    matched_results: list[dict] = []
+    chunks_by_id: dict[int, str] = {}
+    context: str = ""
+    suggestions: list[str] = []
+    prompted_query: str = ""
+
+
 @app.post("/chat")
-def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+    plan = await _plan_chat_async(request, db)
+    if plan.no_candidates:
+        return await _no_candidates_response(plan)
+    if plan.response is not None:
+        return plan.response
+    answer, tool_traces = await _generate_chat_answer(plan)
+    return await _finish_chat(plan, answer, tool_traces)
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, db: Session = Depends(get_db)):
+    """Server-Sent Events: ``sources``, then ``token`` pieces, then ``done`` with the /chat body.
+
+    Retrieval runs before the response starts, so errors such as a missing
+    index still come back as plain HTTP errors and the first event is
+    ready as soon as retrieval is. The answer comes from the same
+    tool-calling loop as /chat: tool rounds finish first, then the final
+    completion streams.
+    """
+    plan = await _plan_chat_async(request, db)
+    return StreamingResponse(
+        _stream_chat(plan),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _stream_chat(plan: ChatPlan):
+    response = await _no_candidates_response(plan) if plan.no_candidates else plan.response
+    if response is not None:
+        yield _sse_event("sources", {"sources": response.get("sources", [])})
+        yield _sse_event("token", {"text": response["answer"]})
+        yield _sse_event("done", response)
+        return
+
+    yield _sse_event("sources", {"sources": _chat_sources(plan)})
+    # Same tool-calling loop as /chat; tool rounds run first, then the final
+    # answer streams as it arrives.
+    tools = list(tool_registry.values())
+    pieces: list[str] = []
+    tool_traces: list[dict] = []
+    try:
+        async for piece in async_llm_client.stream_answer_with_tools(
+            plan.prompted_query,
+            plan.context,
+            tools,
+            settings.llm_tool_max_calls,
+            forced_tool=plan.forced_tool,
+            tool_traces=tool_traces,
+        ):
+            pieces.append(piece)
+            yield _sse_event("token", {"text": piece})
+    except Exception as exc:
+        logger.warning("LLM stream failed in /chat/stream: %s", exc)
+        if not pieces:
+            tool_traces = []
+            for piece in MockLLM().stream_answer_with_tools(
+                plan.prompted_query,
+                plan.context,
+                tools,
+                settings.llm_tool_max_calls,
+                forced_tool=plan.forced_tool,
+                tool_traces=tool_traces,
+            ):
+                pieces.append(piece)
+                yield _sse_event("token", {"text": piece})
+    answer = "".join(pieces).strip()
+    yield _sse_event("done", await _finish_chat(plan, answer, tool_traces))
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _plan_chat_async(request: ChatRequest, db: Session) -> ChatPlan:
+    """Embed the query on the event loop when the embedder is an API, then retrieve in the threadpool."""
+    query_vectors = None
+    if async_embedder is not None and index_manager.is_ready() and not _pick_forced_tool(request.query):
+        try:
+            query_vectors = await index_manager.aembed_queries(async_embedder, [request.query])
+        except Exception as exc:
+            # Retrieval embeds the query itself (with its own retries) when this fails.
+            logger.warning("Async query embedding failed in /chat: %s", exc)
+    return await run_in_threadpool(_plan_chat, request, db, query_vectors)
+
+
+def _plan_chat(request: ChatRequest, db: Session, query_vectors=None) -> ChatPlan:
     if not index_manager.is_ready():
         raise HTTPException(status_code=409, detail="Index not built. Call POST /index/rebuild first.")
 
@@ -376,7 +595,7 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
         if expr:
             try:
                 output = tool.run({"expression": expr})
-                return {
+                return ChatPlan(response={
                     "answer": f"计算结果：{output}",
                     "structured": _build_fallback_structure(f"计算结果：{output}", []),
                     "sources": [],
@@ -388,9 +607,9 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
                         "reason": "forced_tool",
                         "suggestions": _build_suggestions(request.query),
                     },
-                }
+                })
             except ToolRunError as exc:
-                return {
+                return ChatPlan(response={
                     "answer": f"计算失败：{exc}",
                     "structured": _build_fallback_structure(f"计算失败：{exc}", []),
                     "sources": [],
@@ -407,43 +626,43 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
                         "reason": "forced_tool",
                         "suggestions": _build_suggestions(request.query),
                     },
-                }
+                })
 
-    results = index_manager.search(request.query, request.top_k, db, request.document_id)
-    doc_fallback_used = False
-    if not results and request.document_id:
-        results = _fallback_doc_results(request.document_id, request.query, request.top_k, db)
-        doc_fallback_used = bool(results)
+    hybrid = settings.retrieval_mode == "hybrid"
+    if hybrid:
+        results = index_manager.hybrid_search(
+            request.query,
+            request.top_k,
+            db,
+            request.document_id,
+            candidates=settings.hybrid_candidates,
+            query_vectors=query_vectors,
+        )
+    else:
+        results = index_manager.search(
+            request.query, request.top_k, db, request.document_id, query_vectors=query_vectors
+        )
+    lexical_fallback_used = False
+    if not results and not hybrid:
+        results = index_manager.lexical_search(request.query, request.top_k, db, request.document_id)
+        lexical_fallback_used = bool(results)
     if not results:
         if forced_tool and tool_registry:
             results = []
         else:
             suggestions = _build_suggestions(request.query)
-            prompted_query = _build_prompted_query(request.query, "none", suggestions)
-            try:
-                answer = llm_client.generate_answer(prompted_query, "")
-            except Exception as exc:
-                logger.warning("LLM generate failed in /chat, falling back to MockLLM: %s", exc)
-                answer = MockLLM().generate_answer(prompted_query, "")
-            return {
-                "answer": answer or "资料中未找到相关内容。",
-                "structured": _build_fallback_structure(
-                    answer or "资料中未找到相关内容。",
-                    suggestions,
-                ),
-                "sources": [],
-                "retrieval": {
-                    "mode": "none",
-                    "reason": "doc_filter_no_candidates" if request.document_id else "no_candidates",
-                    "suggestions": suggestions,
-                },
-            }
+            return ChatPlan(
+                no_candidates=True,
+                query=request.query,
+                document_id=request.document_id,
+                suggestions=suggestions,
+                prompted_query=_build_prompted_query(request.query, "none", suggestions),
+            )
 
-    chunk_ids = [item["chunk_id"] for item in results]
-    chunks = db.query(Chunk).filter(Chunk.id.in_(chunk_ids)).all()
-    chunks_by_id = {chunk.id: (chunk.text or "") for chunk in chunks}
+    stored_chunks = index_manager.get_chunks((item["chunk_id"] for item in results), db)
+    chunks_by_id = {chunk_id: chunk.text for chunk_id, chunk in stored_chunks.items()}
 
-    query_tokens = _tokenize_query(request.query)
+    query_tokens = tokenize_query(request.query)
     matched_results = results[: min(len(results), request.top_k)]
     has_exact = False
     for item in matched_results:
@@ -463,6 +682,7 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
         if filtered_results:
             matched_results = filtered_results
 
+    suggestions = _build_suggestions(request.query)
     context = ""
     if matched_results:
         context_parts = []
@@ -481,76 +701,122 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)):
                 break
         context = "\n\n".join(context_parts).strip()
         if not context:
-            return {
+            return ChatPlan(response={
                 "answer": "资料中未找到相关内容",
                 "structured": _build_fallback_structure("资料中未找到相关内容", suggestions),
                 "sources": [],
-            }
+            })
 
-    suggestions = _build_suggestions(request.query)
+    return ChatPlan(
+        query=request.query,
+        forced_tool=forced_tool,
+        hybrid=hybrid,
+        lexical_fallback_used=lexical_fallback_used,
+        document_id=request.document_id,
+        match_mode=match_mode,
+        matched_results=matched_results,
+        chunks_by_id=chunks_by_id,
+        context=context,
+        suggestions=suggestions,
+        prompted_query=_build_prompted_query(request.query, match_mode, suggestions),
+    )
+
+
+async def _no_candidates_response(plan: ChatPlan) -> dict:
+    try:
+        answer = await async_llm_client.generate_answer(plan.prompted_query, "")
+    except Exception as exc:
+        logger.warning("LLM generate failed in /chat, falling back to MockLLM: %s", exc)
+        answer = MockLLM().generate_answer(plan.prompted_query, "")
+    answer = answer or "资料中未找到相关内容。"
+    return {
+        "answer": answer,
+        "structured": _build_fallback_structure(answer, plan.suggestions),
+        "sources": [],
+        "retrieval": {
+            "mode": "none",
+            "reason": "doc_filter_no_candidates" if plan.document_id else "no_candidates",
+            "suggestions": plan.suggestions,
+        },
+    }
+
+
+async def _generate_chat_answer(plan: ChatPlan) -> tuple[str, list[dict]]:
     tool_traces: list[dict] = []
-    prompted_query = _build_prompted_query(request.query, match_mode, suggestions)
     tools = list(tool_registry.values())
     try:
         if tools:
-            answer, tool_traces = llm_client.generate_answer_with_tools(
-                prompted_query,
-                context,
+            answer, tool_traces = await async_llm_client.generate_answer_with_tools(
+                plan.prompted_query,
+                plan.context,
                 tools,
                 settings.llm_tool_max_calls,
-                forced_tool=forced_tool,
+                forced_tool=plan.forced_tool,
             )
         else:
-            answer = llm_client.generate_answer(prompted_query, context)
+            answer = await async_llm_client.generate_answer(plan.prompted_query, plan.context)
     except Exception as exc:
         logger.warning("LLM generate failed in /chat, falling back to MockLLM: %s", exc)
         fallback = MockLLM()
         if tools:
             answer, tool_traces = fallback.generate_answer_with_tools(
-                prompted_query,
-                context,
+                plan.prompted_query,
+                plan.context,
                 tools,
                 settings.llm_tool_max_calls,
-                forced_tool=forced_tool,
+                forced_tool=plan.forced_tool,
             )
         else:
-            answer = fallback.generate_answer(prompted_query, context)
-    sources = [
+            answer = fallback.generate_answer(plan.prompted_query, plan.context)
+    return answer, tool_traces
+
+
+def _chat_sources(plan: ChatPlan) -> list[dict]:
+    return [
         {
             "chunk_id": item["chunk_id"],
             "document_id": item["document_id"],
             "score": item["score"],
-            "match_mode": match_mode,
+            "rrf_score": item.get("rrf_score"),
+            "match_mode": plan.match_mode,
+            "retrievers": item.get("retrievers"),
         }
-        for item in matched_results
+        for item in plan.matched_results
     ]
-    structured = _build_structured_answer(
-        llm_client=llm_client,
-        query=request.query,
-        match_mode=match_mode,
+
+
+async def _finish_chat(plan: ChatPlan, answer: str, tool_traces: list[dict]) -> dict:
+    structured = await _build_structured_answer(
+        llm_client=async_llm_client,
+        query=plan.query,
+        match_mode=plan.match_mode,
         answer=answer,
-        suggestions=suggestions,
-        sources=matched_results,
-        chunks_by_id=chunks_by_id,
+        suggestions=plan.suggestions,
+        sources=plan.matched_results,
+        chunks_by_id=plan.chunks_by_id,
     )
     if structured and structured.get("conclusion"):
         answer = structured["conclusion"]
 
-    if doc_fallback_used:
+    match_mode = plan.match_mode
+    if plan.lexical_fallback_used and plan.document_id:
         retrieval_reason = (
             "doc_filter_fallback_exact" if match_mode == "exact" else "doc_filter_fallback_semantic"
         )
+    elif plan.lexical_fallback_used:
+        retrieval_reason = "lexical_fallback_exact" if match_mode == "exact" else "lexical_fallback_semantic"
     else:
         retrieval_reason = "exact_match" if match_mode == "exact" else "semantic_fallback"
     return {
         "answer": answer,
         "structured": structured,
-        "sources": sources,
+        "sources": _chat_sources(plan),
         "tool_traces": tool_traces,
         "retrieval": {
             "mode": match_mode,
             "reason": retrieval_reason,
-            "suggestions": suggestions,
+            "strategy": "hybrid" if plan.hybrid else "vector",
+            "suggestions": plan.suggestions,
         },
     }
 
@@ -563,7 +829,7 @@ def _pick_forced_tool(query: str) -> str | None:
     return None
 
 
-def _build_structured_answer(
+async def _build_structured_answer(
     llm_client,
     query: str,
     match_mode: str,
@@ -579,7 +845,7 @@ def _build_structured_answer(
 
     prompt = _build_structured_prompt(query, match_mode, suggestions, sources, chunks_by_id)
     try:
-        raw = llm_client.generate_answer(f"RAW_JSON:{prompt}", "")
+        raw = await llm_client.generate_answer(f"RAW_JSON:{prompt}", "")
     except Exception:
         return _build_fallback_structure(answer, suggestions, sources, chunks_by_id)
     parsed = _parse_structured_json(raw, allowed_chunk_ids={item["chunk_id"] for item in sources})
@@ -720,45 +986,6 @@ def _build_fallback_structure(
     }
 
 
-def _fallback_doc_results(
-    document_id: int,
-    query: str,
-    top_k: int,
-    db: Session,
-) -> list[dict]:
-    query_tokens = _tokenize_query(query)
-    if not query_tokens:
-        return []
-    chunks = (
-        db.query(Chunk)
-        .filter(Chunk.document_id == document_id)
-        .order_by(Chunk.chunk_index.asc())
-        .all()
-    )
-    scored: list[tuple[float, Chunk]] = []
-    for chunk in chunks:
-        text = chunk.text or ""
-        score = _match_score(query_tokens, text)
-        if score > 0:
-            scored.append((score, chunk))
-    if not scored:
-        return []
-    scored.sort(key=lambda item: item[0], reverse=True)
-    results: list[dict] = []
-    for score, chunk in scored[:top_k]:
-        preview = (chunk.text or "")[:200]
-        results.append(
-            {
-                "chunk_id": chunk.id,
-                "document_id": chunk.document_id,
-                "score": score,
-                "text_preview": preview,
-                "metadata": chunk.metadata_json,
-            }
-        )
-    return results
-
-
 def _extract_calc_expression(query: str) -> str | None:
     if not query:
         return None
@@ -771,41 +998,6 @@ def _extract_calc_expression(query: str) -> str | None:
     return None
 
 
-STOPWORDS = {
-    "的",
-    "了",
-    "吗",
-    "呢",
-    "和",
-    "或",
-    "以及",
-    "就是",
-    "如何",
-    "怎么",
-    "什么",
-    "哪些",
-    "请",
-    "是否",
-    "能否",
-    "the",
-    "a",
-    "an",
-    "and",
-    "or",
-    "to",
-    "of",
-    "in",
-}
-
-
-def _tokenize_query(text: str) -> list[str]:
-    if not text:
-        return []
-    tokens = re.findall(r"[A-Za-z0-9_]+|[\u4e00-\u9fff]{1,}", text.lower())
-    cleaned = [token for token in tokens if token and token not in STOPWORDS]
-    return cleaned
-
-
 def _match_score(query_tokens: list[str], text: str) -> float:
     if not query_tokens or not text:
         return 0.0
@@ -815,7 +1007,7 @@ def _match_score(query_tokens: list[str], text: str) -> float:
 
 
 def _build_suggestions(query: str) -> list[str]:
-    tokens = _tokenize_query(query)
+    tokens = tokenize_query(query)
     if not tokens:
         return []
     keywords = []
@@ -1007,12 +1199,12 @@ def get_profile_me(
 
 
 @app.post("/quiz/generate", response_model=QuizGenerateResponse)
-def quiz_generate(
+async def quiz_generate(
     request: QuizGenerateRequest,
     db: Session = Depends(get_db),
     session_id: str = Depends(get_session_id),
 ):
-    return generate_quiz(
+    return await generate_quiz_async(
         db=db,
         index_manager=index_manager,
         session_id=session_id,
@@ -1021,8 +1213,9 @@ def quiz_generate(
         count=request.count,
         types=[item.value for item in request.types],
         focus_concepts=request.focus_concepts,
-        llm_client=llm_client,
+        llm_client=async_llm_client,
         llm_timeout=settings.llm_quiz_timeout,
+        embedder=async_embedder,
     )
 
 
@@ -0,0 +1,71 @@
+import threading
+import time
+from typing import Any, Dict
+
+
+class BuildProgress:
+    """Live counters for the current (or last) full rebuild, safe to read from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = "idle"
+        self._phase = ""
+        self._total = 0
+        self._done = 0
+        self._resumed_from = 0
+        self._started_at: float | None = None
+        self._finished_at: float | None = None
+        self._error: str | None = None
+
+    def start(self, total: int, resumed_from: int = 0) -> None:
+        with self._lock:
+            self._state = "running"
+            self._phase = "training"
+            self._total = total
+            self._done = resumed_from
+            self._resumed_from = resumed_from
+            self._started_at = time.time()
+            self._finished_at = None
+            self._error = None
+
+    def set_phase(self, phase: str) -> None:
+        with self._lock:
+            self._phase = phase
+
+    def advance(self, count: int) -> None:
+        with self._lock:
+            self._done += count
+            # Chunks uploaded during the build can push the count past the estimate.
+            self._total = max(self._total, self._done)
+
+    def finish(self) -> None:
+        with self._lock:
+            self._state = "completed"
+            self._phase = ""
+            self._finished_at = time.time()
+
+    def fail(self, error: str) -> None:
+        with self._lock:
+            self._state = "failed"
+            self._finished_at = time.time()
+            self._error = error
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self._finished_at or time.time()
+            elapsed = end - self._started_at if self._started_at else 0.0
+            # Only chunks embedded in this run count toward the rate.
+            rate = (self._done - self._resumed_from) / elapsed if elapsed > 0 else 0.0
+            remaining = self._total - self._done
+            return {
+                "state": self._state,
+                "phase": self._phase,
+                "total": self._total,
+                "done": self._done,
+                "resumed_from": self._resumed_from,
+                "percent": round(100.0 * self._done / self._total, 1) if self._total else 0.0,
+                "elapsed_seconds": round(elapsed, 1),
+                "chunks_per_second": round(rate, 1),
+                "eta_seconds": round(remaining / rate, 1) if self._state == "running" and rate > 0 else None,
+                "error": self._error,
+            }
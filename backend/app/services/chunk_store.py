@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable
+
+from sqlalchemy.orm import Session, load_only
+
+from app.db.models import Chunk
+
+
+@dataclass(frozen=True, slots=True)
+class StoredChunk:
+    id: int
+    document_id: int
+    text: str
+    metadata_json: Any
+
+
+class ChunkStore:
+    """Chunk text by id, filled at index time so search and chat skip DB reads.
+
+    Chunk text never changes after upload, so entries only leave on delete or
+    LRU eviction. Misses (e.g. right after a restart) are loaded with one IN query.
+    """
+
+    def __init__(self, max_items: int = 100000):
+        self.max_items = max_items
+        self._items: OrderedDict[int, StoredChunk] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put_many(self, chunks: Iterable[Chunk]) -> None:
+        stored = [_to_stored(chunk) for chunk in chunks]
+        with self._lock:
+            for item in stored:
+                self._put(item)
+
+    def get_many(self, chunk_ids: Iterable[int], db: Session) -> Dict[int, StoredChunk]:
+        ids = list(dict.fromkeys(chunk_ids))
+        found: Dict[int, StoredChunk] = {}
+        with self._lock:
+            for chunk_id in ids:
+                item = self._items.get(chunk_id)
+                if item is not None:
+                    self._items.move_to_end(chunk_id)
+                    found[chunk_id] = item
+        missing = [chunk_id for chunk_id in ids if chunk_id not in found]
+        if missing:
+            rows = (
+                db.query(Chunk)
+                .options(load_only(Chunk.id, Chunk.document_id, Chunk.text, Chunk.metadata_json))
+                .filter(Chunk.id.in_(missing))
+                .all()
+            )
+            loaded = [_to_stored(row) for row in rows]
+            with self._lock:
+                for item in loaded:
+                    self._put(item)
+                    found[item.id] = item
+        return found
+
+    def remove(self, chunk_ids: Iterable[int]) -> None:
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._items.pop(int(chunk_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _put(self, item: StoredChunk) -> None:
+        if self.max_items <= 0:
+            return
+        self._items[item.id] = item
+        self._items.move_to_end(item.id)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+
+def _to_stored(chunk: Chunk) -> StoredChunk:
+    return StoredChunk(
+        id=chunk.id,
+        document_id=chunk.document_id,
+        text=chunk.text or "",
+        metadata_json=chunk.metadata_json,
+    )
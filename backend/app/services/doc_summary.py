@@ -3,7 +3,7 @@ import re
 import time
 from dataclasses import dataclass
 
-from app.services.llm.base import LLMClient
+from app.services.llm.base import AsyncLLMClient, LLMClient
 from app.services.llm.real import RealLLMClient
 
 
@@ -127,7 +127,17 @@ def build_summary_prompt() -> str:
 
 def generate_summary(llm_client: LLMClient, context: str) -> tuple[SummaryResult, SummaryTrace]:
     prompt = build_summary_prompt()
-    response = llm_client.generate_answer(prompt, context)
+    return _summary_from_response(prompt, context, llm_client.generate_answer(prompt, context))
+
+
+async def generate_summary_async(
+    llm_client: AsyncLLMClient, context: str
+) -> tuple[SummaryResult, SummaryTrace]:
+    prompt = build_summary_prompt()
+    return _summary_from_response(prompt, context, await llm_client.generate_answer(prompt, context))
+
+
+def _summary_from_response(prompt: str, context: str, response: str) -> tuple[SummaryResult, SummaryTrace]:
     cleaned = _cleanup_summary_text(response)
     if (
         cleaned
@@ -176,13 +186,7 @@ def _generate_keywords(
 ) -> tuple[list[str], str]:
     keyword_client: LLMClient = llm_client
     if isinstance(llm_client, RealLLMClient) and "reasoner" in (llm_client.model or ""):
-        keyword_client = RealLLMClient(
-            base_url=llm_client.base_url,
-            api_key=llm_client.api_key,
-            model="deepseek-chat",
-            timeout=llm_client.timeout,
-            max_tokens=llm_client.max_tokens,
-        )
+        keyword_client = llm_client.with_model("deepseek-chat")
     prompt = (
         "你是中文学习资料助手，请根据资料与摘要生成关键词。\n"
         "严格要求：\n"
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from app.services.embeddings import Embedder, embedder_fingerprint
+from app.services.snapshot_store import file_lock
+
+logger = logging.getLogger("uvicorn.error")
+
+DIGEST_SIZE = 32
+
+
+class EmbeddingStore:
+    """On-disk embeddings keyed by (embedder fingerprint, sha256(text)).
+
+    Each embedder gets its own directory holding two append-only files:
+    ``vectors.f32`` (raw float32 rows, read through ``np.memmap``) and
+    ``keys.bin`` (the sha256 digest of row i's text). Vectors are written
+    before keys, so a crash mid-append leaves at most an unreferenced vector.
+    Appends and torn-tail truncation hold ``store.lock`` so worker processes
+    sharing the directory never cut into each other's writes; before a miss
+    is embedded and before an append, the file size is re-read under that
+    lock so rows other workers appended are found, not duplicated. Lookups go through a sorted array of 8-byte digest prefixes and are
+    confirmed against the full digest.
+    """
+
+    def __init__(self, root: Path, fingerprint: str, dim: int):
+        self.fingerprint = fingerprint
+        self.dim = dim
+        self.path = Path(root) / _directory_name(fingerprint)
+        self.vectors_path = self.path / "vectors.f32"
+        self.keys_path = self.path / "keys.bin"
+        self.lock_path = self.path / "store.lock"
+        self._lock = threading.Lock()
+        self._count = 0
+        self._sorted_prefixes = np.zeros(0, dtype=np.uint64)
+        self._sorted_rows = np.zeros(0, dtype=np.int64)
+        # Rows appended since the sorted arrays were last rebuilt.
+        self._recent: Dict[int, int] = {}
+        self._vectors: np.ndarray | None = None
+        self._keys: np.ndarray | None = None
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    @classmethod
+    def for_embedder(cls, root: Path, embedder: Embedder) -> "EmbeddingStore":
+        return cls(root, embedder_fingerprint(embedder), embedder.dim)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def embed(self, embedder: Embedder, texts: List[str]) -> np.ndarray:
+        """Vectors for ``texts``, calling ``embedder`` only for texts not stored yet."""
+        digests = _digests(texts)
+        vectors, missing = self._lookup(digests)
+        if missing:
+            # Another worker may have appended them since this one last looked.
+            with self._locked():
+                self._follow()
+            found, missing_now = self._lookup(digests[missing])
+            for index, position in enumerate(missing):
+                vectors[position] = found[index]
+            missing = [missing[index] for index in missing_now]
+        if missing:
+            # Identical texts in one batch are embedded once.
+            first: Dict[bytes, int] = {}
+            for position in missing:
+                first.setdefault(digests[position].tobytes(), position)
+            unique = list(first.values())
+            embedded = np.asarray(embedder.embed_texts([texts[i] for i in unique]), dtype=np.float32)
+            self._append(digests[unique], embedded)
+            by_digest = {digests[i].tobytes(): row for i, row in zip(unique, embedded)}
+            for position in missing:
+                vectors[position] = by_digest[digests[position].tobytes()]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return vectors
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "fingerprint": self.fingerprint,
+            "size": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _open(self) -> None:
+        count, torn = self._stored_rows()
+        if torn:
+            # Without the lock the tail may be another worker's append in progress.
+            with self._locked():
+                count, torn = self._stored_rows()
+                if torn:
+                    logger.warning("Embedding store %s has a torn tail; ignoring it.", self.path)
+                    self._truncate(count)
+        self._count = count
+        self._reindex()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock, file_lock(self.lock_path):
+            yield
+
+    def _stored_rows(self) -> tuple[int, bool]:
+        """Complete rows on disk, and whether either file has bytes past them."""
+        row_bytes = self.dim * 4
+        vector_bytes = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        key_bytes = self.keys_path.stat().st_size if self.keys_path.exists() else 0
+        count = min(vector_bytes // row_bytes, key_bytes // DIGEST_SIZE)
+        return count, vector_bytes != count * row_bytes or key_bytes != count * DIGEST_SIZE
+
+    def _truncate(self, count: int) -> None:
+        for path, row_bytes in ((self.vectors_path, self.dim * 4), (self.keys_path, DIGEST_SIZE)):
+            if path.exists():
+                with path.open("r+b") as handle:
+                    handle.truncate(count * row_bytes)
+
+    def _follow(self) -> None:
+        """Adopt rows appended by other processes; call with ``_locked()`` held."""
+        count, torn = self._stored_rows()
+        if torn:
+            # Under the lock no append is in flight, so this is a crashed one.
+            logger.warning("Embedding store %s has a torn tail; ignoring it.", self.path)
+            self._truncate(count)
+        if count <= self._count:
+            return
+        start = self._count
+        self._count = count
+        # _vector_rows/_key_rows remap now that the count outgrew the maps.
+        for offset, prefix in enumerate(_prefixes(self._key_rows()[start:count]).tolist()):
+            self._recent[prefix] = start + offset
+        if len(self._recent) > max(1024, len(self._sorted_prefixes) // 8):
+            self._reindex()
+
+    def _reindex(self) -> None:
+        prefixes = _prefixes(self._key_rows())
+        order = np.argsort(prefixes, kind="stable")
+        self._sorted_prefixes = prefixes[order]
+        self._sorted_rows = order.astype(np.int64)
+        self._recent = {}
+
+    def _lookup(self, digests: np.ndarray) -> tuple[np.ndarray, List[int]]:
+        vectors = np.zeros((len(digests), self.dim), dtype=np.float32)
+        with self._lock:
+            rows = self._find(digests)
+            hit = rows >= 0
+            if hit.any():
+                vectors[hit] = self._vector_rows()[rows[hit]]
+        return vectors, np.flatnonzero(~hit).tolist()
+
+    def _find(self, digests: np.ndarray) -> np.ndarray:
+        """Row of each digest, or -1; call with ``_lock`` held."""
+        prefixes = _prefixes(digests)
+        rows = np.full(len(digests), -1, dtype=np.int64)
+        if len(self._sorted_prefixes):
+            pos = np.minimum(np.searchsorted(self._sorted_prefixes, prefixes), len(self._sorted_prefixes) - 1)
+            found = self._sorted_prefixes[pos] == prefixes
+            rows[found] = self._sorted_rows[pos[found]]
+        if self._recent:
+            for position in np.flatnonzero(rows < 0):
+                rows[position] = self._recent.get(int(prefixes[position]), -1)
+        hit = rows >= 0
+        # Prefix collisions are astronomically rare, but never return a wrong vector.
+        hit[hit] = (self._key_rows()[rows[hit]] == digests[hit]).all(axis=1)
+        rows[~hit] = -1
+        return rows
+
+    def _vector_rows(self) -> np.ndarray:
+        if self._vectors is None or self._vectors.shape[0] < self._count:
+            self._vectors = _map(self.vectors_path, np.float32, self._count, self.dim)
+        return self._vectors
+
+    def _key_rows(self) -> np.ndarray:
+        if self._keys is None or self._keys.shape[0] < self._count:
+            self._keys = _map(self.keys_path, np.uint8, self._count, DIGEST_SIZE)
+        return self._keys
+
+    def _append(self, digests: np.ndarray, vectors: np.ndarray) -> None:
+        with self._locked():
+            if not (self.path / "store.json").exists():
+                with (self.path / "store.json").open("w", encoding="utf-8") as handle:
+                    json.dump({"fingerprint": self.fingerprint, "dim": self.dim}, handle)
+            # Rows and keys must stay in step: skip texts another worker stored
+            # while these were being embedded.
+            self._follow()
+            fresh = np.flatnonzero(self._find(digests) < 0)
+            if len(fresh) == 0:
+                return
+            digests, vectors = digests[fresh], vectors[fresh]
+            for path, data in ((self.vectors_path, vectors), (self.keys_path, digests)):
+                with path.open("ab") as handle:
+                    handle.write(np.ascontiguousarray(data).tobytes())
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            start = self._count
+            self._count += len(digests)
+            for offset, prefix in enumerate(_prefixes(digests).tolist()):
+                self._recent[prefix] = start + offset
+            if len(self._recent) > max(1024, len(self._sorted_prefixes) // 8):
+                self._reindex()
+
+
+def _map(path: Path, dtype, rows: int, width: int) -> np.ndarray:
+    if rows == 0:
+        return np.zeros((0, width), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows, width))
+
+
+def _directory_name(fingerprint: str) -> str:
+    readable = re.sub(r"[^A-Za-z0-9_.-]+", "_", fingerprint)[:64]
+    return f"{readable}-{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _digests(texts: List[str]) -> np.ndarray:
+    joined = b"".join(hashlib.sha256((text or "").encode("utf-8")).digest() for text in texts)
+    return np.frombuffer(joined, dtype=np.uint8).reshape(len(texts), DIGEST_SIZE)
+
+
+def _prefixes(digests: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(digests[:, :8]).view("<u8").ravel()
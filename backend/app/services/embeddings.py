@@ -1,10 +1,26 @@
+import asyncio
 import hashlib
-from typing import Iterable, Protocol
+import random
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Iterable, List, Protocol
 
 import httpx
 
 import numpy as np
 
+from app.services import http_pool
+
+HASH_DIGEST_SIZE = 32
+# Han, kana and Hangul ranges: characters that carry meaning one or two at a time.
+CJK_RANGES = ((0x3040, 0x30FF), (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xAC00, 0xD7AF), (0xF900, 0xFAFF))
+NGRAM_PRIME = np.uint64(1_000_003)
+# Statuses below 500 that mean "try again later" rather than "bad request".
+RETRY_STATUS_CODES = {408, 429}
+
 
 class Embedder(Protocol):
     dim: int
@@ -14,30 +30,197 @@ class Embedder(Protocol):
 
 
 class HashEmbedder:
-    def __init__(self, dim: int = 384):
+    """Deterministic offline embedder: each vector is SHA-256(counter || text) bytes / 255.
+
+    Texts are hashed straight into one preallocated ``(n, dim)`` float32
+    buffer. Batches of at least ``parallel_min_batch`` texts are split across
+    ``workers`` processes when ``workers > 1``.
+    """
+
+    def __init__(self, dim: int = 384, workers: int = 0, parallel_min_batch: int = 4096):
         self.dim = dim
+        self.workers = workers
+        self.parallel_min_batch = parallel_min_batch
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
 
     def embed_texts(self, texts: Iterable[str]) -> np.ndarray:
-        vectors = [self._embed_one(text) for text in texts]
-        if not vectors:
-            return np.zeros((0, self.dim), dtype=np.float32)
-        return np.vstack(vectors).astype(np.float32)
+        items = list(texts)
+        out = np.empty((len(items), self.dim), dtype=np.float32)
+        if not items:
+            return out
+        row_bytes = _hash_row_bytes(self.dim)
+        if self.workers > 1 and len(items) >= self.parallel_min_batch:
+            raw = bytearray(len(items) * row_bytes)
+            step = -(-len(items) // (self.workers * 4))
+            starts = range(0, len(items), step)
+            parts = self._process_pool().map(
+                _hash_rows, [items[start : start + step] for start in starts], [self.dim] * len(starts)
+            )
+            for start, part in zip(starts, parts):
+                raw[start * row_bytes : start * row_bytes + len(part)] = part
+        else:
+            raw = _hash_rows(items, self.dim)
+        digests = np.frombuffer(raw, dtype=np.uint8).reshape(len(items), row_bytes)
+        # Same float32 division as the original per-text version, so vectors stay bit-identical.
+        np.divide(digests[:, : self.dim], np.float32(255.0), out=out, dtype=np.float32)
+        return out
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
 
-    def _embed_one(self, text: str) -> np.ndarray:
+def _hash_row_bytes(dim: int) -> int:
+    return -(-dim // HASH_DIGEST_SIZE) * HASH_DIGEST_SIZE
+
+
+def _hash_rows(texts: List[str], dim: int) -> bytearray:
+    """Concatenated SHA-256(counter || text) digests, ``_hash_row_bytes(dim)`` bytes per text."""
+    blocks = _hash_row_bytes(dim) // HASH_DIGEST_SIZE
+    # The counter is hashed first, so its state is computed once and copied per text.
+    seeds = [hashlib.sha256(counter.to_bytes(4, "little")) for counter in range(blocks)]
+    raw = bytearray(len(texts) * blocks * HASH_DIGEST_SIZE)
+    view = memoryview(raw)
+    offset = 0
+    for text in texts:
         data = text.encode("utf-8")
-        out = bytearray()
-        counter = 0
-        while len(out) < self.dim:
-            hasher = hashlib.sha256()
-            hasher.update(counter.to_bytes(4, "little"))
+        for seed in seeds:
+            hasher = seed.copy()
             hasher.update(data)
-            out.extend(hasher.digest())
-            counter += 1
-        arr = np.frombuffer(bytes(out[: self.dim]), dtype=np.uint8).astype(np.float32)
-        return arr / 255.0
+            view[offset : offset + HASH_DIGEST_SIZE] = hasher.digest()
+            offset += HASH_DIGEST_SIZE
+    return raw
+
+
+class CharNgramEmbedder:
+    """Offline embedder built from hashed character n-grams.
+
+    CJK text contributes character unigrams and bigrams; everything else
+    contributes 3- to 5-grams of the space-padded text, so word boundaries
+    count. N-grams are hashed into ``dim`` signed buckets, weighted with
+    sublinear term frequency times ``idf`` and L2-normalized, so texts sharing
+    distinctive vocabulary land near each other. ``IndexManager`` fits the IDF
+    on the corpus at each full rebuild and keeps it with the snapshot. Hashing runs as a rolling
+    polynomial over the UTF-32 code points of a whole batch at once.
+    """
 
+    cjk_ngrams = (1, 2)
+    word_ngrams = (3, 4, 5)
+
+    def __init__(self, dim: int = 384, idf: np.ndarray | None = None, batch_size: int = 512):
+        self.dim = dim
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float32)
+        self.batch_size = batch_size
+        # Part of the fingerprint: vectors built with other weights are not comparable.
+        self.model = "char-ngram-v1"
+        if self.idf is not None:
+            self.model += "-idf" + hashlib.sha256(self.idf.tobytes()).hexdigest()[:8]
+
+    def embed_texts(self, texts: Iterable[str]) -> np.ndarray:
+        items = list(texts)
+        out = np.zeros((len(items), self.dim), dtype=np.float32)
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start : start + self.batch_size]
+            positive, negative = self._bucket_counts(batch)
+            vectors = _sublinear(positive) - _sublinear(negative)
+            if self.idf is not None:
+                vectors *= self.idf
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            np.divide(vectors, norms, out=out[start : start + len(batch)], where=norms > 0)
+        return out
+
+    def fit_idf(self, texts: Iterable[str]) -> np.ndarray:
+        """Smoothed IDF per bucket over ``texts``, for ``with_idf``."""
+        items = list(texts)
+        df = np.zeros(self.dim, dtype=np.int64)
+        for start in range(0, len(items), self.batch_size):
+            positive, negative = self._bucket_counts(items[start : start + self.batch_size])
+            df += ((positive + negative) > 0).sum(axis=0)
+        return (np.log((1 + len(items)) / (1 + df)) + 1).astype(np.float32)
+
+    def with_idf(self, idf: np.ndarray | None) -> "CharNgramEmbedder":
+        """A copy weighted by ``idf``; the original keeps serving its own vectors."""
+        return CharNgramEmbedder(dim=self.dim, idf=idf, batch_size=self.batch_size)
+
+    def _bucket_counts(self, texts: List[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Per-text n-gram counts per bucket, split by the feature's hash sign."""
+        counts = np.zeros(len(texts) * 2 * self.dim, dtype=np.int64)
+        if not texts:
+            return counts.reshape(0, self.dim), counts.reshape(0, self.dim)
+        # NUL separates texts; windows containing it are dropped.
+        joined = "\0".join(f" {_normalize_ngram_text(text)} " for text in texts)
+        points = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        owner = np.cumsum(points == 0)
+        cjk = np.zeros(len(points), dtype=bool)
+        for low, high in CJK_RANGES:
+            cjk |= (points >= low) & (points <= high)
+        cjk_prefix = np.concatenate(([0], np.cumsum(cjk)))
+        nul_prefix = np.concatenate(([0], np.cumsum(points == 0)))
+
+        keys, rows = [], []
+        hashes = points.copy()
+        for size in range(1, max(self.cjk_ngrams + self.word_ngrams) + 1):
+            if size > 1:
+                if len(points) < size:
+                    break
+                # hash(window of size n) = hash(first n-1 chars) * P + last char, mod 2**64.
+                hashes = hashes[:-1] * NGRAM_PRIME + points[size - 1 :]
+            count = len(hashes)
+            cjk_in = cjk_prefix[size : size + count] - cjk_prefix[:count]
+            nul_in = nul_prefix[size : size + count] - nul_prefix[:count]
+            keep = np.zeros(count, dtype=bool)
+            if size in self.cjk_ngrams:
+                keep |= cjk_in == size
+            if size in self.word_ngrams:
+                keep |= cjk_in == 0
+            keep &= nul_in == 0
+            keys.append(_mix64(hashes[keep] ^ np.uint64(size)))
+            rows.append(owner[:count][keep])
+        keys = np.concatenate(keys)
+        rows = np.concatenate(rows).astype(np.int64)
+        sign = (keys >> np.uint64(63)).astype(np.int64)
+        buckets = (keys % np.uint64(self.dim)).astype(np.int64)
+        counts += np.bincount((rows * 2 + sign) * self.dim + buckets, minlength=len(counts))
+        counts = counts.reshape(len(texts), 2, self.dim)
+        return counts[:, 0], counts[:, 1]
+
+
+def _normalize_ngram_text(text: str) -> str:
+    # NFKC folds full-width forms, common in Chinese text, onto their ASCII twins.
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer: spreads similar n-gram hashes across all 64 bits.
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _sublinear(counts: np.ndarray) -> np.ndarray:
+    weights = np.zeros(counts.shape, dtype=np.float32)
+    np.log(counts, out=weights, where=counts > 0, dtype=np.float32)
+    weights[counts > 0] += 1.0
+    return weights
+
+
+class EmbeddingsEndpoint:
+    """Batching, retry policy and response parsing for an OpenAI-compatible ``/embeddings``.
+
+    ``RealEmbedder`` and ``AsyncRealEmbedder`` add only the transport.
+    """
 
-class RealEmbedder:
     def __init__(
         self,
         base_url: str,
@@ -45,31 +228,290 @@ class RealEmbedder:
         model: str,
         dim: int,
         timeout: float = 30.0,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 8000,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 30.0,
+        client: Any = None,
     ):
         self.base_url = base_url
         self.api_key = api_key
         self.model = model
         self.dim = dim
         self.timeout = timeout
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_batch_tokens = max(max_batch_tokens, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        # None: use the shared keep-alive pool, which this embedder never closes.
+        self.client = client
+
+    def _batches(self, items: List[str]) -> List[List[str]]:
+        batches: List[List[str]] = []
+        current: List[str] = []
+        tokens = 0
+        for text in items:
+            cost = _estimate_tokens(text)
+            if current and (len(current) >= self.max_batch_size or tokens + cost > self.max_batch_tokens):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(text)
+            tokens += cost
+        batches.append(current)
+        return batches
+
+    def _request(self, batch: List[str]) -> dict:
+        return {
+            "url": f"{self.base_url}/embeddings",
+            "json": {"model": self.model, "input": batch},
+            "headers": {"Authorization": f"Bearer {self.api_key}"},
+            "timeout": self.timeout,
+        }
+
+    def _vectors(self, response: httpx.Response, batch: List[str]) -> np.ndarray:
+        data = response.json().get("data", [])
+        if len(data) != len(batch):
+            raise ValueError("Embedding response size mismatch.")
+        # Providers may reorder items; each carries its input position.
+        data = sorted(data, key=lambda item: item.get("index", 0))
+        vectors = np.array([item.get("embedding") for item in data], dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            got = vectors.shape[1] if vectors.ndim == 2 else None
+            raise ValueError(f"Embedding dim mismatch: got {got}, expected {self.dim}.")
+        return vectors
+
+    def _retry_delay(self, attempt: int, response: httpx.Response | None) -> float | None:
+        """Seconds to wait before retrying, or None when ``response`` is final.
+
+        ``response`` is None after a transport error; past ``max_retries`` that
+        error (or the response's HTTP error) is raised.
+        """
+        if response is not None:
+            retryable = response.status_code in RETRY_STATUS_CODES or response.status_code >= 500
+            if not retryable or attempt >= self.max_retries:
+                response.raise_for_status()
+                return None
+            return self._backoff(attempt, response.headers.get("Retry-After"))
+        if attempt >= self.max_retries:
+            raise
+        return self._backoff(attempt)
+
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), self.max_backoff_seconds)
+            except ValueError:
+                pass  # HTTP-date form; fall back to our own schedule.
+        delay = min(self.backoff_seconds * (2**attempt), self.max_backoff_seconds)
+        # Jitter keeps parallel batches from retrying in lockstep.
+        return delay * (0.5 + random.random() / 2)
+
+
+class RealEmbedder(EmbeddingsEndpoint):
+    """Client for an OpenAI-compatible ``/embeddings`` endpoint.
+
+    Inputs are split into requests of at most ``max_batch_size`` texts and
+    about ``max_batch_tokens`` tokens, sent ``max_concurrency`` at a time over
+    one keep-alive client. 429s, 5xx responses and transport errors are
+    retried with exponential backoff (or the server's ``Retry-After``).
+    Vectors are returned in input order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
 
     def embed_texts(self, texts: Iterable[str]) -> np.ndarray:
         items = list(texts)
         if not items:
             return np.zeros((0, self.dim), dtype=np.float32)
 
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        payload = {"model": self.model, "input": items}
-        with httpx.Client(timeout=self.timeout) as client:
-            response = client.post(f"{self.base_url}/embeddings", json=payload, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        embeddings = [item.get("embedding") for item in data.get("data", [])]
-        if len(embeddings) != len(items):
-            raise ValueError("Embedding response size mismatch.")
+        batches = self._batches(items)
+        if len(batches) == 1 or self.max_concurrency == 1:
+            parts = [self._embed_batch(batch) for batch in batches]
+        else:
+            # map() yields in submission order, so batches reassemble in input order.
+            parts = list(self._batch_executor().map(self._embed_batch, batches))
+        return np.concatenate(parts, axis=0)
 
-        vectors = np.array(embeddings, dtype=np.float32)
-        if vectors.shape[1] != self.dim:
-            raise ValueError(
-                f"Embedding dim mismatch: got {vectors.shape[1]}, expected {self.dim}."
-            )
-        return vectors
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        client = self.client or http_pool.get_client()
+        attempt = 0
+        while True:
+            try:
+                response = client.post(**self._request(batch))
+            except httpx.TransportError:
+                delay = self._retry_delay(attempt, None)
+            else:
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return self._vectors(response, batch)
+            attempt += 1
+            time.sleep(delay)
+
+    def _batch_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="embedding"
+                )
+            return self._executor
+
+
+class AsyncRealEmbedder(EmbeddingsEndpoint):
+    """``RealEmbedder`` on ``httpx.AsyncClient``, for callers on the event loop.
+
+    Batches run concurrently as tasks, at most ``max_concurrency`` in flight,
+    so waiting on the provider holds no threads. Vectors match
+    ``RealEmbedder`` for the same settings, including its fingerprint.
+    """
+
+    async def embed_texts(self, texts: Iterable[str]) -> np.ndarray:
+        items = list(texts)
+        if not items:
+            return np.zeros((0, self.dim), dtype=np.float32)
+
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed(batch: List[str]) -> np.ndarray:
+            async with limit:
+                return await self._embed_batch(batch)
+
+        parts = await asyncio.gather(*(embed(batch) for batch in self._batches(items)))
+        return np.concatenate(parts, axis=0)
+
+    async def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        client = self.client or http_pool.get_async_client()
+        attempt = 0
+        while True:
+            try:
+                response = await client.post(**self._request(batch))
+            except httpx.TransportError:
+                delay = self._retry_delay(attempt, None)
+            else:
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return self._vectors(response, batch)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+def _estimate_tokens(text: str) -> int:
+    # No tokenizer for arbitrary providers: ~3 UTF-8 bytes per token is a safe
+    # upper bound for English and counts each CJK character as one token.
+    return len((text or "").encode("utf-8")) // 3 + 1
+
+
+def embedder_fingerprint(embedder: Embedder) -> str:
+    """Identify the vector space an embedder produces (model name and dimension)."""
+    model = getattr(embedder, "model", None) or type(embedder).__name__
+    return f"{model}:{embedder.dim}"
+
+
+def normalize_query(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+class QueryEmbeddingCache:
+    """Bounded, thread-safe LRU of query vectors with TTL expiry."""
+
+    def __init__(self, max_items: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[tuple[str, str], tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, embedder: Embedder, texts: Iterable[str]) -> np.ndarray:
+        queries = [normalize_query(text) for text in texts]
+        if not queries:
+            return np.zeros((0, embedder.dim), dtype=np.float32)
+        fingerprint = embedder_fingerprint(embedder)
+        found, missing = self._lookup(fingerprint, queries)
+        if missing:
+            self._store(fingerprint, found, missing, embedder.embed_texts(missing))
+        return np.vstack([found[query] for query in queries]).astype(np.float32, copy=False)
+
+    async def aembed(self, embedder: AsyncRealEmbedder, texts: Iterable[str]) -> np.ndarray:
+        """``embed`` for an async embedder; shares entries with sync callers of the same model."""
+        queries = [normalize_query(text) for text in texts]
+        if not queries:
+            return np.zeros((0, embedder.dim), dtype=np.float32)
+        fingerprint = embedder_fingerprint(embedder)
+        found, missing = self._lookup(fingerprint, queries)
+        if missing:
+            self._store(fingerprint, found, missing, await embedder.embed_texts(missing))
+        return np.vstack([found[query] for query in queries]).astype(np.float32, copy=False)
+
+    def _lookup(self, fingerprint: str, queries: List[str]) -> tuple[dict[str, np.ndarray], List[str]]:
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for query in dict.fromkeys(queries):
+                vector = self._get(fingerprint, query)
+                if vector is not None:
+                    found[query] = vector
+            missing = [query for query in dict.fromkeys(queries) if query not in found]
+            missed = sum(1 for query in queries if query not in found)
+            self.misses += missed
+            self.hits += len(queries) - missed
+        return found, missing
+
+    def _store(
+        self,
+        fingerprint: str,
+        found: dict[str, np.ndarray],
+        missing: List[str],
+        vectors: np.ndarray,
+    ) -> None:
+        with self._lock:
+            for query, vector in zip(missing, vectors):
+                found[query] = vector
+                self._put(fingerprint, query, vector)
+
+    def _get(self, fingerprint: str, query: str) -> np.ndarray | None:
+        key = (fingerprint, query)
+        item = self._items.get(key)
+        if item is None:
+            return None
+        stored_at, vector = item
+        if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+            self._items.pop(key, None)
+            return None
+        self._items.move_to_end(key)
+        return vector
+
+    def _put(self, fingerprint: str, query: str, vector: np.ndarray) -> None:
+        if self.max_items <= 0:
+            return
+        self._items[(fingerprint, query)] = (time.monotonic(), vector)
+        self._items.move_to_end((fingerprint, query))
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_items": self.max_items,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
@@ -0,0 +1,89 @@
+import atexit
+import logging
+import threading
+from dataclasses import dataclass
+
+import httpx
+
+logger = logging.getLogger("uvicorn.error")
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+
+
+_config = PoolConfig()
+_client: httpx.Client | None = None
+_async_client: httpx.AsyncClient | None = None
+_lock = threading.Lock()
+
+
+def configure(config: PoolConfig) -> None:
+    """Set pool limits; an open sync client is closed and rebuilt on next use."""
+    global _config
+    with _lock:
+        _config = config
+    close()
+
+
+def get_client() -> httpx.Client:
+    """The process-wide client shared by every provider; timeouts are set per request."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(**_client_options())
+        return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Async counterpart of ``get_client``, bound to the event loop that first uses it."""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = httpx.AsyncClient(**_client_options())
+        return _async_client
+
+
+def _client_options() -> dict:
+    http2 = _config.http2 and HTTP2_AVAILABLE
+    if _config.http2 and not HTTP2_AVAILABLE:
+        logger.info("HTTP/2 requested but the h2 package is missing; using HTTP/1.1.")
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=_config.max_connections,
+            max_keepalive_connections=_config.max_keepalive_connections,
+            keepalive_expiry=_config.keepalive_expiry,
+        ),
+    }
+
+
+def close() -> None:
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+async def aclose() -> None:
+    """Close the async client; call from the event loop that used it (app shutdown)."""
+    global _async_client
+    with _lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
+
+
+atexit.register(close)
@@ -0,0 +1,167 @@
+import logging
+import math
+from dataclasses import dataclass, replace
+from typing import Any, Dict
+
+import faiss
+import numpy as np
+
+from app.core.config import Settings
+
+logger = logging.getLogger("uvicorn.error")
+
+INDEX_TYPES = {"flat", "ivf", "hnsw", "ivfpq"}
+# FAISS k-means warns below ~39 points per centroid; PQ codebooks need 256 per sub-quantizer.
+MIN_POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    index_type: str = "flat"
+    nlist: int = 0
+    nprobe: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 80
+    ef_search: int = 64
+    pq_m: int = 16
+    train_sample: int = 50000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index_type": self.index_type,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "hnsw_m": self.hnsw_m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "pq_m": self.pq_m,
+            "train_sample": self.train_sample,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IndexSpec":
+        fields = cls().to_dict().keys()
+        return cls(**{key: data[key] for key in fields if key in data})
+
+
+def build_index_spec(settings: Settings) -> IndexSpec:
+    index_type = (settings.faiss_index_type or "").strip().lower() or "flat"
+    if index_type not in INDEX_TYPES:
+        logger.warning("Unknown FAISS_INDEX_TYPE=%s. Falling back to flat.", index_type)
+        index_type = "flat"
+    return IndexSpec(
+        index_type=index_type,
+        nlist=settings.faiss_nlist,
+        nprobe=settings.faiss_nprobe,
+        hnsw_m=settings.faiss_hnsw_m,
+        ef_construction=settings.faiss_ef_construction,
+        ef_search=settings.faiss_ef_search,
+        pq_m=settings.faiss_pq_m,
+        train_sample=settings.faiss_train_sample,
+    )
+
+
+def min_training_points(spec: IndexSpec, total: int) -> int:
+    if spec.index_type == "ivf":
+        return _resolve_nlist(spec, total) * MIN_POINTS_PER_CENTROID
+    if spec.index_type == "ivfpq":
+        return max(_resolve_nlist(spec, total) * MIN_POINTS_PER_CENTROID, PQ_CENTROIDS)
+    return 0
+
+
+def _resolve_nlist(spec: IndexSpec, total: int) -> int:
+    if spec.nlist > 0:
+        return spec.nlist
+    # Common FAISS guidance: about 4 * sqrt(N) inverted lists.
+    return max(1, int(4 * math.sqrt(max(total, 1))))
+
+
+def _resolve_pq_m(spec: IndexSpec, dim: int) -> int:
+    pq_m = max(1, min(spec.pq_m, dim))
+    while dim % pq_m != 0:
+        pq_m -= 1
+    return pq_m
+
+
+def build_index(spec: IndexSpec, dim: int, vectors: np.ndarray) -> tuple[Any, IndexSpec]:
+    """Create an ID-mapped index for ``spec``, trained on a sample of ``vectors``.
+
+    Returns the index and the spec actually used: IVF variants degrade to flat
+    while the corpus is too small to train meaningful centroids.
+    """
+    index, active_spec = create_index(spec, dim, int(vectors.shape[0]))
+    if not index.is_trained:
+        index.train(_training_sample(vectors, spec.train_sample))
+    return index, active_spec
+
+
+def create_index(spec: IndexSpec, dim: int, total: int) -> tuple[Any, IndexSpec]:
+    """Empty ID-mapped index sized for ``total`` vectors; IVF variants still need ``train``."""
+    if spec.index_type == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, spec.hnsw_m)
+        base.hnsw.efConstruction = spec.ef_construction
+        base.hnsw.efSearch = spec.ef_search
+        return faiss.IndexIDMap2(base), spec
+
+    if spec.index_type in {"ivf", "ivfpq"}:
+        required = min_training_points(spec, total)
+        if total < required:
+            logger.info(
+                "Too few vectors to train %s (have %s, need %s); using flat.",
+                spec.index_type,
+                total,
+                required,
+            )
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(dim)), replace(spec, index_type="flat")
+        nlist = _resolve_nlist(spec, total)
+        quantizer = faiss.IndexFlatL2(dim)
+        if spec.index_type == "ivf":
+            base = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            base = faiss.IndexIVFPQ(quantizer, dim, nlist, _resolve_pq_m(spec, dim), 8)
+        base.nprobe = min(spec.nprobe, nlist)
+        base.make_direct_map()
+        return faiss.IndexIDMap2(base), replace(spec, nlist=nlist)
+
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dim)), spec
+
+
+def ensure_direct_map(index: Any) -> Any:
+    """Let an IVF index reconstruct vectors by id, for exact per-document scans.
+
+    Indexes from ``create_index`` have the map from the start; this covers
+    snapshots saved before it did.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.no():
+        ivf.make_direct_map()
+    return index
+
+
+def training_sample_size(spec: IndexSpec, total: int) -> int:
+    return total if spec.train_sample <= 0 else min(spec.train_sample, total)
+
+
+def _training_sample(vectors: np.ndarray, limit: int) -> np.ndarray:
+    if limit <= 0 or vectors.shape[0] <= limit:
+        return vectors
+    rng = np.random.default_rng(0)
+    rows = rng.choice(vectors.shape[0], size=limit, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def build_search_params(
+    spec: IndexSpec,
+    top_k: int,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    sel=None,
+):
+    if spec.index_type in {"ivf", "ivfpq"}:
+        return faiss.SearchParametersIVF(nprobe=nprobe or spec.nprobe, sel=sel)
+    if spec.index_type == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=max(ef_search or spec.ef_search, top_k), sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
@@ -1,132 +1,731 @@
-import json
 import logging
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List
 
 import faiss
+import numpy as np
 from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 
 from app.db.models import Chunk
-from app.services.embeddings import Embedder
+from app.services.build_progress import BuildProgress
+from app.services.chunk_store import ChunkStore, StoredChunk
+from app.services.chunk_table import ChunkTable, content_hash
+from app.services.embedding_store import EmbeddingStore
+from app.services.embeddings import AsyncRealEmbedder, Embedder, QueryEmbeddingCache, embedder_fingerprint
+from app.services.index_factory import (
+    IndexSpec,
+    build_index,
+    create_index,
+    ensure_direct_map,
+    min_training_points,
+    training_sample_size,
+)
+from app.services.index_snapshot import IndexSnapshot
+from app.services.lexical_index import LexicalIndex
+from app.services.snapshot_store import SnapshotStore
 
 logger = logging.getLogger("uvicorn.error")
 PREVIEW_LENGTH = 200
+# Zero-copy mapping of flat codes when this FAISS build supports it.
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+# The delta segment is copied on every incremental add, so it is folded into the
+# base once it holds this many vectors or this fraction of the base.
+DELTA_MERGE_MIN_VECTORS = 2048
+DELTA_MERGE_FRACTION = 0.1
+BASE_FILE = "base.index"
+# Chunk table columns accumulated by a rebuild, in ChunkTable.from_columns order.
+BUILD_COLUMNS = ("ids", "documents", "positions", "hashes")
+DELTA_FILE = "delta.index"
+# Each rebuild checkpoint rewrites the whole partial index, so one is only taken
+# once the build has grown by this factor since the last: checkpoint I/O stays
+# linear in the corpus and a crash loses at most a third of the work.
+CHECKPOINT_GROWTH = 1.5
+# Corpus IDF of embedders refitted at each full rebuild (``with_idf``).
+IDF_FILE = "idf.npy"
 
 
 class IndexManager:
-    def __init__(self, embedder: Embedder, index_path: str, mapping_path: str):
+    """Owns the published ``IndexSnapshot`` and every write that replaces it.
+
+    Readers take ``self.snapshot`` once and search it without locks. Writers are
+    serialized by ``_write_lock`` and, across worker processes sharing the
+    snapshot directory, by the store's file lock; each builds the next snapshot
+    off to the side, persists it and publishes it with a single reference
+    assignment. Other workers pick it up through ``reload_if_changed``.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        index_path: str,
+        mapping_path: str,
+        spec: IndexSpec | None = None,
+        mmap: bool = False,
+        query_cache: QueryEmbeddingCache | None = None,
+        chunk_store: ChunkStore | None = None,
+        rrf_k: int = 60,
+        retrieval_workers: int = 2,
+        embedding_store: EmbeddingStore | None = None,
+        snapshot_dir: str | None = None,
+        snapshot_keep: int = 2,
+        rebuild_batch_size: int = 1000,
+        checkpoint_seconds: float = 60.0,
+    ):
         self.embedder = embedder
         self.dim = embedder.dim
+        # Flat files from before versioned snapshots; read once and migrated.
         self.index_path = Path(index_path)
         self.mapping_path = Path(mapping_path)
-        self.index = None
-        self.mapping: List[Dict[str, Any]] = []
-        self._rebuild_lock = threading.Lock()
-        self._last_rebuild_at = 0.0
+        # Pre-binary deployments kept the mapping as a JSON list of dicts.
+        self.legacy_mapping_path = self.mapping_path.with_suffix(".json")
+        self.snapshots = SnapshotStore(
+            Path(snapshot_dir) if snapshot_dir else self.index_path.parent / "index",
+            keep=snapshot_keep,
+        )
+        self.spec = spec or IndexSpec()
+        self.mmap = mmap
+        self.query_cache = query_cache
+        self.chunk_store = chunk_store if chunk_store is not None else ChunkStore()
+        self.rrf_k = rrf_k
+        self.embedding_store = embedding_store
+        self.rebuild_batch_size = max(rebuild_batch_size, 1)
+        self.checkpoint_seconds = checkpoint_seconds
+        self.build_progress = BuildProgress()
+        self._snapshot: IndexSnapshot | None = None
+        self._write_lock = threading.RLock()
+        self._retrieval_pool = ThreadPoolExecutor(
+            max_workers=max(retrieval_workers, 1), thread_name_prefix="retrieval"
+        )
+
+    def close(self) -> None:
+        """Stop the retrieval threads; hybrid_search cannot be used afterwards."""
+        self._retrieval_pool.shutdown()
+
+    @property
+    def snapshot(self) -> IndexSnapshot | None:
+        return self._snapshot
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        with self._write_lock, self.snapshots.lock():
+            # Another worker may have published since our last poll; build on its version.
+            self.reload_if_changed()
+            yield
+
+    def _build_index(self, vectors: np.ndarray, ids: np.ndarray):
+        # Vectors are keyed by chunk id so single documents can be appended in place.
+        index, active_spec = build_index(self.spec, self.dim, vectors)
+        if len(ids) > 0:
+            index.add_with_ids(vectors, ids)
+        return index, active_spec
+
+    def _publish(self, snapshot: IndexSnapshot, base_changed: bool, embedder: Embedder | None = None) -> None:
+        """Persist ``snapshot`` as a new snapshot directory and make it the one readers see.
+
+        ``embedder`` replaces ``self.embedder`` along with the snapshot (a rebuild
+        with a refitted IDF); by default the current one is kept.
+        """
+        embedder = embedder or self.embedder
+        previous = self._snapshot
+        files: Dict[str, Any] = {
+            "mapping.npy": snapshot.table.save,
+            "lexical.npz": snapshot.lexical.save,
+        }
+        previous_base = previous.source / BASE_FILE if previous is not None and previous.source else None
+        if not base_changed and previous_base is not None and previous_base.exists():
+            # The base is immutable between merges, so versions share one file.
+            files[BASE_FILE] = previous_base
+        else:
+            files[BASE_FILE] = lambda path: faiss.write_index(snapshot.base, str(path))
+        if snapshot.delta is not None:
+            files[DELTA_FILE] = lambda path: faiss.write_index(snapshot.delta, str(path))
+        if getattr(embedder, "idf", None) is not None:
+            files[IDF_FILE] = lambda path: np.save(path, embedder.idf)
+        manifest = {
+            "embedder": embedder_fingerprint(embedder),
+            "dim": self.dim,
+            "spec": snapshot.active_spec.to_dict(),
+            "watermark": snapshot.table.watermark(),
+        }
+        source = self.snapshots.publish(snapshot.version, files, manifest)
+        self.embedder = embedder
+        self._snapshot = replace(snapshot, source=source, embedder=manifest["embedder"])
+
+    def _next_version(self) -> int:
+        current = self._snapshot
+        return current.version + 1 if current is not None else 1
+
+    def _migrate_positional_index(self, index, table: ChunkTable):
+        """Re-key a legacy positional IndexFlatL2 by chunk id without re-embedding."""
+        # Positional rows were written in chunk id order, which the table preserves.
+        count = min(index.ntotal, len(table))
+        vectors = index.reconstruct_n(0, count) if count > 0 else np.zeros((0, self.dim), dtype=np.float32)
+        table = ChunkTable(np.array(table.rows[:count]))
+        migrated, active_spec = self._build_index(vectors, table.chunk_ids)
+        logger.info("Migrated positional FAISS index to chunk-id keys (chunks=%s).", count)
+        return migrated, table, active_spec
 
     def load_if_exists(self) -> bool:
-        if not (self.index_path.exists() and self.mapping_path.exists()):
-            logger.warning("FAISS index not found. Call POST /index/rebuild.")
+        if self._load_current():
+            return True
+        with self._writing():
+            # Another worker may have imported the legacy files while we waited.
+            return self._snapshot is not None or self._load_legacy()
+
+    def reload_if_changed(self) -> bool:
+        """Adopt a newer snapshot published by another worker; one small file read otherwise."""
+        version = self.snapshots.current_version()
+        current = self._snapshot
+        if version is None or (current is not None and version <= current.version):
             return False
+        with self._write_lock:
+            current = self._snapshot
+            if current is not None and version <= current.version:
+                return False
+            return self._load_current()
+
+    def _load_current(self) -> bool:
+        while True:
+            current = self.snapshots.current()
+            if current is None:
+                return False
+            path, manifest = current
+            try:
+                snapshot = self._read_snapshot(path, manifest)
+                embedder = self._embedder_from(path)
+                break
+            except (OSError, RuntimeError):
+                # Collected by a newer publish between reading the pointer and the files.
+                if self.snapshots.current_version() == manifest.get("version"):
+                    raise
+        with self._write_lock:
+            if embedder_fingerprint(embedder) == snapshot.embedder:
+                # Query with the IDF the snapshot was built with; otherwise
+                # staleness() reports a rebuild.
+                self.embedder = embedder
+            self._snapshot = snapshot
+        logger.info(
+            "Loaded index snapshot %s (type=%s, chunks=%s, mmap=%s)",
+            path.name,
+            snapshot.active_spec.index_type,
+            snapshot.table.live_count,
+            snapshot.mmapped,
+        )
+        return True
 
-        self.index = faiss.read_index(str(self.index_path))
-        with self.mapping_path.open("r", encoding="utf-8") as handle:
-            self.mapping = json.load(handle)
+    def _embedder_from(self, path: Path) -> Embedder:
+        """``self.embedder`` with the IDF saved under ``path``, for embedders refitted per rebuild."""
+        if not hasattr(self.embedder, "with_idf"):
+            return self.embedder
+        idf_path = path / IDF_FILE
+        return self.embedder.with_idf(np.load(idf_path) if idf_path.exists() else None)
 
-        if self.index.d != self.dim:
-            logger.warning(
-                "FAISS index dim %s does not match embedder dim %s.",
-                self.index.d,
-                self.dim,
-            )
-        if self.index.ntotal != len(self.mapping):
+    def _read_snapshot(self, path: Path, manifest: Dict[str, Any]) -> IndexSnapshot:
+        base = ensure_direct_map(faiss.read_index(str(path / BASE_FILE), MMAP_FLAGS if self.mmap else 0))
+        delta_path = path / DELTA_FILE
+        delta = faiss.read_index(str(delta_path)) if delta_path.exists() else None
+        lexical_path = path / "lexical.npz"
+        if base.d != self.dim:
+            logger.warning("FAISS index dim %s does not match embedder dim %s.", base.d, self.dim)
+        return IndexSnapshot(
+            version=int(manifest["version"]),
+            base=base,
+            table=ChunkTable.load(path / "mapping.npy", mmap=self.mmap),
+            lexical=LexicalIndex.load(lexical_path) if lexical_path.exists() else LexicalIndex(),
+            active_spec=IndexSpec.from_dict(manifest.get("spec", {})),
+            delta=delta,
+            delta_ids=_index_ids(delta),
+            mmapped=self.mmap,
+            source=path,
+            embedder=manifest.get("embedder", ""),
+        )
+
+    def _load_legacy(self) -> bool:
+        """Import flat index files written before versioned snapshots."""
+        table = None
+        if self.index_path.exists() and self.mapping_path.exists():
+            table = ChunkTable.load(self.mapping_path)
+        elif self.index_path.exists() and self.legacy_mapping_path.exists():
+            table = ChunkTable.load_legacy_json(self.legacy_mapping_path)
+        if table is None:
+            logger.warning("FAISS index not found. Call POST /index/rebuild.")
+            return False
+
+        index = faiss.read_index(str(self.index_path))
+        if index.ntotal != len(table):
             logger.warning(
                 "FAISS index count %s does not match mapping count %s.",
-                self.index.ntotal,
-                len(self.mapping),
+                index.ntotal,
+                len(table),
             )
-        logger.info(
-            "Loaded FAISS index from %s (chunks=%s)",
-            self.index_path,
-            self.index.ntotal,
+        active_spec = IndexSpec()
+        if not isinstance(index, faiss.IndexIDMap2) and index.d == self.dim:
+            index, table, active_spec = self._migrate_positional_index(index, table)
+        snapshot = IndexSnapshot(
+            version=1,
+            base=index,
+            table=table,
+            lexical=LexicalIndex(),
+            active_spec=active_spec,
         )
+        self._publish(snapshot, base_changed=True)
+        logger.info("Imported legacy index files from %s into %s.", self.index_path, self.snapshots.root)
         return True
 
-    def needs_rebuild(self, db: Session) -> bool:
-        chunk_total = db.query(func.count(Chunk.id)).scalar() or 0
-        if self.index is None:
-            return True
-        if len(self.mapping) != chunk_total:
-            return True
-        return False
+    def staleness(self, db: Session) -> str:
+        """Compare the index manifest with one aggregate query over chunks.
 
-    def rebuild(self, db: Session) -> Dict[str, Any]:
-        chunks = db.query(Chunk).order_by(Chunk.id).all()
-        texts = [chunk.text for chunk in chunks]
-        vectors = self.embedder.embed_texts(texts)
+        Returns ``"current"``, ``"delta"`` (apply_database_delta catches up) or
+        ``"rebuild"``. Chunk text never changes after upload and AUTO_INCREMENT
+        never reuses ids, so count, max id and id sum pin down the live id set.
+        """
+        count, max_id, id_sum = db.query(
+            func.count(Chunk.id), func.max(Chunk.id), func.sum(Chunk.id)
+        ).one()
+        snapshot = self._snapshot
+        if snapshot is None or not isinstance(snapshot.base, faiss.IndexIDMap2):
+            return "rebuild"
+        if snapshot.embedder != embedder_fingerprint(self.embedder):
+            return "rebuild"
+        if hasattr(self.embedder, "with_idf") and self.embedder.idf is None:
+            # Built before the IDF was fitted at rebuild time.
+            return "rebuild"
+        if self._spec_outdated(snapshot.active_spec, count or 0):
+            return "rebuild"
+        manifest = snapshot.table.watermark()
+        database = {
+            "chunk_count": count or 0,
+            "max_chunk_id": max_id,
+            "id_checksum": int(id_sum or 0),
+        }
+        if all(manifest[key] == value for key, value in database.items()):
+            return "current"
+        return "delta"
 
-        index = faiss.IndexFlatL2(self.dim)
-        if len(chunks) > 0:
-            index.add(vectors)
+    def refresh(self, db: Session) -> str:
+        """Catch the index up with the database; every worker can call this at startup.
 
-        mapping: List[Dict[str, Any]] = []
-        for chunk in chunks:
-            mapping.append(
-                {
-                    "chunk_id": chunk.id,
-                    "document_id": chunk.document_id,
-                    "chunk_index": chunk.chunk_index,
-                }
-            )
+        Workers queue on the store lock and re-check after adopting whatever the
+        previous holder published, so only the first one does the work.
+        """
+        with self._writing():
+            state = self.staleness(db)
+            if state == "rebuild":
+                self.rebuild(db)
+            elif state == "delta":
+                self.apply_database_delta(db)
+        return state
+
+    def apply_database_delta(self, db: Session) -> Dict[str, Any]:
+        """Index chunks missing from the snapshot and drop ones gone from the database."""
+        with self._writing():
+            snapshot = self._snapshot
+            if snapshot is None:
+                raise RuntimeError("Index not loaded; run a full rebuild first.")
+            db_ids = np.array([row[0] for row in db.query(Chunk.id).order_by(Chunk.id)], dtype=np.int64)
+            live_ids = snapshot.table.live_chunk_ids()
+            missing = np.setdiff1d(live_ids, db_ids)
+            new_ids = np.setdiff1d(db_ids, live_ids)
+            new_chunks: List[Chunk] = []
+            if len(new_ids) > 0:
+                new_chunks = (
+                    db.query(Chunk).filter(Chunk.id.in_(new_ids.tolist())).order_by(Chunk.id).all()
+                )
+            snapshot = self._with_removed(snapshot, missing)
+            snapshot, base_changed = self._with_added(snapshot, new_chunks)
+            if len(missing) > 0 or new_chunks:
+                self._publish(snapshot, base_changed=base_changed)
+            self.chunk_store.remove(missing)
+            self.chunk_store.put_many(new_chunks)
+        logger.info("Applied database delta (added=%s, removed=%s).", len(new_chunks), len(missing))
+        return {"added": len(new_chunks), "removed": int(len(missing))}
+
+    def _spec_outdated(self, active_spec: IndexSpec, chunk_total: int) -> bool:
+        if active_spec.index_type == self.spec.index_type:
+            return False
+        # An IVF index that fell back to flat is upgraded once there is enough data to train.
+        if active_spec.index_type == "flat" and chunk_total < min_training_points(
+            self.spec, chunk_total
+        ):
+            return False
+        return True
+
+    def rebuild(self, db: Session) -> Dict[str, Any]:
+        """Build a shadow snapshot from the database and swap it in.
 
-        self.index_path.parent.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(index, str(self.index_path))
-        with self.mapping_path.open("w", encoding="utf-8") as handle:
-            json.dump(mapping, handle, ensure_ascii=True)
+        Chunks stream through in keyset pages of ``rebuild_batch_size``; each page
+        is embedded and added to the index while the next one loads, so memory
+        beyond the index itself stays flat as the corpus grows. The partial
+        build is checkpointed on failure and at most every ``checkpoint_seconds``,
+        each time only once it is ``CHECKPOINT_GROWTH`` times the last one, and
+        the next rebuild resumes from it. Searches keep using the previous
+        snapshot until the swap; only other writers wait.
+        """
+        with self._writing():
+            total = db.query(func.count(Chunk.id)).scalar() or 0
+            resumed = self._resume_build()
+            if resumed is not None:
+                index, active_spec, columns, lexical, embedder = resumed
+            else:
+                index, active_spec = create_index(self.spec, self.dim, total)
+                columns = {key: [] for key in BUILD_COLUMNS}
+                lexical = LexicalIndex()
+                embedder = self.embedder
+            done = sum(len(ids) for ids in columns["ids"])
+            self.build_progress.start(total, resumed_from=done)
+            try:
+                sample_size = training_sample_size(self.spec, total)
+                if resumed is None and hasattr(embedder, "with_idf"):
+                    # The IDF follows the corpus, so every full rebuild refits it on a
+                    # sample; the current snapshot keeps its own until the swap.
+                    embedder = embedder.with_idf(
+                        embedder.fit_idf(text for texts in self._sample_texts(db, sample_size) for text in texts)
+                    )
+                if not index.is_trained:
+                    index.train(self._training_vectors(db, sample_size, embedder))
+                self.build_progress.set_phase("embedding")
+                self.chunk_store.clear()
+                saved_at = time.monotonic()
+                saved_rows = done
+                last_id = int(columns["ids"][-1][-1]) if done else 0
+                for page in self._chunk_pages(db, after_id=last_id):
+                    vectors = self._embed_texts([chunk.text for chunk in page], embedder)
+                    page_columns = _page_columns(page)
+                    index.add_with_ids(vectors, page_columns["ids"])
+                    for key, values in page_columns.items():
+                        columns[key].append(values)
+                    lexical.extend(page)
+                    self.chunk_store.put_many(page)
+                    self.build_progress.advance(len(page))
+                    rows = index.ntotal
+                    if (
+                        self.checkpoint_seconds > 0
+                        and time.monotonic() - saved_at >= self.checkpoint_seconds
+                        and rows >= saved_rows * CHECKPOINT_GROWTH
+                    ):
+                        self._save_build(index, active_spec, columns, lexical, embedder)
+                        saved_at, saved_rows = time.monotonic(), rows
+            except Exception as exc:
+                self.build_progress.fail(str(exc))
+                if columns["ids"]:
+                    self._save_build(index, active_spec, columns, lexical, embedder)
+                raise
 
-        self.index = index
-        self.mapping = mapping
+            self.build_progress.set_phase("publishing")
+            table = ChunkTable.from_columns(*(_concat(columns[key]) for key in BUILD_COLUMNS))
+            snapshot = IndexSnapshot(
+                version=self._next_version(),
+                base=index,
+                table=table,
+                lexical=lexical.freeze(),
+                active_spec=active_spec,
+            )
+            self._publish(snapshot, base_changed=True, embedder=embedder)
+            self.snapshots.clear_checkpoint()
+            if resumed is not None:
+                # Chunks deleted (or re-added) while the build was paused.
+                self.apply_database_delta(db)
+            self.build_progress.finish()
 
         return {
-            "chunk_total": len(mapping),
+            "chunk_total": self._snapshot.table.live_count,
             "dim": self.dim,
-            "index_path": str(self.index_path),
+            "index_type": active_spec.index_type,
+            "snapshot": str(self._snapshot.source),
+            "version": self._snapshot.version,
+            "resumed_from": done,
         }
 
-    def rebuild_with_lock(
+    def _save_build(
         self,
-        db: Session,
-        reason: str,
-        debounce_seconds: float = 0.0,
-        force: bool = False,
-    ) -> Dict[str, Any] | None:
-        if self._rebuild_lock.locked():
-            logger.info("Skip index rebuild; already running (%s).", reason)
+        index,
+        active_spec: IndexSpec,
+        columns: Dict[str, List[np.ndarray]],
+        lexical,
+        embedder: Embedder,
+    ) -> None:
+        """Checkpoint a partial rebuild; a later rebuild continues after its last chunk."""
+        for key in BUILD_COLUMNS:
+            columns[key][:] = [_concat(columns[key])]
+        lexical.freeze()
+
+        def write_columns(path: Path) -> None:
+            with path.open("wb") as handle:
+                np.savez(handle, **{key: columns[key][0] for key in BUILD_COLUMNS})
+
+        ids = columns["ids"][0]
+        files = {
+            "partial.index": lambda path: faiss.write_index(index, str(path)),
+            "columns.npz": write_columns,
+            "lexical.npz": lexical.save,
+        }
+        if getattr(embedder, "idf", None) is not None:
+            files[IDF_FILE] = lambda path: np.save(path, embedder.idf)
+        try:
+            self.snapshots.save_checkpoint(
+                files,
+                {
+                    "embedder": embedder_fingerprint(embedder),
+                    "spec": self.spec.to_dict(),
+                    "active_spec": active_spec.to_dict(),
+                    "done": len(ids),
+                    "last_chunk_id": int(ids[-1]),
+                },
+            )
+        except Exception:
+            # A failed checkpoint only costs the ability to resume.
+            logger.exception("Could not checkpoint the rebuild (chunks=%s).", len(ids))
+            return
+        logger.info("Checkpointed rebuild (chunks=%s, last_chunk_id=%s).", len(ids), int(ids[-1]))
+
+    def _resume_build(self):
+        saved = self.snapshots.checkpoint()
+        if saved is None:
             return None
-        now = time.monotonic()
-        if not force and debounce_seconds > 0:
-            if (now - self._last_rebuild_at) < debounce_seconds:
-                logger.info("Skip index rebuild; debounce active (%s).", reason)
-                return None
-        if not self._rebuild_lock.acquire(blocking=False):
-            logger.info("Skip index rebuild; lock unavailable (%s).", reason)
+        path, state = saved
+        try:
+            embedder = self._embedder_from(path)
+        except (OSError, ValueError):
+            embedder = self.embedder
+        if state.get("embedder") != embedder_fingerprint(embedder) or state.get("spec") != self.spec.to_dict():
+            logger.info("Discarding rebuild checkpoint made with other embedder or index settings.")
+            self.snapshots.clear_checkpoint()
             return None
         try:
-            result = self.rebuild(db)
-            self._last_rebuild_at = time.monotonic()
-            logger.info("Index rebuilt (%s).", reason)
-            return result
-        except Exception:
-            logger.exception("Index rebuild failed (%s).", reason)
+            index = faiss.read_index(str(path / "partial.index"))
+            with np.load(path / "columns.npz") as data:
+                columns = {key: [data[key]] for key in BUILD_COLUMNS}
+            lexical = LexicalIndex.load(path / "lexical.npz")
+        except (OSError, RuntimeError, KeyError, ValueError):
+            logger.warning("Discarding unreadable rebuild checkpoint at %s.", path)
+            self.snapshots.clear_checkpoint()
             return None
-        finally:
-            self._rebuild_lock.release()
+        if not index.ntotal == len(columns["ids"][0]) == len(lexical) == state.get("done"):
+            logger.warning("Discarding inconsistent rebuild checkpoint at %s.", path)
+            self.snapshots.clear_checkpoint()
+            return None
+        logger.info("Resuming rebuild from checkpoint (chunks=%s).", state["done"])
+        return index, IndexSpec.from_dict(state["active_spec"]), columns, lexical, embedder
+
+    def _chunk_pages(self, db: Session, after_id: int = 0) -> Iterator[List[Chunk]]:
+        """Chunks after ``after_id`` in id order, one keyset page at a time, prefetching the next."""
+
+        def fetch(after_id: int) -> List[Chunk]:
+            return (
+                db.query(Chunk)
+                .filter(Chunk.id > after_id)
+                .order_by(Chunk.id)
+                .limit(self.rebuild_batch_size)
+                .all()
+            )
+
+        # The session is only ever used by one thread at a time: the caller does
+        # not touch it while it processes a page.
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="rebuild-prefetch") as prefetch:
+            page = fetch(after_id)
+            while page:
+                upcoming = None
+                if len(page) == self.rebuild_batch_size:
+                    upcoming = prefetch.submit(fetch, page[-1].id)
+                yield page
+                page = upcoming.result() if upcoming is not None else []
+
+    def _training_vectors(self, db: Session, size: int, embedder: Embedder) -> np.ndarray:
+        """Embed a uniform sample of chunks so IVF can be trained before the streaming pass."""
+        # Sampled texts are embedded again in the main pass (from the embedding
+        # store when enabled); the sample is bounded by train_sample.
+        parts = [self._embed_texts(texts, embedder) for texts in self._sample_texts(db, size)]
+        return np.concatenate(parts) if parts else np.zeros((0, self.dim), dtype=np.float32)
+
+    def _sample_texts(self, db: Session, size: int) -> Iterator[List[str]]:
+        """Texts of a uniform sample of ``size`` chunks, one ``rebuild_batch_size`` batch at a time."""
+        ids = np.fromiter(
+            (row[0] for row in db.query(Chunk.id).order_by(Chunk.id).yield_per(10000)),
+            dtype=np.int64,
+        )
+        sample = np.sort(np.random.default_rng(0).choice(ids, size=min(size, len(ids)), replace=False))
+        for start in range(0, len(sample), self.rebuild_batch_size):
+            batch = sample[start : start + self.rebuild_batch_size].tolist()
+            rows = db.query(Chunk.text).filter(Chunk.id.in_(batch)).order_by(Chunk.id).all()
+            yield [row[0] for row in rows]
+
+    def add_document(self, db: Session, document_id: int) -> Dict[str, Any]:
+        result = self.add_documents(db, [document_id])
+        return {"document_id": document_id, "added": result["added"], "chunk_total": result["chunk_total"]}
+
+    def add_documents(self, db: Session, document_ids: Iterable[int]) -> Dict[str, Any]:
+        """Embed and append the documents' chunks; cost follows the documents, not the corpus."""
+        document_ids = sorted(set(document_ids))
+        with self._writing():
+            snapshot = self._snapshot
+            if snapshot is None:
+                raise RuntimeError("Index not loaded; run a full rebuild first.")
+            chunks: List[Chunk] = []
+            if document_ids:
+                chunks = (
+                    db.query(Chunk)
+                    .filter(Chunk.document_id.in_(document_ids))
+                    .order_by(Chunk.id)
+                    .all()
+                )
+            live = snapshot.table.live_mask(np.array([chunk.id for chunk in chunks], dtype=np.int64))
+            new_chunks = [chunk for chunk, indexed in zip(chunks, live) if not indexed]
+            if new_chunks:
+                snapshot, base_changed = self._with_added(snapshot, new_chunks)
+                self._publish(snapshot, base_changed=base_changed)
+                self.chunk_store.put_many(new_chunks)
+
+        return {
+            "document_ids": document_ids,
+            "added": len(new_chunks),
+            "chunk_total": snapshot.table.live_count,
+        }
+
+    def remove_document(self, document_id: int) -> Dict[str, Any]:
+        result = self.remove_documents([document_id])
+        return {"document_id": document_id, "removed": result["removed"], "chunk_total": result["chunk_total"]}
+
+    def remove_documents(self, document_ids: Iterable[int]) -> Dict[str, Any]:
+        """Tombstone the documents' chunks; their vectors drop out at the next merge."""
+        document_ids = sorted(set(document_ids))
+        with self._writing():
+            snapshot = self._snapshot
+            if snapshot is None:
+                return {"document_ids": document_ids, "removed": 0, "chunk_total": 0}
+            ids = np.concatenate(
+                [np.zeros(0, dtype=np.int64)]
+                + [snapshot.table.document_chunk_ids(document_id) for document_id in document_ids]
+            )
+            if len(ids) > 0:
+                snapshot = self._with_removed(snapshot, ids)
+                self._publish(snapshot, base_changed=False)
+            self.chunk_store.remove(ids)
+        return {
+            "document_ids": document_ids,
+            "removed": len(ids),
+            "chunk_total": snapshot.table.live_count,
+        }
+
+    def _with_added(self, snapshot: IndexSnapshot, chunks: List[Chunk]) -> tuple[IndexSnapshot, bool]:
+        """Next snapshot with ``chunks`` embedded into the delta; True if the base was merged."""
+        if not chunks:
+            return snapshot, False
+        vectors = self._embed_texts([chunk.text for chunk in chunks])
+        rows = _table_for(chunks)
+        # A re-added id replaces its tombstoned row, so an old vector under the same
+        # id would pass the tombstone filter; merging drops it from the segments.
+        readded = bool(np.isin(rows.chunk_ids, snapshot.table.chunk_ids).any())
+        # Copy-on-write: the published delta keeps serving searches meanwhile.
+        if snapshot.delta is not None:
+            delta = faiss.clone_index(snapshot.delta)
+        else:
+            delta = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dim))
+        delta.add_with_ids(vectors, rows.chunk_ids)
+        snapshot = replace(
+            snapshot,
+            version=snapshot.version + 1,
+            delta=delta,
+            delta_ids=np.union1d(snapshot.delta_ids, rows.chunk_ids),
+            table=snapshot.table.append(rows),
+            lexical=snapshot.lexical.with_added(chunks),
+        )
+        merge_at = max(DELTA_MERGE_MIN_VECTORS, int(snapshot.base.ntotal * DELTA_MERGE_FRACTION))
+        if readded or delta.ntotal >= merge_at:
+            return self._merged(snapshot), True
+        return snapshot, False
+
+    def _with_removed(self, snapshot: IndexSnapshot, ids: np.ndarray) -> IndexSnapshot:
+        """Next snapshot with ``ids`` tombstoned; vectors drop out at the next merge."""
+        if len(ids) == 0:
+            return snapshot
+        return replace(
+            snapshot,
+            version=snapshot.version + 1,
+            table=snapshot.table.with_deleted(ids),
+            lexical=snapshot.lexical.with_removed(ids),
+        )
+
+    def deleted_fraction(self) -> float:
+        snapshot = self._snapshot
+        return snapshot.table.deleted_fraction() if snapshot is not None else 0.0
+
+    def compact(self) -> Dict[str, Any]:
+        """Fold the delta into the base and drop tombstoned rows and vectors."""
+        with self._writing():
+            snapshot = self._snapshot
+            if snapshot is None or (snapshot.table.deleted_count == 0 and snapshot.delta is None):
+                live_count = snapshot.table.live_count if snapshot is not None else 0
+                return {"compacted": 0, "chunk_total": live_count}
+            dropped = snapshot.table.deleted_count
+            snapshot = self._merged(replace(snapshot, version=snapshot.version + 1))
+            self._publish(snapshot, base_changed=True)
+        logger.info("Index compacted (dropped=%s).", dropped)
+        return {"compacted": dropped, "chunk_total": snapshot.table.live_count}
+
+    def _merged(self, snapshot: IndexSnapshot) -> IndexSnapshot:
+        """A snapshot with live delta vectors moved into a new base and tombstones gone."""
+        table = snapshot.table.compacted()
+        live_ids = table.chunk_ids
+        delta_ids = snapshot.delta_ids[np.isin(snapshot.delta_ids, live_ids)]
+        delta_vectors = (
+            snapshot.delta.reconstruct_batch(delta_ids)
+            if len(delta_ids) > 0
+            else np.zeros((0, self.dim), dtype=np.float32)
+        )
+        base_ids = _index_ids(snapshot.base)
+        stale = ~np.isin(base_ids, live_ids) | np.isin(base_ids, delta_ids)
+        active_spec = snapshot.active_spec
+        if active_spec.index_type in {"hnsw", "ivf", "ivfpq"} and stale.any():
+            # HNSW cannot remove in place, and IVF removal breaks its direct map;
+            # re-add the live vectors instead.
+            keep_ids = base_ids[~stale]
+            kept = (
+                snapshot.base.reconstruct_batch(keep_ids)
+                if len(keep_ids) > 0
+                else np.zeros((0, self.dim), dtype=np.float32)
+            )
+            ids = np.concatenate([keep_ids, delta_ids])
+            vectors = np.vstack([kept, delta_vectors])
+            if active_spec.index_type == "hnsw":
+                base, active_spec = self._build_index(vectors, ids)
+            else:
+                # Keep the trained centroids (and PQ codebooks): empty a copy and refill it.
+                base = self._writable_base(snapshot)
+                base.reset()
+                if len(ids) > 0:
+                    base.add_with_ids(vectors, ids)
+        else:
+            base = self._writable_base(snapshot)
+            if stale.any():
+                base.remove_ids(base_ids[stale])
+            if len(delta_ids) > 0:
+                base.add_with_ids(delta_vectors, delta_ids)
+        return replace(
+            snapshot,
+            base=base,
+            table=table,
+            lexical=snapshot.lexical.compacted(),
+            active_spec=active_spec,
+            delta=None,
+            delta_ids=np.zeros(0, dtype=np.int64),
+            mmapped=False,
+        )
+
+    def _writable_base(self, snapshot: IndexSnapshot):
+        # A memory-mapped index (and any clone of it) shares the file pages, so
+        # mutating it would fault; read a private copy from disk instead.
+        if snapshot.mmapped:
+            return faiss.read_index(str(snapshot.source / BASE_FILE))
+        return faiss.clone_index(snapshot.base)
 
     def is_ready(self) -> bool:
-        return self.index is not None
+        return self._snapshot is not None
 
     def search(
         self,
@@ -134,38 +733,257 @@ class IndexManager:
         top_k: int,
         db: Session,
         document_id: int | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        query_vectors: np.ndarray | None = None,
     ) -> List[Dict[str, Any]]:
-        if self.index is None:
-            return []
+        return self.search_many(
+            [query],
+            top_k,
+            db,
+            document_id=document_id,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            query_vectors=query_vectors,
+        )[0]
 
-        if self.index.ntotal == 0:
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int,
+        db: Session,
+        document_id: int | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        query_vectors: np.ndarray | None = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Search several queries with one embedding call, one FAISS call and one chunk query.
+
+        ``query_vectors`` (from ``aembed_queries``) skips the embedding call.
+        """
+        if not queries:
             return []
+        hits_per_query = self._vector_hits(
+            self._snapshot, queries, top_k, document_id, nprobe, ef_search, query_vectors
+        )
+        chunks_by_id = self.get_chunks(
+            (chunk_id for hits in hits_per_query for chunk_id, _ in hits), db
+        )
+
+        return [
+            self._build_results(hits, chunks_by_id, top_k, document_id)
+            for hits in hits_per_query
+        ]
+
+    def _vector_hits(
+        self,
+        snapshot: IndexSnapshot | None,
+        queries: List[str],
+        top_k: int,
+        document_id: int | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        query_vectors: np.ndarray | None = None,
+    ) -> List[List[tuple[int, float]]]:
+        """Live (chunk id, distance) hits per query, nearest first."""
+        if snapshot is None or snapshot.vector_count == 0:
+            return [[] for _ in queries]
 
-        vectors = self.embedder.embed_texts([query])
+        vectors = query_vectors if query_vectors is not None else self._embed_queries(queries)
         if document_id is not None:
-            k = min(max(top_k * 5, top_k), self.index.ntotal)
+            distances, labels = snapshot.search_document(vectors, top_k, document_id)
         else:
-            k = min(top_k, self.index.ntotal)
-        distances, indices = self.index.search(vectors, k)
+            k = min(top_k, snapshot.vector_count)
+            distances, labels = snapshot.search(vectors, k, nprobe=nprobe, ef_search=ef_search)
+
+        table = snapshot.table
+        hits_per_query: List[List[tuple[int, float]]] = []
+        for row_labels, row_distances in zip(labels, distances):
+            doc_ids = table.document_ids_for(row_labels)
+            keep = (row_labels >= 0) & (doc_ids >= 0)
+            if document_id is not None:
+                keep &= doc_ids == document_id
+            hits_per_query.append(
+                [
+                    (int(label), float(distance))
+                    for label, distance in zip(row_labels[keep], row_distances[keep])
+                ]
+            )
+        return hits_per_query
 
-        ordered_indices = [int(idx) for idx in indices[0] if idx >= 0]
-        chunk_ids = []
-        for idx in ordered_indices:
-            if idx < len(self.mapping):
-                chunk_ids.append(self.mapping[idx]["chunk_id"])
+    def sync_lexical(self, db: Session) -> int:
+        """Build the lexical index from chunk text when it lags the vector index.
 
-        if not chunk_ids:
+        Covers indexes persisted before the lexical index existed; no embedding needed.
+        """
+        with self._writing():
+            snapshot = self._snapshot
+            if snapshot is None or len(snapshot.lexical) == snapshot.table.live_count:
+                return 0
+            chunks = (
+                db.query(Chunk)
+                .options(load_only(Chunk.id, Chunk.text))
+                .order_by(Chunk.id)
+                .all()
+            )
+            live = snapshot.table.live_mask(np.array([chunk.id for chunk in chunks], dtype=np.int64))
+            lexical = LexicalIndex.build(chunk for chunk, indexed in zip(chunks, live) if indexed)
+            self._publish(
+                replace(snapshot, version=snapshot.version + 1, lexical=lexical),
+                base_changed=False,
+            )
+        logger.info("Built lexical index from chunk text (chunks=%s).", len(lexical))
+        return len(lexical)
+
+    def lexical_search(
+        self,
+        query: str,
+        top_k: int,
+        db: Session,
+        document_id: int | None = None,
+    ) -> List[Dict[str, Any]]:
+        """BM25 keyword search; cost follows the query terms' postings, not the corpus."""
+        # Over-fetch so per-document diversification still has top_k to pick from.
+        hits = self._lexical_hits(self._snapshot, query, top_k * 4, document_id)
+        chunks_by_id = self.get_chunks((chunk_id for chunk_id, _ in hits), db)
+        return self._build_results(hits, chunks_by_id, top_k, document_id)
+
+    def _lexical_hits(
+        self,
+        snapshot: IndexSnapshot | None,
+        query: str,
+        top_k: int,
+        document_id: int | None,
+    ) -> List[tuple[int, float]]:
+        if snapshot is None:
             return []
+        chunk_ids = None
+        if document_id is not None:
+            chunk_ids = snapshot.table.document_chunk_ids(document_id)
+            if len(chunk_ids) == 0:
+                return []
+        return snapshot.lexical.search(query, top_k, chunk_ids=chunk_ids)
+
+    def hybrid_search(
+        self,
+        query: str,
+        top_k: int,
+        db: Session,
+        document_id: int | None = None,
+        candidates: int = 20,
+        query_vectors: np.ndarray | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Fuse vector and BM25 candidates with reciprocal-rank fusion.
+
+        Both retrievers run concurrently and contribute ``1 / (rrf_k + rank)`` per
+        hit. Results are ordered by that sum, ``rrf_score``; ``score`` stays the
+        vector distance, as in ``search`` (None for BM25-only hits). The
+        ``retrievers`` map has the rank and raw score from every retriever that
+        found it.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        depth = max(candidates, top_k)
+        lexical_future = self._retrieval_pool.submit(
+            self._lexical_hits, snapshot, query, depth, document_id
+        )
+        vector_hits = self._vector_hits(
+            snapshot, [query], depth, document_id, query_vectors=query_vectors
+        )[0][:depth]
+        lexical_hits = lexical_future.result()
+
+        fused: Dict[int, float] = {}
+        provenance: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        for name, hits in (("vector", vector_hits), ("lexical", lexical_hits)):
+            for rank, (chunk_id, score) in enumerate(hits, start=1):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + rank)
+                provenance.setdefault(chunk_id, {})[name] = {"rank": rank, "score": score}
+
+        ranked = sorted(fused.items(), key=lambda item: (-item[1], item[0]))
+        chunks_by_id = self.get_chunks((chunk_id for chunk_id, _ in ranked), db)
+        results = self._build_results(ranked, chunks_by_id, top_k, document_id)
+        for item in results:
+            item["rrf_score"] = item["score"]
+            item["retrievers"] = provenance[item["chunk_id"]]
+            vector = item["retrievers"].get("vector")
+            item["score"] = vector["score"] if vector else None
+        return results
+
+    def get_chunks(self, chunk_ids: Iterable[int], db: Session) -> Dict[int, StoredChunk]:
+        return self.chunk_store.get_many(chunk_ids, db)
 
-        chunks = db.query(Chunk).filter(Chunk.id.in_(chunk_ids)).all()
-        chunks_by_id = {chunk.id: chunk for chunk in chunks}
+    def _embed_texts(self, texts: List[str], embedder: Embedder | None = None) -> np.ndarray:
+        # Chunk vectors come from the on-disk store when one is configured, so
+        # rebuilds only pay for text the embedder has never seen. The store holds
+        # one embedder's vectors; any other (a refitted IDF) embeds directly.
+        embedder = embedder or self.embedder
+        store = self.embedding_store
+        if store is None or store.fingerprint != embedder_fingerprint(embedder):
+            return embedder.embed_texts(texts)
+        return store.embed(embedder, texts)
 
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        if self.query_cache is None:
+            return self.embedder.embed_texts(queries)
+        return self.query_cache.embed(self.embedder, queries)
+
+    async def aembed_queries(self, embedder: AsyncRealEmbedder, queries: List[str]) -> np.ndarray:
+        """Query vectors from an async twin of ``self.embedder``, for the ``query_vectors`` argument."""
+        if embedder_fingerprint(embedder) != embedder_fingerprint(self.embedder):
+            raise ValueError("Async embedder does not match the index embedder.")
+        if self.query_cache is None:
+            return await embedder.embed_texts(queries)
+        return await self.query_cache.aembed(embedder, queries)
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {
+                "ready": False,
+                "configured_index_type": self.spec.index_type,
+                "chunk_store_size": len(self.chunk_store),
+                "query_cache": self.query_cache.stats() if self.query_cache is not None else None,
+                "build": self._build_status(),
+            }
+        return {
+            "ready": True,
+            "version": snapshot.version,
+            "snapshot": snapshot.source.name if snapshot.source is not None else None,
+            "index_type": snapshot.active_spec.index_type,
+            "configured_index_type": self.spec.index_type,
+            "chunk_total": snapshot.table.live_count,
+            "deleted": snapshot.table.deleted_count,
+            "vectors": snapshot.vector_count,
+            "delta_vectors": snapshot.delta_count,
+            "mmap": snapshot.mmapped,
+            "chunk_store_size": len(self.chunk_store),
+            "lexical_terms": snapshot.lexical.term_count,
+            "query_cache": self.query_cache.stats() if self.query_cache is not None else None,
+            "embedding_store": (
+                self.embedding_store.stats() if self.embedding_store is not None else None
+            ),
+            "build": self._build_status(),
+        }
+
+    def _build_status(self) -> Dict[str, Any]:
+        saved = self.snapshots.checkpoint()
+        checkpoint = None
+        if saved is not None:
+            _, state = saved
+            checkpoint = {key: state.get(key) for key in ("done", "last_chunk_id", "created_at")}
+        return {**self.build_progress.as_dict(), "checkpoint": checkpoint}
+
+    def _build_results(
+        self,
+        hits: List[tuple[int, float]],
+        chunks_by_id: Dict[int, StoredChunk],
+        top_k: int,
+        document_id: int | None,
+    ) -> List[Dict[str, Any]]:
         results: List[Dict[str, Any]] = []
-        for rank, idx in enumerate(ordered_indices):
-            if idx >= len(self.mapping):
-                continue
-            mapping = self.mapping[idx]
-            chunk = chunks_by_id.get(mapping["chunk_id"])
+        for chunk_id, distance in hits:
+            chunk = chunks_by_id.get(chunk_id)
             if not chunk:
                 continue
             preview = (chunk.text or "")[:PREVIEW_LENGTH]
@@ -173,7 +991,7 @@ class IndexManager:
                 {
                     "chunk_id": chunk.id,
                     "document_id": chunk.document_id,
-                    "score": float(distances[0][rank]),
+                    "score": distance,
                     "text_preview": preview,
                     "metadata": chunk.metadata_json,
                 }
@@ -218,3 +1036,32 @@ class IndexManager:
                 break
 
         return diversified
+
+
+def _index_ids(index) -> np.ndarray:
+    if index is None:
+        return np.zeros(0, dtype=np.int64)
+    return faiss.vector_to_array(index.id_map).astype(np.int64)
+
+
+def _page_columns(page: List[Chunk]) -> Dict[str, np.ndarray]:
+    return {
+        "ids": np.fromiter((chunk.id for chunk in page), dtype=np.int64, count=len(page)),
+        "documents": np.fromiter((chunk.document_id for chunk in page), dtype=np.int64, count=len(page)),
+        "positions": np.fromiter((chunk.chunk_index for chunk in page), dtype=np.int64, count=len(page)),
+        "hashes": np.fromiter((content_hash(chunk.text) for chunk in page), dtype=np.uint32, count=len(page)),
+    }
+
+
+def _concat(parts: List[np.ndarray]) -> np.ndarray:
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+def _table_for(chunks: List[Chunk]) -> ChunkTable:
+    return ChunkTable.from_columns(
+        (chunk.id for chunk in chunks),
+        (chunk.document_id for chunk in chunks),
+        (chunk.chunk_index for chunk in chunks),
+        (content_hash(chunk.text) for chunk in chunks),
+    )
+
@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from sqlalchemy.orm import Session
+
+from app.services.index_manager import IndexManager
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class IndexScheduler:
+    """One worker thread that applies index changes in coalesced batches.
+
+    Uploads, deletes and rebuild requests only record pending work and bump a
+    generation counter. The worker lets a burst settle for ``debounce_seconds``,
+    drains everything pending at once and applies it as a single rebuild or a
+    single incremental add/remove. Events that arrive while an apply is running
+    stay pending for the next pass, so nothing is dropped. A failed apply puts
+    its batch back and is retried with exponential backoff; ``last_error`` stays
+    set and the applied generation holds until a retry succeeds.
+    """
+
+    def __init__(
+        self,
+        manager: IndexManager,
+        session_factory: Callable[[], Session],
+        debounce_seconds: float = 0.0,
+        compact_threshold: float = 0.2,
+        retry_base_seconds: float = 1.0,
+        retry_max_seconds: float = 60.0,
+    ):
+        self.manager = manager
+        self.session_factory = session_factory
+        self.debounce_seconds = debounce_seconds
+        self.compact_threshold = compact_threshold
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.last_result: Dict[str, Any] | None = None
+        self.last_error: str | None = None
+        self._cond = threading.Condition()
+        self._adds: set[int] = set()
+        self._deletes: set[int] = set()
+        self._rebuild_reasons: list[str] = []
+        self._generation = 0
+        self._last_applied_generation = 0
+        self._last_event_at = 0.0
+        self._failures = 0
+        self._failed_generation = 0
+        self._retry_at = 0.0
+        self._applying = False
+        self._stopped = False
+        self._rebuilds = 0
+        self._incremental_applies = 0
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="index-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def enqueue_add(self, document_id: int) -> int:
+        def mark() -> None:
+            self._deletes.discard(document_id)
+            self._adds.add(document_id)
+
+        return self._enqueue(mark)
+
+    def enqueue_delete(self, document_id: int) -> int:
+        def mark() -> None:
+            self._adds.discard(document_id)
+            self._deletes.add(document_id)
+
+        return self._enqueue(mark)
+
+    def request_rebuild(self, reason: str) -> int:
+        return self._enqueue(lambda: self._rebuild_reasons.append(reason))
+
+    def wait_for(self, generation: int, timeout: float | None = None, fail_fast: bool = False) -> bool:
+        """Block until every event up to ``generation`` has been applied.
+
+        With ``fail_fast`` the wait also ends (returning False) once an attempt
+        covering ``generation`` has failed, instead of sitting through the retries.
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._last_applied_generation >= generation
+                or self._stopped
+                or (fail_fast and self._failed_generation >= generation),
+                timeout,
+            )
+            return self._last_applied_generation >= generation
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "generation": self._generation,
+                "last_applied_generation": self._last_applied_generation,
+                "queue_depth": self._queue_depth(),
+                "applying": self._applying,
+                "rebuilds": self._rebuilds,
+                "incremental_applies": self._incremental_applies,
+                "last_error": self.last_error,
+                "failures": self._failures,
+            }
+
+    def _queue_depth(self) -> int:
+        return len(self._adds) + len(self._deletes) + (1 if self._rebuild_reasons else 0)
+
+    def _enqueue(self, mark: Callable[[], None]) -> int:
+        with self._cond:
+            mark()
+            self._generation += 1
+            self._last_event_at = time.monotonic()
+            self._cond.notify_all()
+            return self._generation
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._queue_depth() > 0)
+                if self._stopped:
+                    return
+                while not self._stopped:
+                    # Explicit rebuilds cover everything pending, so they skip the
+                    # debounce; nothing skips the backoff after a failure.
+                    ready_at = self._retry_at
+                    if not self._rebuild_reasons:
+                        ready_at = max(ready_at, self._last_event_at + self.debounce_seconds)
+                    remaining = ready_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopped:
+                    return
+                adds, self._adds = self._adds, set()
+                deletes, self._deletes = self._deletes, set()
+                reasons, self._rebuild_reasons = self._rebuild_reasons, []
+                target = self._generation
+                self._applying = True
+            try:
+                self._apply(adds, deletes, reasons)
+            except Exception as exc:
+                with self._cond:
+                    self._requeue(adds, deletes, reasons)
+                    self._failures += 1
+                    self._failed_generation = target
+                    delay = min(
+                        self.retry_max_seconds,
+                        self.retry_base_seconds * 2 ** (self._failures - 1),
+                    )
+                    self._retry_at = time.monotonic() + delay
+                    self.last_error = str(exc)
+                    self._applying = False
+                    self._cond.notify_all()
+                logger.exception(
+                    "Index update failed (generation=%s); retrying in %.1fs.", target, delay
+                )
+                continue
+            with self._cond:
+                self.last_error = None
+                self._failures = 0
+                self._retry_at = 0.0
+                self._last_applied_generation = target
+                self._applying = False
+                self._cond.notify_all()
+
+    def _requeue(self, adds: set[int], deletes: set[int], reasons: list[str]) -> None:
+        """Put a failed batch back; events enqueued since the drain are newer and win."""
+        self._adds |= adds - self._deletes
+        self._deletes |= deletes - self._adds
+        self._rebuild_reasons = reasons + self._rebuild_reasons
+
+    def _apply(self, adds: set[int], deletes: set[int], reasons: list[str]) -> None:
+        db = self.session_factory()
+        try:
+            if reasons or not self.manager.is_ready():
+                # A rebuild reads the database as it is now, which already covers
+                # every pending add and delete.
+                self.last_result = self.manager.rebuild(db)
+                self._rebuilds += 1
+                logger.info(
+                    "Index rebuilt (%s; coalesced adds=%s deletes=%s).",
+                    ", ".join(dict.fromkeys(reasons)) or "not ready",
+                    len(adds),
+                    len(deletes),
+                )
+                return
+            if adds:
+                result = self.manager.add_documents(db, adds)
+                logger.info("Indexed %s documents incrementally (added=%s).", len(adds), result["added"])
+            if deletes:
+                result = self.manager.remove_documents(deletes)
+                logger.info("Removed %s documents from index (removed=%s).", len(deletes), result["removed"])
+                if self.manager.deleted_fraction() >= self.compact_threshold:
+                    self.manager.compact()
+            self._incremental_applies += 1
+        finally:
+            db.close()
@@ -0,0 +1,134 @@
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Any, List
+
+import faiss
+import numpy as np
+
+from app.services.chunk_table import ChunkTable
+from app.services.index_factory import IndexSpec, build_search_params
+from app.services.lexical_index import LexicalIndex
+
+# Vectors reconstructed per step of a document-scoped scan.
+DOCUMENT_SCAN_BLOCK = 4096
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """One consistent version of the search state, published as a single reference.
+
+    Vectors live in a ``base`` index plus a small flat ``delta`` that takes
+    incremental adds, so writers never mutate an index a reader is searching.
+    Deleted chunks stay in the segments, hidden by the table's tombstones,
+    until a merge folds the delta into a fresh base. Searches skip them inside
+    the scan, so ``k`` never grows with the number of tombstones.
+    """
+
+    version: int
+    base: Any
+    table: ChunkTable
+    lexical: LexicalIndex
+    active_spec: IndexSpec
+    delta: Any = None
+    delta_ids: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    mmapped: bool = False
+    # Directory the snapshot was published to or loaded from, and the embedder
+    # fingerprint its vectors came from.
+    source: Path | None = None
+    embedder: str = ""
+
+    @property
+    def delta_count(self) -> int:
+        return self.delta.ntotal if self.delta is not None else 0
+
+    @property
+    def vector_count(self) -> int:
+        return self.base.ntotal + self.delta_count
+
+    @property
+    def stale_count(self) -> int:
+        # Tombstoned vectors still stored in the segments until the next merge.
+        return max(self.vector_count - self.table.live_count, 0)
+
+    @cached_property
+    def _tombstone_selector(self):
+        """Selector rejecting tombstoned ids, built once per snapshot; None without tombstones."""
+        deleted = self.table.deleted_chunk_ids()
+        if len(deleted) == 0:
+            return None
+        # IDSelectorNot does not own its argument; keep both alive with the snapshot.
+        inner = faiss.IDSelectorBatch(deleted)
+        return inner, faiss.IDSelectorNot(inner)
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        k: int,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        selector = self._tombstone_selector
+        sel = selector[1] if selector is not None else None
+        parts = []
+        if self.base.ntotal > 0:
+            base_k = min(k, self.base.ntotal)
+            params = build_search_params(
+                self.active_spec, base_k, nprobe=nprobe, ef_search=ef_search, sel=sel
+            )
+            parts.append(self.base.search(vectors, base_k, params=params))
+        if self.delta_count > 0:
+            params = faiss.SearchParameters(sel=sel) if sel is not None else None
+            parts.append(self.delta.search(vectors, min(k, self.delta_count), params=params))
+        return _merge_parts(parts, vectors.shape[0], k)
+
+    def search_document(
+        self,
+        vectors: np.ndarray,
+        top_k: int,
+        document_id: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Exact top-k restricted to one document, filtered inside each segment scan."""
+        ids = self.table.document_chunk_ids(document_id)
+        in_delta = np.isin(ids, self.delta_ids)
+        base_ids, delta_ids = ids[~in_delta], ids[in_delta]
+        parts = []
+        if len(base_ids) > 0:
+            parts.append(self._search_base_ids(vectors, min(top_k, len(base_ids)), base_ids))
+        if len(delta_ids) > 0:
+            params = faiss.SearchParameters(sel=_id_selector(delta_ids))
+            parts.append(self.delta.search(vectors, min(top_k, len(delta_ids)), params=params))
+        return _merge_parts(parts, vectors.shape[0], min(top_k, len(ids)))
+
+    def _search_base_ids(self, vectors: np.ndarray, k: int, ids: np.ndarray):
+        # Scan the document's own vectors, looked up by id, so the cost follows the
+        # document's size. A filtered index search would walk the whole flat index
+        # or every IVF list, and a filtered HNSW walk can dead-end early. Blocks
+        # keep memory at one block of vectors plus nq x k results.
+        queries = np.ascontiguousarray(vectors, dtype=np.float32)
+        parts = []
+        for start in range(0, len(ids), DOCUMENT_SCAN_BLOCK):
+            block = ids[start : start + DOCUMENT_SCAN_BLOCK]
+            dist, rows = faiss.knn(queries, self.base.reconstruct_batch(block), min(k, len(block)))
+            parts.append((dist, block[rows]))
+        return _merge_parts(parts, queries.shape[0], k)
+
+
+def _merge_parts(parts: List[tuple[np.ndarray, np.ndarray]], rows: int, k: int):
+    if not parts:
+        return np.zeros((rows, 0), dtype=np.float32), np.zeros((rows, 0), dtype=np.int64)
+    if len(parts) == 1:
+        return parts[0]
+    distances = np.concatenate([part[0] for part in parts], axis=1)
+    labels = np.concatenate([part[1] for part in parts], axis=1)
+    # FAISS pads short result rows with -1 labels at +inf-like distances, so they sort last.
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(labels, order, axis=1)
+
+
+def _id_selector(ids: np.ndarray):
+    # Chunks of one upload are inserted together, so their ids are normally one range.
+    first, last = int(ids[0]), int(ids[-1])
+    if last - first + 1 == len(ids):
+        return faiss.IDSelectorRange(first, last + 1)
+    return faiss.IDSelectorBatch(ids)
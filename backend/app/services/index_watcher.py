@@ -0,0 +1,62 @@
+import logging
+import threading
+from typing import Any, Dict
+
+from app.services.index_manager import IndexManager
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class IndexWatcher:
+    """Polls the snapshot pointer so every worker serves the newest published index.
+
+    With several uvicorn workers only the one that handled an upload applies
+    it. The others notice the new ``CURRENT`` version here and load it (memory
+    mapped when ``FAISS_MMAP`` is on, so the pages are shared) instead of
+    rebuilding their own copy.
+    """
+
+    def __init__(self, manager: IndexManager, interval_seconds: float = 1.0):
+        self.manager = manager
+        self.interval_seconds = interval_seconds
+        self.reloads = 0
+        self.last_error: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def poll(self) -> bool:
+        try:
+            reloaded = self.manager.reload_if_changed()
+            self.last_error = None
+        except Exception as exc:
+            logger.exception("Index snapshot reload failed.")
+            self.last_error = str(exc)
+            return False
+        if reloaded:
+            self.reloads += 1
+        return reloaded
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "running": self._thread is not None,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.poll()
@@ -0,0 +1,354 @@
+import math
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from app.db.models import Chunk
+from app.services.chunk_store import StoredChunk
+
+STOPWORDS = {
+    "的",
+    "了",
+    "吗",
+    "呢",
+    "和",
+    "或",
+    "以及",
+    "就是",
+    "如何",
+    "怎么",
+    "什么",
+    "哪些",
+    "请",
+    "是否",
+    "能否",
+    "the",
+    "a",
+    "an",
+    "and",
+    "or",
+    "to",
+    "of",
+    "in",
+}
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+|[\u4e00-\u9fff]{1,}")
+CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+
+
+def tokenize_query(text: str) -> list[str]:
+    if not text:
+        return []
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    cleaned = [token for token in tokens if token and token not in STOPWORDS]
+    return cleaned
+
+
+def query_terms(text: str) -> list[str]:
+    """Index terms for a query: words as-is, CJK runs as overlapping bigrams."""
+    terms: list[str] = []
+    for token in tokenize_query(text):
+        if CJK_PATTERN.match(token) and len(token) > 1:
+            terms.extend(token[i : i + 2] for i in range(len(token) - 1))
+        else:
+            terms.append(token)
+    return terms
+
+
+def document_terms(text: str) -> list[str]:
+    """Index terms for chunk text: query terms plus CJK unigrams for one-character queries."""
+    terms: list[str] = []
+    for token in tokenize_query(text):
+        if CJK_PATTERN.match(token) and len(token) > 1:
+            terms.extend(token)
+            terms.extend(token[i : i + 2] for i in range(len(token) - 1))
+        else:
+            terms.append(token)
+    return terms
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk text, keyed by chunk id.
+
+    Postings are (chunk id delta, term frequency) pairs stored as varints, so a
+    query only touches the postings of its own terms. Instances are treated as
+    immutable: ``with_added``, ``with_removed`` and ``compacted`` return a new
+    index that shares every untouched postings list with the old one. The
+    exception is a build in progress: ``extend`` appends in place and
+    ``freeze`` seals the result before anyone searches it.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, bytes | bytearray] = {}
+        self._last_id: Dict[str, int] = {}
+        self._doc_ids = np.zeros(0, dtype=np.int64)
+        self._doc_lengths = np.zeros(0, dtype=np.int32)
+        self._live = np.zeros(0, dtype=bool)
+        # Document rows appended by ``extend`` and not yet folded into the arrays.
+        self._pending: List[tuple[np.ndarray, np.ndarray]] = []
+
+    @classmethod
+    def build(cls, chunks: Iterable[Chunk | StoredChunk]) -> "LexicalIndex":
+        index = cls()
+        index.extend(chunks)
+        return index.freeze()
+
+    def extend(self, chunks: Iterable[Chunk | StoredChunk]) -> None:
+        """Add chunks in place; only for an index that is still being built.
+
+        Appending batch after batch in id order costs the batch, not the index.
+        """
+        self._add(chunks, in_place=True)
+
+    def freeze(self) -> "LexicalIndex":
+        """Finish an in-place build so the index can be shared with readers."""
+        self._fold_pending()
+        for term, postings in self._postings.items():
+            if isinstance(postings, bytearray):
+                self._postings[term] = bytes(postings)
+        return self
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._live))
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    def with_added(self, chunks: Iterable[Chunk | StoredChunk]) -> "LexicalIndex":
+        index = self._copy()
+        index._add(chunks)
+        return index
+
+    def with_removed(self, chunk_ids: Iterable[int]) -> "LexicalIndex":
+        pos = self._positions(np.asarray(list(chunk_ids), dtype=np.int64))
+        pos = pos[pos >= 0]
+        if len(pos) == 0:
+            return self
+        index = self._copy()
+        index._live = self._live.copy()
+        index._live[pos] = False
+        return index
+
+    def deleted_count(self) -> int:
+        return len(self._live) - len(self)
+
+    def compacted(self) -> "LexicalIndex":
+        if self.deleted_count() == 0:
+            return self
+        index = self._copy()
+        deleted = self._doc_ids[~self._live]
+        for term in self._postings:
+            ids, tfs = self._decode(term)
+            keep = ~np.isin(ids, deleted)
+            if not keep.any():
+                del index._postings[term], index._last_id[term]
+            elif not keep.all():
+                index._set_postings(term, ids[keep], tfs[keep])
+        index._doc_ids = self._doc_ids[self._live]
+        index._doc_lengths = self._doc_lengths[self._live]
+        index._live = self._live[self._live]
+        return index
+
+    def search(
+        self,
+        query: str,
+        top_k: int,
+        chunk_ids: np.ndarray | None = None,
+    ) -> List[tuple[int, float]]:
+        """Top-k (chunk id, BM25 score), optionally restricted to ``chunk_ids``."""
+        terms = [term for term in dict.fromkeys(query_terms(query)) if term in self._postings]
+        total = len(self)
+        if not terms or total == 0 or top_k <= 0:
+            return []
+        avg_length = float(self._doc_lengths[self._live].sum()) / total or 1.0
+
+        matched_ids: List[np.ndarray] = []
+        matched_scores: List[np.ndarray] = []
+        for term in terms:
+            ids, tfs = self._decode(term)
+            pos = self._positions(ids)
+            keep = pos >= 0
+            # Postings keep tombstoned rows until compaction; df counts live ones,
+            # like ``total``, so the IDF never goes negative.
+            df = int(np.count_nonzero(keep))
+            if chunk_ids is not None:
+                keep &= np.isin(ids, chunk_ids)
+            if not keep.any():
+                continue
+            ids, tfs, lengths = ids[keep], tfs[keep], self._doc_lengths[pos[keep]]
+            idf = math.log(1.0 + (total - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+            matched_ids.append(ids)
+            matched_scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        if not matched_ids:
+            return []
+
+        unique_ids, inverse = np.unique(np.concatenate(matched_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores))
+        k = min(top_k, len(unique_ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((unique_ids[top], -scores[top]))]
+        return [(int(unique_ids[i]), float(scores[i])) for i in top]
+
+    def save(self, path: Path) -> None:
+        terms = list(self._postings)
+        blobs = [bytes(self._postings[term]) for term in terms]
+        offsets = np.cumsum([0] + [len(blob) for blob in blobs], dtype=np.int64)
+        tmp = path.with_name(f"{path.name}.tmp")
+        with tmp.open("wb") as handle:
+            np.savez(
+                handle,
+                params=np.array([self.k1, self.b], dtype=np.float64),
+                terms=np.array(terms, dtype=np.str_),
+                postings=np.frombuffer(b"".join(blobs), dtype=np.uint8),
+                offsets=offsets,
+                last_id=np.array([self._last_id[term] for term in terms], dtype=np.int64),
+                doc_ids=self._doc_ids,
+                doc_lengths=self._doc_lengths,
+                live=self._live,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        with np.load(str(path), allow_pickle=False) as data:
+            k1, b = (float(value) for value in data["params"])
+            index = cls(k1=k1, b=b)
+            postings = data["postings"].tobytes()
+            offsets = data["offsets"]
+            for position, term in enumerate(data["terms"].tolist()):
+                start, end = int(offsets[position]), int(offsets[position + 1])
+                index._postings[term] = postings[start:end]
+                index._last_id[term] = int(data["last_id"][position])
+            index._doc_ids = data["doc_ids"]
+            index._doc_lengths = data["doc_lengths"]
+            index._live = np.array(data["live"])
+        return index
+
+    def _positions(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """Row in the document arrays for each live chunk id, else -1."""
+        if len(self._doc_ids) == 0:
+            return np.full(chunk_ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._doc_ids, chunk_ids), len(self._doc_ids) - 1)
+        found = (self._doc_ids[pos] == chunk_ids) & self._live[pos]
+        return np.where(found, pos, -1)
+
+    def _copy(self) -> "LexicalIndex":
+        # Postings are immutable bytes and arrays are replaced, never written, so
+        # copying the dicts is enough to keep the original untouched.
+        index = LexicalIndex(k1=self.k1, b=self.b)
+        index._postings = dict(self._postings)
+        index._last_id = dict(self._last_id)
+        index._doc_ids = self._doc_ids
+        index._doc_lengths = self._doc_lengths
+        index._live = self._live
+        return index
+
+    def _add(self, chunks: Iterable[Chunk | StoredChunk], in_place: bool = False) -> None:
+        items = sorted(chunks, key=lambda chunk: chunk.id)
+        if not items:
+            return
+        ids = np.array([chunk.id for chunk in items], dtype=np.int64)
+        lengths = np.zeros(len(items), dtype=np.int32)
+        added: Dict[str, List[tuple[int, int]]] = {}
+        for position, chunk in enumerate(items):
+            counts: Dict[str, int] = {}
+            for term in document_terms(chunk.text):
+                counts[term] = counts.get(term, 0) + 1
+            lengths[position] = sum(counts.values())
+            for term, tf in counts.items():
+                added.setdefault(term, []).append((chunk.id, tf))
+        for term, postings in added.items():
+            self._append_postings(term, postings, in_place)
+
+        if in_place and ids[0] > self._last_doc_id():
+            self._pending.append((ids, lengths))
+            return
+        self._fold_pending()
+        keep = ~np.isin(self._doc_ids, ids)
+        doc_ids = np.concatenate([self._doc_ids[keep], ids])
+        order = np.argsort(doc_ids, kind="stable")
+        self._doc_ids = doc_ids[order]
+        self._doc_lengths = np.concatenate([self._doc_lengths[keep], lengths])[order]
+        self._live = np.concatenate([self._live[keep], np.ones(len(ids), dtype=bool)])[order]
+
+    def _last_doc_id(self) -> int:
+        if self._pending:
+            return int(self._pending[-1][0][-1])
+        return int(self._doc_ids[-1]) if len(self._doc_ids) else 0
+
+    def _fold_pending(self) -> None:
+        if not self._pending:
+            return
+        self._doc_ids = np.concatenate([self._doc_ids] + [ids for ids, _ in self._pending])
+        self._doc_lengths = np.concatenate([self._doc_lengths] + [lengths for _, lengths in self._pending])
+        added = sum(len(ids) for ids, _ in self._pending)
+        self._live = np.concatenate([self._live, np.ones(added, dtype=bool)])
+        self._pending = []
+
+    def _append_postings(self, term: str, postings: List[tuple[int, int]], in_place: bool = False) -> None:
+        last = self._last_id.get(term, 0)
+        if term in self._postings and postings[0][0] <= last:
+            # Re-indexed ids are rare; rewrite this term's list to keep deltas positive.
+            ids, tfs = self._decode(term)
+            new_ids = np.array([chunk_id for chunk_id, _ in postings], dtype=np.int64)
+            keep = ~np.isin(ids, new_ids)
+            ids = np.concatenate([ids[keep], new_ids])
+            tfs = np.concatenate([tfs[keep], [tf for _, tf in postings]]).astype(np.int64)
+            order = np.argsort(ids, kind="stable")
+            self._set_postings(term, ids[order], tfs[order])
+            return
+        buffer = bytearray()
+        for chunk_id, tf in postings:
+            _write_varint(buffer, chunk_id - last)
+            _write_varint(buffer, tf)
+            last = chunk_id
+        existing = self._postings.get(term, b"")
+        if in_place:
+            # A bytearray grows in amortized constant time; freeze() turns it back into bytes.
+            if not isinstance(existing, bytearray):
+                existing = self._postings[term] = bytearray(existing)
+            existing += buffer
+        else:
+            self._postings[term] = existing + bytes(buffer)
+        self._last_id[term] = last
+
+    def _set_postings(self, term: str, ids: np.ndarray, tfs: np.ndarray) -> None:
+        buffer = bytearray()
+        previous = 0
+        for chunk_id, tf in zip(ids.tolist(), tfs.tolist()):
+            _write_varint(buffer, chunk_id - previous)
+            _write_varint(buffer, tf)
+            previous = chunk_id
+        self._postings[term] = bytes(buffer)
+        self._last_id[term] = int(ids[-1])
+
+    def _decode(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        values = _decode_varints(self._postings[term])
+        return np.cumsum(values[0::2]), values[1::2]
+
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _decode_varints(buffer: bytes) -> np.ndarray:
+    """Decode a run of LEB128 varints without a per-byte Python loop."""
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = (data & 0x80) == 0
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    group = np.cumsum(np.concatenate(([0], ends[:-1].astype(np.int64))))
+    shift = 7 * (np.arange(len(data)) - starts[group])
+    parts = (data & 0x7F).astype(np.int64) << shift
+    return np.add.reduceat(parts, starts)
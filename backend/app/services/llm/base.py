@@ -1,10 +1,14 @@
-from typing import Any, Protocol, Tuple
+from typing import Any, AsyncIterator, Iterator, Protocol, Tuple
 
 
 class LLMClient(Protocol):
     def generate_answer(self, query: str, context: str) -> str:
         ...
 
+    def stream_answer(self, query: str, context: str) -> Iterator[str]:
+        """Yield the same answer as ``generate_answer`` in pieces as they arrive."""
+        ...
+
     def generate_answer_with_tools(
         self,
         query: str,
@@ -14,3 +18,46 @@ class LLMClient(Protocol):
         forced_tool: str | None = None,
     ) -> Tuple[str, list[dict]]:
         ...
+
+    def stream_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+        tool_traces: list[dict] | None = None,
+    ) -> Iterator[str]:
+        """Yield ``generate_answer_with_tools``'s answer in pieces; tool calls go to ``tool_traces``."""
+        ...
+
+
+class AsyncLLMClient(Protocol):
+    """``LLMClient`` for event-loop callers; awaiting a call holds no worker thread."""
+
+    async def generate_answer(self, query: str, context: str) -> str:
+        ...
+
+    def stream_answer(self, query: str, context: str) -> AsyncIterator[str]:
+        ...
+
+    async def generate_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+    ) -> Tuple[str, list[dict]]:
+        ...
+
+    def stream_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+        tool_traces: list[dict] | None = None,
+    ) -> AsyncIterator[str]:
+        ...
@@ -1,9 +1,9 @@
 ﻿import re
-from typing import Any, List, Tuple
+from typing import Any, AsyncIterator, Iterator, List, Tuple
 
 from app.services.tools import ToolRunError, ToolSpec
 
-from .base import LLMClient
+from .base import AsyncLLMClient, LLMClient
 
 
 class MockLLM(LLMClient):
@@ -47,6 +47,23 @@ class MockLLM(LLMClient):
 
         return "根据资料：" + "；".join(points)
 
+    def stream_answer(self, query: str, context: str) -> Iterator[str]:
+        yield from _pieces(self.generate_answer(query, context))
+
+    def stream_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+        tool_traces: list[dict] | None = None,
+    ) -> Iterator[str]:
+        answer, traces = self.generate_answer_with_tools(query, context, tools, max_calls, forced_tool)
+        if tool_traces is not None:
+            tool_traces.extend(traces)
+        yield from _pieces(answer)
+
     def generate_answer_with_tools(
         self,
         query: str,
@@ -79,6 +96,51 @@ class MockLLM(LLMClient):
             return f"计算失败：{exc}", [trace]
 
 
+class AsyncMockLLM(AsyncLLMClient):
+    """``MockLLM`` behind the async interface; answers are cheap enough to compute inline."""
+
+    def __init__(self, max_points: int = 4):
+        self.sync = MockLLM(max_points=max_points)
+
+    async def generate_answer(self, query: str, context: str) -> str:
+        return self.sync.generate_answer(query, context)
+
+    async def stream_answer(self, query: str, context: str) -> AsyncIterator[str]:
+        for piece in self.sync.stream_answer(query, context):
+            yield piece
+
+    async def generate_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+    ) -> Tuple[str, list[dict]]:
+        return self.sync.generate_answer_with_tools(query, context, tools, max_calls, forced_tool)
+
+    async def stream_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+        tool_traces: list[dict] | None = None,
+    ) -> AsyncIterator[str]:
+        for piece in self.sync.stream_answer_with_tools(
+            query, context, tools, max_calls, forced_tool, tool_traces
+        ):
+            yield piece
+
+
+def _pieces(answer: str) -> Iterator[str]:
+    # Split at the answer's own separators so clients see several pieces.
+    for piece in re.split(r"(?<=[：；])", answer):
+        if piece:
+            yield piece
+
+
 def _extract_calc_expression(query: str) -> str | None:
     if not query:
         return None
@@ -1,17 +1,24 @@
 import json
 import re
 import time
-from typing import Any, Tuple
+from typing import Any, AsyncIterator, Iterator, Tuple
 
 import httpx
 
+from app.services import http_pool
 from app.services.provider_utils import normalize_base_url
 from app.services.tools import ToolRunError, ToolSpec
 
-from .base import LLMClient
+from .base import AsyncLLMClient, LLMClient
 
 
-class RealLLMClient(LLMClient):
+class ChatCompletionsClient:
+    """Request building and response parsing for an OpenAI-compatible ``/chat/completions``.
+
+    ``RealLLMClient`` and ``AsyncRealLLMClient`` add only the transport, so the
+    prompts and parsing stay identical across both.
+    """
+
     def __init__(
         self,
         base_url: str,
@@ -20,6 +27,7 @@ class RealLLMClient(LLMClient):
         json_model: str | None = None,
         timeout: float = 30.0,
         max_tokens: int = 512,
+        client: Any = None,
     ):
         self.base_url = normalize_base_url(base_url)
         self.api_key = api_key
@@ -27,8 +35,25 @@ class RealLLMClient(LLMClient):
         self.json_model = json_model or ""
         self.timeout = timeout
         self.max_tokens = max_tokens
+        # None: use the shared keep-alive pool.
+        self.client = client
 
-    def generate_answer(self, query: str, context: str) -> str:
+    def with_model(self, model: str, json_model: str | None = None):
+        """A copy of this client for another model, sharing its HTTP client."""
+        return type(self)(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            model=model,
+            json_model=json_model,
+            timeout=self.timeout,
+            max_tokens=self.max_tokens,
+            client=self.client,
+        )
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _answer_payload(self, query: str, context: str) -> dict | None:
         raw_json = False
         if query.startswith("RAW_JSON:"):
             raw_json = True
@@ -36,7 +61,7 @@ class RealLLMClient(LLMClient):
 
         cleaned = (context or "").strip()
         if not cleaned and not raw_json:
-            return "资料中未找到相关内容"
+            return None
 
         if raw_json:
             system_prompt = "你是严格的JSON生成器。只输出JSON，不要任何多余文本。不要输出推理过程。"
@@ -62,63 +87,21 @@ class RealLLMClient(LLMClient):
         }
         if raw_json:
             payload["response_format"] = {"type": "json_object"}
+        return payload
 
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        with httpx.Client(timeout=self.timeout) as client:
-            response = client.post(
-                f"{self.base_url}/chat/completions",
-                json=payload,
-                headers=headers,
-            )
-        response.raise_for_status()
-        data = response.json()
-        choices = data.get("choices") or []
-        if not choices:
-            raise RuntimeError("LLM response missing choices.")
-        message = choices[0].get("message") or {}
-        content = (message.get("content") or "").strip()
-        if not content:
-            reasoning = (message.get("reasoning_content") or "").strip()
-            if reasoning:
-                if raw_json:
-                    matches = re.findall(r"\{.*?\}", reasoning, re.DOTALL)
-                    if matches:
-                        candidates = [m for m in matches if "\"stem\"" in m and "\"answer\"" in m]
-                        content = (candidates[-1] if candidates else matches[-1]).strip()
-                    else:
-                        start = reasoning.rfind("{")
-                        if start != -1:
-                            candidate = reasoning[start:].strip()
-                            balance = candidate.count("{") - candidate.count("}")
-                            if balance > 0:
-                                candidate += "}" * balance
-                            content = candidate
-                if not content:
-                    content = reasoning
-        if not content:
-            raise RuntimeError("LLM response missing content.")
-        return content
-
-    def generate_answer_with_tools(
+    def _tool_conversation(
         self,
         query: str,
         context: str,
         tools: list[Any],
-        max_calls: int,
-        forced_tool: str | None = None,
-    ) -> Tuple[str, list[dict]]:
+        forced_tool: str | None,
+    ) -> tuple[list[dict], dict[str, ToolSpec], list[dict], Any]:
+        """Opening messages, allowed tools, their schemas and the first tool_choice."""
         tool_specs = [tool for tool in tools if isinstance(tool, ToolSpec)]
-        if not tool_specs or max_calls <= 0:
-            return self.generate_answer(query, context), []
-
         tool_map = {tool.name: tool for tool in tool_specs}
         tool_schemas = [tool.openai_schema() for tool in tool_specs]
-        tool_traces: list[dict] = []
 
         cleaned = (context or "").strip()
-        if not cleaned and not forced_tool:
-            return "资料中未找到相关内容", []
-
         system_prompt = "你是学习助手。必要时可调用工具，但必须保证引用可追溯。"
         user_prompt = f"问题：{query}\n\n资料：\n{cleaned}\n\n请用简洁中文回答。"
         messages: list[dict] = [
@@ -126,78 +109,392 @@ class RealLLMClient(LLMClient):
             {"role": "user", "content": user_prompt},
         ]
 
-        headers = {"Authorization": f"Bearer {self.api_key}"}
         tool_choice: Any = "auto"
         if forced_tool and forced_tool in tool_map:
             tool_choice = {"type": "function", "function": {"name": forced_tool}}
+        return messages, tool_map, tool_schemas, tool_choice
 
-        with httpx.Client(timeout=self.timeout) as client:
-            for _ in range(max_calls):
-                payload = {
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": 0.2,
-                    "max_tokens": self.max_tokens,
-                    "tools": tool_schemas,
-                    "tool_choice": tool_choice,
-                }
-                response = client.post(
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=headers,
-                )
-                response.raise_for_status()
-                data = response.json()
-                choices = data.get("choices") or []
-                if not choices:
-                    raise RuntimeError("LLM response missing choices.")
-                message = choices[0].get("message") or {}
-                tool_calls = message.get("tool_calls") or []
-                content = (message.get("content") or "").strip()
-
-                if tool_calls:
-                    messages.append({"role": "assistant", "tool_calls": tool_calls})
-                    for call in tool_calls:
-                        func = call.get("function") or {}
-                        tool_name = func.get("name")
-                        call_id = call.get("id") or ""
-                        raw_args = func.get("arguments") or "{}"
-                        start = time.perf_counter()
-                        trace = {
-                            "tool_name": tool_name,
-                            "input": raw_args,
-                            "output": None,
-                            "error": None,
-                            "duration_ms": None,
-                        }
-                        try:
-                            args = json.loads(raw_args) if isinstance(raw_args, str) else raw_args
-                            trace["input"] = args
-                            tool = tool_map.get(tool_name)
-                            if not tool:
-                                raise ToolRunError("Tool not allowed.")
-                            output = tool.run(args)
-                            trace["output"] = output
-                        except (json.JSONDecodeError, ToolRunError, ValueError) as exc:
-                            trace["error"] = str(exc)
-                            output = f"ERROR: {exc}"
-                        except Exception as exc:
-                            trace["error"] = f"Unexpected error: {exc}"
-                            output = f"ERROR: {exc}"
-                        finally:
-                            trace["duration_ms"] = int((time.perf_counter() - start) * 1000)
-                            tool_traces.append(trace)
-                        messages.append(
-                            {
-                                "role": "tool",
-                                "tool_call_id": call_id,
-                                "content": output,
-                            }
-                        )
-                    tool_choice = "auto"
-                    continue
-
-                if content:
-                    return content, tool_traces
+    def _tool_payload(self, messages: list[dict], tool_schemas: list[dict], tool_choice: Any) -> dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.2,
+            "max_tokens": self.max_tokens,
+            "tools": tool_schemas,
+            "tool_choice": tool_choice,
+        }
+
+
+class RealLLMClient(ChatCompletionsClient, LLMClient):
+    def generate_answer(self, query: str, context: str) -> str:
+        payload = self._answer_payload(query, context)
+        if payload is None:
+            return "资料中未找到相关内容"
+
+        response = self._http().post(
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            headers=self._headers(),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return _answer_content(response.json(), raw_json=query.startswith("RAW_JSON:"))
+
+    def stream_answer(self, query: str, context: str) -> Iterator[str]:
+        payload = self._answer_payload(query, context)
+        if payload is None:
+            yield "资料中未找到相关内容"
+            return
+        payload["stream"] = True
+
+        with self._http().stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            headers=self._headers(),
+            timeout=self.timeout,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                done, text = _stream_delta(line)
+                if done:
+                    break
+                if text:
+                    yield text
+
+    def generate_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+    ) -> Tuple[str, list[dict]]:
+        if not any(isinstance(tool, ToolSpec) for tool in tools) or max_calls <= 0:
+            return self.generate_answer(query, context), []
+        if not (context or "").strip() and not forced_tool:
+            return "资料中未找到相关内容", []
+
+        messages, tool_map, tool_schemas, tool_choice = self._tool_conversation(
+            query, context, tools, forced_tool
+        )
+        tool_traces: list[dict] = []
+        client = self._http()
+        for _ in range(max_calls):
+            response = client.post(
+                f"{self.base_url}/chat/completions",
+                json=self._tool_payload(messages, tool_schemas, tool_choice),
+                headers=self._headers(),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            content, called = _tool_step(response.json(), messages, tool_map, tool_traces)
+            if called:
+                tool_choice = "auto"
+                continue
+            if content:
+                return content, tool_traces
 
         return self.generate_answer(query, context), tool_traces
+
+    def stream_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+        tool_traces: list[dict] | None = None,
+    ) -> Iterator[str]:
+        traces = tool_traces if tool_traces is not None else []
+        if not any(isinstance(tool, ToolSpec) for tool in tools) or max_calls <= 0:
+            yield from self.stream_answer(query, context)
+            return
+        if not (context or "").strip() and not forced_tool:
+            yield "资料中未找到相关内容"
+            return
+
+        messages, tool_map, tool_schemas, tool_choice = self._tool_conversation(
+            query, context, tools, forced_tool
+        )
+        client = self._http()
+        for _ in range(max_calls):
+            payload = self._tool_payload(messages, tool_schemas, tool_choice)
+            payload["stream"] = True
+            calls: dict[int, dict] = {}
+            answered = False
+            with client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self._headers(),
+                timeout=self.timeout,
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    done, text = _stream_delta(line, calls)
+                    if done:
+                        break
+                    if text:
+                        answered = True
+                        yield text
+            if calls:
+                _tool_step(_tool_call_response(calls), messages, tool_map, traces)
+                tool_choice = "auto"
+                continue
+            if answered:
+                return
+
+        yield from self.stream_answer(query, context)
+
+    def _http(self) -> httpx.Client:
+        return self.client or http_pool.get_client()
+
+
+class AsyncRealLLMClient(ChatCompletionsClient, AsyncLLMClient):
+    """``RealLLMClient`` on ``httpx.AsyncClient``: a pending call holds no thread."""
+
+    async def generate_answer(self, query: str, context: str) -> str:
+        payload = self._answer_payload(query, context)
+        if payload is None:
+            return "资料中未找到相关内容"
+
+        response = await self._http().post(
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            headers=self._headers(),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return _answer_content(response.json(), raw_json=query.startswith("RAW_JSON:"))
+
+    async def stream_answer(self, query: str, context: str) -> AsyncIterator[str]:
+        payload = self._answer_payload(query, context)
+        if payload is None:
+            yield "资料中未找到相关内容"
+            return
+        payload["stream"] = True
+
+        async with self._http().stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            headers=self._headers(),
+            timeout=self.timeout,
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                done, text = _stream_delta(line)
+                if done:
+                    break
+                if text:
+                    yield text
+
+    async def generate_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+    ) -> Tuple[str, list[dict]]:
+        if not any(isinstance(tool, ToolSpec) for tool in tools) or max_calls <= 0:
+            return await self.generate_answer(query, context), []
+        if not (context or "").strip() and not forced_tool:
+            return "资料中未找到相关内容", []
+
+        messages, tool_map, tool_schemas, tool_choice = self._tool_conversation(
+            query, context, tools, forced_tool
+        )
+        tool_traces: list[dict] = []
+        client = self._http()
+        for _ in range(max_calls):
+            response = await client.post(
+                f"{self.base_url}/chat/completions",
+                json=self._tool_payload(messages, tool_schemas, tool_choice),
+                headers=self._headers(),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            content, called = _tool_step(response.json(), messages, tool_map, tool_traces)
+            if called:
+                tool_choice = "auto"
+                continue
+            if content:
+                return content, tool_traces
+
+        return await self.generate_answer(query, context), tool_traces
+
+    async def stream_answer_with_tools(
+        self,
+        query: str,
+        context: str,
+        tools: list[Any],
+        max_calls: int,
+        forced_tool: str | None = None,
+        tool_traces: list[dict] | None = None,
+    ) -> AsyncIterator[str]:
+        traces = tool_traces if tool_traces is not None else []
+        if not any(isinstance(tool, ToolSpec) for tool in tools) or max_calls <= 0:
+            async for piece in self.stream_answer(query, context):
+                yield piece
+            return
+        if not (context or "").strip() and not forced_tool:
+            yield "资料中未找到相关内容"
+            return
+
+        messages, tool_map, tool_schemas, tool_choice = self._tool_conversation(
+            query, context, tools, forced_tool
+        )
+        client = self._http()
+        for _ in range(max_calls):
+            payload = self._tool_payload(messages, tool_schemas, tool_choice)
+            payload["stream"] = True
+            calls: dict[int, dict] = {}
+            answered = False
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self._headers(),
+                timeout=self.timeout,
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    done, text = _stream_delta(line, calls)
+                    if done:
+                        break
+                    if text:
+                        answered = True
+                        yield text
+            if calls:
+                _tool_step(_tool_call_response(calls), messages, tool_map, traces)
+                tool_choice = "auto"
+                continue
+            if answered:
+                return
+
+        async for piece in self.stream_answer(query, context):
+            yield piece
+
+    def _http(self) -> httpx.AsyncClient:
+        return self.client or http_pool.get_async_client()
+
+
+def _answer_content(data: dict, raw_json: bool) -> str:
+    choices = data.get("choices") or []
+    if not choices:
+        raise RuntimeError("LLM response missing choices.")
+    message = choices[0].get("message") or {}
+    content = (message.get("content") or "").strip()
+    if not content:
+        reasoning = (message.get("reasoning_content") or "").strip()
+        if reasoning:
+            if raw_json:
+                matches = re.findall(r"\{.*?\}", reasoning, re.DOTALL)
+                if matches:
+                    candidates = [m for m in matches if "\"stem\"" in m and "\"answer\"" in m]
+                    content = (candidates[-1] if candidates else matches[-1]).strip()
+                else:
+                    start = reasoning.rfind("{")
+                    if start != -1:
+                        candidate = reasoning[start:].strip()
+                        balance = candidate.count("{") - candidate.count("}")
+                        if balance > 0:
+                            candidate += "}" * balance
+                        content = candidate
+            if not content:
+                content = reasoning
+    if not content:
+        raise RuntimeError("LLM response missing content.")
+    return content
+
+
+def _stream_delta(line: str, calls: dict[int, dict] | None = None) -> tuple[bool, str | None]:
+    """(stream finished, answer text) for one SSE line of a streamed completion.
+
+    Streamed tool-call fragments are folded into ``calls`` by their index.
+    """
+    if not line.startswith("data:"):
+        return False, None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return True, None
+    choices = json.loads(data).get("choices") or []
+    if not choices:
+        return False, None
+    delta = choices[0].get("delta") or {}
+    if calls is not None:
+        for fragment in delta.get("tool_calls") or []:
+            call = calls.setdefault(
+                fragment.get("index", len(calls)),
+                {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+            )
+            call["id"] = fragment.get("id") or call["id"]
+            function = fragment.get("function") or {}
+            call["function"]["name"] += function.get("name") or ""
+            call["function"]["arguments"] += function.get("arguments") or ""
+    # Reasoner models stream reasoning_content first; only the answer is forwarded.
+    return False, delta.get("content")
+
+
+def _tool_call_response(calls: dict[int, dict]) -> dict:
+    """The non-streamed response shape ``_tool_step`` reads, from accumulated tool calls."""
+    return {"choices": [{"message": {"tool_calls": [calls[index] for index in sorted(calls)]}}]}
+
+
+def _tool_step(
+    data: dict,
+    messages: list[dict],
+    tool_map: dict[str, ToolSpec],
+    tool_traces: list[dict],
+) -> tuple[str, bool]:
+    """Apply one tool-calling response: (final content, whether tools were called)."""
+    choices = data.get("choices") or []
+    if not choices:
+        raise RuntimeError("LLM response missing choices.")
+    message = choices[0].get("message") or {}
+    tool_calls = message.get("tool_calls") or []
+    content = (message.get("content") or "").strip()
+    if not tool_calls:
+        return content, False
+
+    messages.append({"role": "assistant", "tool_calls": tool_calls})
+    for call in tool_calls:
+        func = call.get("function") or {}
+        tool_name = func.get("name")
+        call_id = call.get("id") or ""
+        raw_args = func.get("arguments") or "{}"
+        start = time.perf_counter()
+        trace = {
+            "tool_name": tool_name,
+            "input": raw_args,
+            "output": None,
+            "error": None,
+            "duration_ms": None,
+        }
+        try:
+            args = json.loads(raw_args) if isinstance(raw_args, str) else raw_args
+            trace["input"] = args
+            tool = tool_map.get(tool_name)
+            if not tool:
+                raise ToolRunError("Tool not allowed.")
+            output = tool.run(args)
+            trace["output"] = output
+        except (json.JSONDecodeError, ToolRunError, ValueError) as exc:
+            trace["error"] = str(exc)
+            output = f"ERROR: {exc}"
+        except Exception as exc:
+            trace["error"] = f"Unexpected error: {exc}"
+            output = f"ERROR: {exc}"
+        finally:
+            trace["duration_ms"] = int((time.perf_counter() - start) * 1000)
+            tool_traces.append(trace)
+        messages.append(
+            {
+                "role": "tool",
+                "tool_call_id": call_id,
+                "content": output,
+            }
+        )
+    return content, True
@@ -1,14 +1,26 @@
 import logging
 
 from app.core.config import Settings
-from app.services.embeddings import HashEmbedder, RealEmbedder
-from app.services.llm.mock import MockLLM
-from app.services.llm.real import RealLLMClient
+from app.services import http_pool
+from app.services.embeddings import AsyncRealEmbedder, CharNgramEmbedder, HashEmbedder, RealEmbedder
+from app.services.llm.mock import AsyncMockLLM, MockLLM
+from app.services.llm.real import AsyncRealLLMClient, RealLLMClient
 from app.services.provider_utils import normalize_base_url
 
 logger = logging.getLogger(__name__)
 
 
+def configure_http_pool(settings: Settings) -> None:
+    http_pool.configure(
+        http_pool.PoolConfig(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive,
+            keepalive_expiry=settings.http_keepalive_expiry,
+            http2=settings.http2_enabled,
+        )
+    )
+
+
 def build_llm_client(settings: Settings):
     provider = (settings.llm_provider or "").strip().lower() or "mock"
     api_key = (settings.deepseek_api_key or "").strip()
@@ -42,34 +54,80 @@ def build_llm_client(settings: Settings):
     return MockLLM()
 
 
+def build_async_llm_client(llm_client):
+    """Async twin of a client from ``build_llm_client``, with the same model and limits."""
+    if isinstance(llm_client, RealLLMClient):
+        return AsyncRealLLMClient(
+            base_url=llm_client.base_url,
+            api_key=llm_client.api_key,
+            model=llm_client.model,
+            json_model=llm_client.json_model,
+            timeout=llm_client.timeout,
+            max_tokens=llm_client.max_tokens,
+        )
+    return AsyncMockLLM()
+
+
 def build_embedder(settings: Settings):
     model = (settings.llm_embedding_model or "").strip()
     api_key = (settings.deepseek_api_key or "").strip()
-    hash_dim = settings.llm_embedding_dim or 384
+    local_dim = settings.llm_embedding_dim or 384
     base_url = normalize_base_url(settings.llm_base_url)
 
     if model:
         if not api_key:
             logger.warning(
-                "LLM_EMBEDDING_MODEL is set but DEEPSEEK_API_KEY is missing. Using HashEmbedder.",
+                "LLM_EMBEDDING_MODEL is set but DEEPSEEK_API_KEY is missing. Using the local embedder.",
             )
-            return HashEmbedder(dim=hash_dim)
+            return build_local_embedder(settings, local_dim)
         if not base_url:
             logger.warning(
-                "LLM_EMBEDDING_MODEL is set but LLM_BASE_URL is missing. Using HashEmbedder.",
+                "LLM_EMBEDDING_MODEL is set but LLM_BASE_URL is missing. Using the local embedder.",
             )
-            return HashEmbedder(dim=hash_dim)
+            return build_local_embedder(settings, local_dim)
         if not settings.llm_embedding_dim:
             logger.warning(
-                "LLM_EMBEDDING_MODEL is set but LLM_EMBEDDING_DIM is missing. Using HashEmbedder.",
+                "LLM_EMBEDDING_MODEL is set but LLM_EMBEDDING_DIM is missing. Using the local embedder.",
             )
-            return HashEmbedder(dim=hash_dim)
+            return build_local_embedder(settings, local_dim)
         return RealEmbedder(
             base_url=base_url,
             api_key=api_key,
             model=model,
             dim=settings.llm_embedding_dim,
             timeout=settings.llm_timeout,
+            max_batch_size=settings.embedding_batch_size,
+            max_batch_tokens=settings.embedding_batch_tokens,
+            max_concurrency=settings.embedding_concurrency,
+            max_retries=settings.embedding_max_retries,
         )
 
-    return HashEmbedder(dim=hash_dim)
+    return build_local_embedder(settings, local_dim)
+
+
+def build_local_embedder(settings: Settings, dim: int):
+    kind = (settings.local_embedder or "").strip().lower() or "hash"
+    if kind in {"char-ngram", "ngram"}:
+        return CharNgramEmbedder(dim=dim)
+    if kind != "hash":
+        logger.warning("Unknown LOCAL_EMBEDDER=%s. Using HashEmbedder.", kind)
+    return HashEmbedder(dim=dim, workers=settings.hash_embedder_workers)
+
+
+def build_async_embedder(embedder) -> AsyncRealEmbedder | None:
+    """Async twin of an API embedder; local embedders have no I/O to await, so None."""
+    if not isinstance(embedder, RealEmbedder):
+        return None
+    return AsyncRealEmbedder(
+        base_url=embedder.base_url,
+        api_key=embedder.api_key,
+        model=embedder.model,
+        dim=embedder.dim,
+        timeout=embedder.timeout,
+        max_batch_size=embedder.max_batch_size,
+        max_batch_tokens=embedder.max_batch_tokens,
+        max_concurrency=embedder.max_concurrency,
+        max_retries=embedder.max_retries,
+        backoff_seconds=embedder.backoff_seconds,
+        max_backoff_seconds=embedder.max_backoff_seconds,
+    )
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import concurrent.futures
@@ -6,19 +7,22 @@ from datetime import datetime
 from itertools import cycle
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.db import models
+from app.services.embeddings import AsyncRealEmbedder
 from app.services.index_manager import IndexManager
 from app.services.profile_service import (
     build_difficulty_plan,
     get_last_quiz_summary,
     get_or_create_profile,
 )
-from app.services.llm.base import LLMClient
-from app.services.llm.mock import MockLLM
-from app.services.llm.real import RealLLMClient
+from app.services.llm.base import AsyncLLMClient, LLMClient
+from app.services.llm.mock import AsyncMockLLM, MockLLM
+from app.services.llm.real import ChatCompletionsClient
 
 DEFAULT_SESSION_ID = "default"
 MAX_SNIPPET_LENGTH = 120
@@ -316,16 +320,18 @@ def _retrieve_chunks(
     doc_ids: Optional[Sequence[int]],
     focus_concepts: Optional[Sequence[str]],
     count: int,
+    query_vectors: Optional[np.ndarray] = None,
 ) -> List[models.Chunk]:
     if not index_manager.is_ready():
         raise HTTPException(status_code=409, detail="Index not built. Call POST /index/rebuild first.")
 
     if focus_concepts:
+        concepts = _concepts(focus_concepts)
         chunk_ids: List[int] = []
-        for concept in focus_concepts:
-            if not concept:
-                continue
-            results = index_manager.search(concept, top_k=max(count, 5), db=db)
+        results_per_concept = index_manager.search_many(
+            concepts, top_k=max(count, 5), db=db, query_vectors=query_vectors
+        )
+        for results in results_per_concept:
             for item in results:
                 if doc_ids and item["document_id"] not in doc_ids:
                     continue
@@ -349,6 +355,10 @@ def _retrieve_chunks(
     return chunks
 
 
+def _concepts(focus_concepts: Sequence[str]) -> List[str]:
+    return [concept for concept in focus_concepts if concept]
+
+
 def _build_question_payload(
     llm: LLMClient,
     question_type: str,
@@ -360,16 +370,59 @@ def _build_question_payload(
     normalized_type = _normalize_question_type(question_type)
     snippet = _extract_snippet(chunk.text or "")
     related_concept = _derive_concept(chunk.text or "")
-    explanation = f"依据资料片段：{snippet}" if snippet else None
-    options: Optional[List[str]] = None
-    answer: Dict[str, Any]
-    meta = _default_meta(related_concept, difficulty)
 
     parsed = None
     if use_llm:
         prompt = _build_llm_question_prompt(normalized_type, difficulty, snippet or "", related_concept)
         llm_text = _safe_llm_generate(llm, prompt, snippet or "", llm_timeout)
         parsed = _parse_llm_question_json(llm_text, normalized_type)
+    summary = None
+    if _needs_summary(normalized_type, parsed):
+        summary = _safe_llm_generate(llm, "概括要点", snippet or "", llm_timeout)
+    return _assemble_question(normalized_type, difficulty, chunk, snippet, related_concept, parsed, summary)
+
+
+async def _build_question_payload_async(
+    llm: AsyncLLMClient,
+    question_type: str,
+    difficulty: str,
+    chunk: models.Chunk,
+    use_llm: bool,
+    llm_timeout: float,
+) -> Tuple[models.QuizQuestion, Dict[str, Any]]:
+    normalized_type = _normalize_question_type(question_type)
+    snippet = _extract_snippet(chunk.text or "")
+    related_concept = _derive_concept(chunk.text or "")
+
+    parsed = None
+    if use_llm:
+        prompt = _build_llm_question_prompt(normalized_type, difficulty, snippet or "", related_concept)
+        llm_text = await _safe_llm_generate_async(llm, prompt, snippet or "", llm_timeout)
+        parsed = _parse_llm_question_json(llm_text, normalized_type)
+    summary = None
+    if _needs_summary(normalized_type, parsed):
+        summary = await _safe_llm_generate_async(llm, "概括要点", snippet or "", llm_timeout)
+    return _assemble_question(normalized_type, difficulty, chunk, snippet, related_concept, parsed, summary)
+
+
+def _needs_summary(normalized_type: str, parsed: Optional[Dict[str, Any]]) -> bool:
+    # Without a usable LLM question, short-answer items fall back to a summary as reference.
+    return not (parsed and parsed.get("stem")) and normalized_type not in {"single", "judge"}
+
+
+def _assemble_question(
+    normalized_type: str,
+    difficulty: str,
+    chunk: models.Chunk,
+    snippet: str,
+    related_concept: str,
+    parsed: Optional[Dict[str, Any]],
+    summary: Optional[str],
+) -> Tuple[models.QuizQuestion, Dict[str, Any]]:
+    explanation = f"依据资料片段：{snippet}" if snippet else None
+    options: Optional[List[str]] = None
+    answer: Dict[str, Any]
+    meta = _default_meta(related_concept, difficulty)
 
     if parsed and parsed.get("stem"):
         stem = parsed["stem"]
@@ -397,7 +450,6 @@ def _build_question_payload(
             answer = {"value": True}
             stem = f"判断正误：{snippet}" if snippet else "判断正误：资料片段为空"
         else:
-            summary = _safe_llm_generate(llm, "概括要点", snippet or "", llm_timeout)
             answer = {"reference_answer": summary}
             stem = f"简要概括以下内容的要点：{snippet}" if snippet else "简要概括以下内容的要点："
             options = []
@@ -459,7 +511,39 @@ def _safe_llm_generate(llm: LLMClient, query: str, context: str, timeout: float)
         executor.shutdown(wait=False, cancel_futures=True)
 
 
-def generate_quiz(
+async def _safe_llm_generate_async(llm: AsyncLLMClient, query: str, context: str, timeout: float) -> str:
+    # wait_for cancels the request itself on timeout, so nothing keeps running behind it.
+    try:
+        return await asyncio.wait_for(llm.generate_answer(query, context), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("LLM generate timed out, falling back to MockLLM.")
+        try:
+            return MockLLM().generate_answer(query, context)
+        except Exception:
+            logger.exception("MockLLM fallback failed.")
+            raise
+    except Exception as exc:
+        logger.warning("LLM generate failed, falling back to MockLLM: %s", exc)
+        try:
+            return MockLLM().generate_answer(query, context)
+        except Exception:
+            logger.exception("MockLLM fallback failed.")
+            raise
+
+
+def _quiz_llm(llm: Any) -> Any:
+    """Questions are JSON, so reasoner models hand them to the JSON model."""
+    if not isinstance(llm, ChatCompletionsClient):
+        return llm
+    json_model = (llm.json_model or "").strip()
+    if not json_model and "reasoner" in (llm.model or ""):
+        json_model = "deepseek-chat"
+    if json_model and json_model != llm.model:
+        return llm.with_model(json_model, json_model=llm.json_model)
+    return llm
+
+
+def _prepare_quiz(
     db: Session,
     index_manager: IndexManager,
     session_id: Optional[str],
@@ -468,9 +552,12 @@ def generate_quiz(
     count: int,
     types: Sequence[str],
     focus_concepts: Optional[Sequence[str]],
-    llm_client: Optional[LLMClient] = None,
-    llm_timeout: Optional[float] = None,
+    query_vectors: Optional[np.ndarray] = None,
 ) -> Dict[str, Any]:
+    """Database reads for a quiz: difficulty plan and one (chunk, type, difficulty) slot per question.
+
+    ``query_vectors`` are the embedded focus concepts, when the caller has them.
+    """
     normalized_session = (session_id or "").strip() or DEFAULT_SESSION_ID
     resolved_doc_ids: Optional[Sequence[int]] = doc_ids or ([document_id] if document_id else None)
     if resolved_doc_ids:
@@ -488,68 +575,124 @@ def generate_quiz(
         recommendation=recommendation,
     )
 
-    chunks = _retrieve_chunks(db, index_manager, resolved_doc_ids, focus_concepts, count)
+    chunks = _retrieve_chunks(db, index_manager, resolved_doc_ids, focus_concepts, count, query_vectors)
     chunk_cycle = cycle(chunks)
     normalized_types = [_normalize_question_type(item) for item in (types or ["single"])]
     type_cycle = cycle(normalized_types)
-    llm = llm_client or MockLLM()
-    quiz_llm = llm
-    if isinstance(llm, RealLLMClient):
-        json_model = (llm.json_model or "").strip()
-        if not json_model and "reasoner" in (llm.model or ""):
-            json_model = "deepseek-chat"
-        if json_model and json_model != llm.model:
-            quiz_llm = RealLLMClient(
-                base_url=llm.base_url,
-                api_key=llm.api_key,
-                model=json_model,
-                json_model=llm.json_model,
-                timeout=llm.timeout,
-                max_tokens=llm.max_tokens,
-            )
-    quiz_timeout = llm_timeout or DEFAULT_QUIZ_TIMEOUT
-    use_llm = True
+    difficulty_sequence = (
+        ["Easy"] * difficulty_plan.get("Easy", 0)
+        + ["Medium"] * difficulty_plan.get("Medium", 0)
+        + ["Hard"] * difficulty_plan.get("Hard", 0)
+    )
+    difficulty_cycle = cycle(difficulty_sequence or ["Easy"])
+    slots = [(next(chunk_cycle), next(type_cycle), next(difficulty_cycle)) for _ in range(count)]
+    return {
+        "session_id": normalized_session,
+        "doc_ids": resolved_doc_ids,
+        "difficulty_plan": difficulty_plan,
+        "slots": slots,
+    }
+
 
+def _save_quiz(
+    db: Session,
+    plan: Dict[str, Any],
+    built: Sequence[Tuple[models.QuizQuestion, Dict[str, Any]]],
+) -> Dict[str, Any]:
+    resolved_doc_ids = plan["doc_ids"]
     quiz = models.Quiz(
-        session_id=normalized_session,
+        session_id=plan["session_id"],
         document_id=resolved_doc_ids[0] if resolved_doc_ids else None,
-        difficulty_plan_json=difficulty_plan,
+        difficulty_plan_json=plan["difficulty_plan"],
     )
     db.add(quiz)
     db.flush()
 
     questions_payload: List[Dict[str, Any]] = []
-    questions: List[models.QuizQuestion] = []
-    difficulty_sequence = (
-        ["Easy"] * difficulty_plan.get("Easy", 0)
-        + ["Medium"] * difficulty_plan.get("Medium", 0)
-        + ["Hard"] * difficulty_plan.get("Hard", 0)
-    )
-    difficulty_cycle = cycle(difficulty_sequence or ["Easy"])
-    for _ in range(count):
-        chunk = next(chunk_cycle)
-        question_type = next(type_cycle)
-        difficulty = next(difficulty_cycle)
-        question, payload = _build_question_payload(
-            quiz_llm,
-            question_type,
-            difficulty,
-            chunk,
-            use_llm,
-            quiz_timeout,
-        )
+    for question, payload in built:
         question.quiz_id = quiz.id
         db.add(question)
-        questions.append(question)
         questions_payload.append(payload)
 
     db.flush()
-    for question, payload in zip(questions, questions_payload):
+    for question, payload in built:
         payload["question_id"] = question.id
 
     db.commit()
 
-    return {"quiz_id": quiz.id, "difficulty_plan": difficulty_plan, "questions": questions_payload}
+    return {"quiz_id": quiz.id, "difficulty_plan": plan["difficulty_plan"], "questions": questions_payload}
+
+
+def generate_quiz(
+    db: Session,
+    index_manager: IndexManager,
+    session_id: Optional[str],
+    document_id: Optional[int],
+    doc_ids: Optional[Sequence[int]],
+    count: int,
+    types: Sequence[str],
+    focus_concepts: Optional[Sequence[str]],
+    llm_client: Optional[LLMClient] = None,
+    llm_timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    plan = _prepare_quiz(db, index_manager, session_id, document_id, doc_ids, count, types, focus_concepts)
+    quiz_llm = _quiz_llm(llm_client or MockLLM())
+    quiz_timeout = llm_timeout or DEFAULT_QUIZ_TIMEOUT
+    built = [
+        _build_question_payload(quiz_llm, question_type, difficulty, chunk, True, quiz_timeout)
+        for chunk, question_type, difficulty in plan["slots"]
+    ]
+    return _save_quiz(db, plan, built)
+
+
+async def generate_quiz_async(
+    db: Session,
+    index_manager: IndexManager,
+    session_id: Optional[str],
+    document_id: Optional[int],
+    doc_ids: Optional[Sequence[int]],
+    count: int,
+    types: Sequence[str],
+    focus_concepts: Optional[Sequence[str]],
+    llm_client: Optional[AsyncLLMClient] = None,
+    llm_timeout: Optional[float] = None,
+    embedder: Optional[AsyncRealEmbedder] = None,
+) -> Dict[str, Any]:
+    """``generate_quiz`` for async endpoints.
+
+    Database work runs in the threadpool; focus concepts are embedded with
+    ``embedder`` and the questions' LLM calls run concurrently on the event
+    loop, bounded by the HTTP pool's connection limit.
+    """
+    query_vectors = None
+    concepts = _concepts(focus_concepts or [])
+    if embedder is not None and concepts and index_manager.is_ready():
+        try:
+            query_vectors = await index_manager.aembed_queries(embedder, concepts)
+        except Exception as exc:
+            # Retrieval embeds the concepts itself (with its own retries) when this fails.
+            logger.warning("Async concept embedding failed in quiz generation: %s", exc)
+    plan = await run_in_threadpool(
+        _prepare_quiz,
+        db,
+        index_manager,
+        session_id,
+        document_id,
+        doc_ids,
+        count,
+        types,
+        focus_concepts,
+        query_vectors,
+    )
+    quiz_llm = _quiz_llm(llm_client or AsyncMockLLM())
+    quiz_timeout = llm_timeout or DEFAULT_QUIZ_TIMEOUT
+    built = await asyncio.gather(
+        *(
+            _build_question_payload_async(quiz_llm, question_type, difficulty, chunk, True, quiz_timeout)
+            for chunk, question_type, difficulty in plan["slots"]
+        )
+    )
+    return await run_in_threadpool(_save_quiz, db, plan, built)
 
 
 def _coerce_choice(value: Any) -> Optional[str]:
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger("uvicorn.error")
+
+SNAPSHOT_PREFIX = "v"
+POINTER_NAME = "CURRENT"
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "build.lock"
+CHECKPOINT_NAME = "checkpoint"
+
+# A file in a snapshot is either written fresh or hard-linked from an older snapshot.
+FileSource = Callable[[Path], None] | Path
+
+
+class SnapshotStore:
+    """Versioned index directories published through an atomic ``CURRENT`` pointer.
+
+    Every version is written into a temporary directory, fsynced, renamed to
+    ``snapshots/v<version>`` and only then named in ``CURRENT``. A crash at any
+    point leaves the pointer on the last complete snapshot, so recovery is a
+    plain load. Files that did not change are hard-linked from the previous
+    snapshot instead of rewritten. ``lock()`` lets several worker processes
+    share one store with a single writer at a time, and ``save_checkpoint``
+    keeps one in-progress build on disk the same crash-safe way.
+    """
+
+    def __init__(self, root: Path, keep: int = 2):
+        self.root = Path(root)
+        self.snapshots_dir = self.root / "snapshots"
+        self.pointer_path = self.root / POINTER_NAME
+        self.keep = max(keep, 1)
+        self._thread_lock = threading.RLock()
+        self._lock_handle = None
+
+    def current(self) -> tuple[Path, Dict[str, Any]] | None:
+        if not self.pointer_path.exists():
+            return None
+        name = self.pointer_path.read_text(encoding="utf-8").strip()
+        path = self.snapshots_dir / name
+        manifest_path = path / MANIFEST_NAME
+        if not name or not manifest_path.exists():
+            logger.warning("Index pointer names a missing snapshot (%s).", name)
+            return None
+        with manifest_path.open("r", encoding="utf-8") as handle:
+            return path, json.load(handle)
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Exclusive across processes; re-entrant within the thread holding it."""
+        with self._thread_lock:
+            if self._lock_handle is not None:
+                yield
+                return
+            with file_lock(self.root / LOCK_NAME) as handle:
+                self._lock_handle = handle
+                try:
+                    yield
+                finally:
+                    self._lock_handle = None
+
+    def current_version(self) -> int | None:
+        if not self.pointer_path.exists():
+            return None
+        name = self.pointer_path.read_text(encoding="utf-8").strip()
+        return _parse_version(name)
+
+    def publish(self, version: int, files: Dict[str, FileSource], manifest: Dict[str, Any]) -> Path:
+        """Write ``files`` and ``manifest`` as snapshot ``version`` and point CURRENT at it."""
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{SNAPSHOT_PREFIX}{version:08d}"
+        final = self.snapshots_dir / name
+        staging = self.snapshots_dir / f".{name}.{os.getpid()}.tmp"
+        _write_directory(staging, files, {**manifest, "version": version})
+        if final.exists():
+            # Left over from a publish that crashed before moving the pointer.
+            shutil.rmtree(final)
+        os.replace(staging, final)
+        _fsync_dir(self.snapshots_dir)
+
+        pointer_tmp = self.root / f".{POINTER_NAME}.{os.getpid()}.tmp"
+        with pointer_tmp.open("w", encoding="utf-8") as handle:
+            handle.write(name)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(pointer_tmp, self.pointer_path)
+        _fsync_dir(self.root)
+        self.collect_garbage()
+        return final
+
+    def checkpoint(self) -> tuple[Path, Dict[str, Any]] | None:
+        """The saved in-progress build, if any, with its state."""
+        for path in (self.root / CHECKPOINT_NAME, self.root / f".{CHECKPOINT_NAME}.old"):
+            # ".old" only survives a crash between the two renames in save_checkpoint.
+            manifest_path = path / MANIFEST_NAME
+            if manifest_path.exists():
+                with manifest_path.open("r", encoding="utf-8") as handle:
+                    return path, json.load(handle)
+        return None
+
+    def save_checkpoint(self, files: Dict[str, FileSource], state: Dict[str, Any]) -> Path:
+        """Replace the saved in-progress build with ``files`` and ``state``."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        final = self.root / CHECKPOINT_NAME
+        old = self.root / f".{CHECKPOINT_NAME}.old"
+        staging = self.root / f".{CHECKPOINT_NAME}.{os.getpid()}.tmp"
+        _write_directory(staging, files, state)
+        shutil.rmtree(old, ignore_errors=True)
+        if final.exists():
+            os.replace(final, old)
+        os.replace(staging, final)
+        _fsync_dir(self.root)
+        shutil.rmtree(old, ignore_errors=True)
+        return final
+
+    def clear_checkpoint(self) -> None:
+        for path in (self.root / CHECKPOINT_NAME, self.root / f".{CHECKPOINT_NAME}.old"):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def collect_garbage(self) -> None:
+        """Delete all but the newest ``keep`` snapshots (never the current one)."""
+        if not self.snapshots_dir.exists():
+            return
+        current = self.current_version()
+        versions = sorted(
+            version
+            for version in (_parse_version(path.name) for path in self.snapshots_dir.iterdir())
+            if version is not None
+        )
+        retained = set(versions[-self.keep :])
+        if current is not None:
+            retained.add(current)
+        for path in self.snapshots_dir.iterdir():
+            version = _parse_version(path.name)
+            stale_staging = path.name.endswith(".tmp") and f".{os.getpid()}." not in path.name
+            if (version is not None and version not in retained) or stale_staging:
+                # Open mmaps of deleted files stay valid until their readers let go.
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_directory(staging: Path, files: Dict[str, FileSource], manifest: Dict[str, Any]) -> None:
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir()
+    for file_name, source in files.items():
+        target = staging / file_name
+        if isinstance(source, Path):
+            _link_or_copy(source, target)
+        else:
+            source(target)
+        _fsync_file(target)
+    manifest = {**manifest, "created_at": time.time(), "files": sorted(files)}
+    with (staging / MANIFEST_NAME).open("w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, ensure_ascii=True)
+        handle.flush()
+        os.fsync(handle.fileno())
+    _fsync_dir(staging)
+
+
+def _parse_version(name: str) -> int | None:
+    if not name.startswith(SNAPSHOT_PREFIX) or not name[len(SNAPSHOT_PREFIX) :].isdigit():
+        return None
+    return int(name[len(SNAPSHOT_PREFIX) :])
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[Any]:
+    """Exclusive ``flock`` (``msvcrt`` lock on Windows) on ``path``, created if missing."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a+b") as handle:
+        _lock_file(handle)
+        try:
+            yield handle
+        finally:
+            _unlock_file(handle)
+
+
+def _lock_file(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        return
+    handle.seek(0)
+    while True:
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after ~10 seconds; a rebuild can take longer.
+            continue
+
+
+def _unlock_file(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        return
+    handle.seek(0)
+    msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _fsync_file(path: Path) -> None:
+    with path.open("rb") as handle:
+        os.fsync(handle.fileno())
+
+
+def _fsync_dir(path: Path) -> None:
+    # Directory fsync makes renames durable; not every platform supports it.
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,72 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from app.services.embeddings import HashEmbedder
+
+
+def per_text_embed(texts, dim):
+    """The original one-text-at-a-time implementation, kept as the baseline."""
+    vectors = []
+    for text in texts:
+        data = text.encode("utf-8")
+        out = bytearray()
+        counter = 0
+        while len(out) < dim:
+            hasher = hashlib.sha256()
+            hasher.update(counter.to_bytes(4, "little"))
+            hasher.update(data)
+            out.extend(hasher.digest())
+            counter += 1
+        vectors.append(np.frombuffer(bytes(out[:dim]), dtype=np.uint8).astype(np.float32) / 255.0)
+    return np.vstack(vectors).astype(np.float32)
+
+
+def measure(label, embed, texts, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = embed(texts)
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<18} {len(texts) / best:>12,.0f} texts/s  ({best * 1000:.1f} ms)")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HashEmbedder throughput")
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--chars", type=int, default=800, help="characters per text (~ one chunk)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz 机器学习线性代数"))
+    texts = ["".join(rng.choice(alphabet, args.chars)) + str(i) for i in range(args.texts)]
+
+    print(f"texts={args.texts} dim={args.dim} chars={args.chars}")
+    baseline = measure("per-text", lambda items: per_text_embed(items, args.dim), texts, args.repeat)
+    batched = measure("batched", HashEmbedder(dim=args.dim).embed_texts, texts, args.repeat)
+    pooled_embedder = HashEmbedder(dim=args.dim, workers=args.workers, parallel_min_batch=1)
+    try:
+        pooled_embedder.embed_texts(texts[:1])  # start the pool outside the timing
+        pooled = measure(f"pool x{args.workers}", pooled_embedder.embed_texts, texts, args.repeat)
+    finally:
+        pooled_embedder.close()
+
+    assert batched.tobytes() == baseline.tobytes() == pooled.tobytes(), "outputs differ"
+    print("outputs are bit-identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,7 @@ $docId = $upload.document_id
 Write-Host "document_id=$docId"
 
 Write-Host "==> Rebuild index"
-$rebuild = Invoke-RestMethod -Uri "$BaseUrl/index/rebuild" -Method Post
+$rebuild = Invoke-RestMethod -Uri "$BaseUrl/index/rebuild?wait=true" -Method Post
 $rebuild | ConvertTo-Json -Compress
 
 Write-Host "==> Search keyword"
@@ -91,7 +91,7 @@ print(f"document_id={doc_id}")
 
 if not auto_rebuild:
     step("Rebuild index")
-    print(http_post("/index/rebuild"))
+    print(http_post("/index/rebuild?wait=true"))
 else:
     step("Rebuild index (auto)")
     print({"status": "auto", "debounce": True})
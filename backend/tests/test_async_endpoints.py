@@ -0,0 +1,166 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.main as main
+from app.db.models import Chunk, Document
+from app.db.session import Base, get_db
+from app.services.doc_summary import SummaryCache
+from app.services.embeddings import HashEmbedder
+from app.services.index_manager import IndexManager
+from app.services.llm.mock import AsyncMockLLM
+
+
+class RecordingAsyncLLM(AsyncMockLLM):
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    async def generate_answer(self, query, context):
+        self.queries.append(query)
+        return await super().generate_answer(query, context)
+
+
+class SyncLLMGuard:
+    """Stands in for the sync client; async endpoints must never call it."""
+
+    def __init__(self):
+        self.calls = []
+
+    def generate_answer(self, query, context):
+        self.calls.append(query)
+        return "sync answer"
+
+
+class AsyncHashEmbedder:
+    """Async twin of ``HashEmbedder`` with the same fingerprint."""
+
+    model = "HashEmbedder"
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.sync = HashEmbedder(dim=dim)
+        self.calls = []
+
+    async def embed_texts(self, texts):
+        items = list(texts)
+        self.calls.append(items)
+        return self.sync.embed_texts(items)
+
+
+@pytest.fixture()
+def db_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture()
+def client(db_factory, tmp_path, monkeypatch):
+    def override_get_db():
+        db = db_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    monkeypatch.setattr(main, "index_manager", manager)
+    monkeypatch.setattr(main, "llm_client", SyncLLMGuard())
+    monkeypatch.setattr(main, "async_llm_client", RecordingAsyncLLM())
+    monkeypatch.setattr(main, "async_embedder", AsyncHashEmbedder(dim=64))
+    monkeypatch.setattr(main, "tool_registry", {})
+    monkeypatch.setattr(main, "summary_cache", SummaryCache())
+    main.app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.dependency_overrides.pop(get_db, None)
+
+
+def _add_document(db_factory, texts):
+    db = db_factory()
+    document = Document(filename="notes.txt", content_type="text/plain")
+    db.add(document)
+    db.flush()
+    for position, text in enumerate(texts):
+        db.add(Chunk(document_id=document.id, chunk_index=position, text=text, metadata_json={}))
+    db.commit()
+    document_id = document.id
+    db.close()
+    return document_id
+
+
+def _rebuild(db_factory):
+    db = db_factory()
+    try:
+        main.index_manager.rebuild(db)
+    finally:
+        db.close()
+    # Queries must come from the async embedder from here on.
+    main.index_manager.embedder.embed_texts = None
+
+
+def test_chat_answers_with_the_async_clients(client, db_factory):
+    _add_document(db_factory, ["FAISS 是向量检索库。", "BM25 是关键词检索算法。"])
+    _rebuild(db_factory)
+
+    response = client.post("/chat", json={"query": "FAISS 是什么", "top_k": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answer"] and body["sources"]
+    assert main.async_embedder.calls == [["FAISS 是什么"]]
+    assert main.async_llm_client.queries
+    assert main.llm_client.calls == []
+
+
+def test_chat_without_candidates_awaits_the_async_client(client, db_factory):
+    document_id = _add_document(db_factory, ["FAISS 是向量检索库。"])
+    _rebuild(db_factory)
+
+    response = client.post("/chat", json={"query": "FAISS", "document_id": document_id + 1})
+
+    assert response.status_code == 200
+    assert response.json()["retrieval"]["reason"] == "doc_filter_no_candidates"
+    assert len(main.async_llm_client.queries) == 1
+    assert main.llm_client.calls == []
+
+
+def test_quiz_generate_embeds_focus_concepts_asynchronously(client, db_factory):
+    _add_document(db_factory, ["FAISS 是向量检索库，支持多种索引。", "BM25 是关键词检索算法。"])
+    _rebuild(db_factory)
+
+    response = client.post(
+        "/quiz/generate",
+        json={"count": 2, "types": ["single"], "focus_concepts": ["FAISS", "", "BM25"]},
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()["questions"]) == 2
+    assert main.async_embedder.calls == [["FAISS", "BM25"]]
+    assert main.llm_client.calls == []
+
+
+def test_doc_summary_uses_the_async_client_then_the_cache(client, db_factory):
+    document_id = _add_document(db_factory, ["FAISS 是向量检索库。支持多种索引。"])
+
+    first = client.post(f"/docs/{document_id}/summary", json={})
+    second = client.post(f"/docs/{document_id}/summary", json={})
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json()["summary"] and not first.json()["cached"]
+    assert second.json()["cached"]
+    assert len(main.async_llm_client.queries) == 1
+    assert main.llm_client.calls == []
+    assert client.post(f"/docs/{document_id + 1}/summary", json={}).status_code == 404
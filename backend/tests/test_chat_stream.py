@@ -0,0 +1,185 @@
+import asyncio
+import json
+
+import httpx
+
+import app.main as main
+from app.services.llm.mock import AsyncMockLLM, MockLLM
+from app.services.llm.real import AsyncRealLLMClient, RealLLMClient
+from app.services.tools.safe_calc import calc_tool
+
+STREAM_BODY = "".join(
+    f"data: {json.dumps(chunk)}\n\n"
+    for chunk in (
+        {"choices": [{"delta": {"reasoning_content": "thinking"}}]},
+        {"choices": [{"delta": {"content": "答案"}}]},
+        {"choices": []},
+        {"choices": [{"delta": {"content": "完整"}}]},
+    )
+) + "data: [DONE]\n\n"
+
+
+def _events(stream):
+    async def collect():
+        return [raw async for raw in stream]
+
+    events = []
+    for raw in asyncio.run(collect()):
+        name, data = raw.strip().split("\n")
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_real_client_streams_content_deltas():
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, text=STREAM_BODY, headers={"Content-Type": "text/event-stream"})
+
+    llm = RealLLMClient(
+        base_url="http://llm",
+        api_key="k",
+        model="deepseek-chat",
+        client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+
+    assert list(llm.stream_answer("q", "资料")) == ["答案", "完整"]
+    assert payloads[0]["stream"] is True
+    assert list(llm.stream_answer("q", "")) == ["资料中未找到相关内容"]
+    assert len(payloads) == 1
+
+
+def test_async_client_matches_sync_client():
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        if payload.get("stream"):
+            return httpx.Response(200, text=STREAM_BODY, headers={"Content-Type": "text/event-stream"})
+        return httpx.Response(200, json={"choices": [{"message": {"content": payload["model"]}}]})
+
+    llm = AsyncRealLLMClient(
+        base_url="http://llm",
+        api_key="k",
+        model="deepseek-reasoner",
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    async def run():
+        pieces = [piece async for piece in llm.stream_answer("q", "资料")]
+        answer = await llm.generate_answer("q", "资料")
+        # RAW_JSON prompts go to the JSON model, as in the sync client.
+        raw = await llm.generate_answer("RAW_JSON:{}", "")
+        copy = llm.with_model("deepseek-chat")
+        return pieces, answer, raw, copy
+
+    pieces, answer, raw, copy = asyncio.run(run())
+    assert pieces == ["答案", "完整"]
+    assert answer == "deepseek-reasoner"
+    assert raw == "deepseek-chat"
+    assert isinstance(copy, AsyncRealLLMClient) and copy.client is llm.client
+
+
+def test_stream_chat_sends_sources_tokens_then_final_block(monkeypatch):
+    monkeypatch.setattr(main, "async_llm_client", AsyncMockLLM())
+    monkeypatch.setattr(main, "tool_registry", {})
+    plan = main.ChatPlan(
+        query="faiss",
+        match_mode="exact",
+        matched_results=[{"chunk_id": 7, "document_id": 1, "score": 0.9}],
+        chunks_by_id={7: "FAISS 是向量检索库。支持多种索引。"},
+        context="FAISS 是向量检索库。支持多种索引。",
+        suggestions=["faiss"],
+        prompted_query="faiss",
+    )
+
+    events = _events(main._stream_chat(plan))
+
+    names = [name for name, _ in events]
+    assert names[0] == "sources" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"} and len(names) > 3
+    assert events[0][1]["sources"][0]["chunk_id"] == 7
+    streamed = "".join(data["text"] for name, data in events if name == "token")
+    assert streamed == MockLLM().generate_answer("faiss", plan.context)
+    final = events[-1][1]
+    assert final["sources"] == events[0][1]["sources"]
+    assert final["structured"]["conclusion"]
+
+
+def test_stream_chat_uses_the_tool_loop_whenever_tools_are_registered(monkeypatch):
+    monkeypatch.setattr(main, "async_llm_client", AsyncMockLLM())
+    monkeypatch.setattr(main, "tool_registry", {calc_tool.name: calc_tool})
+    plan = main.ChatPlan(
+        query="calc: 2*3",
+        match_mode="semantic",
+        matched_results=[{"chunk_id": 7, "document_id": 1, "score": 0.9}],
+        chunks_by_id={7: "乘法是基本运算。"},
+        context="乘法是基本运算。",
+        prompted_query="calc: 2*3",
+    )
+
+    events = _events(main._stream_chat(plan))
+    answer, tool_traces = asyncio.run(main._generate_chat_answer(plan))
+
+    tokens = [data["text"] for name, data in events if name == "token"]
+    assert "".join(tokens) == answer
+    assert tool_traces and events[-1][1]["tool_traces"] == tool_traces
+
+
+def test_stream_chat_streams_with_the_default_tool_registry(monkeypatch):
+    monkeypatch.setattr(main, "async_llm_client", AsyncMockLLM())
+    assert main.tool_registry
+    plan = main.ChatPlan(
+        query="faiss",
+        match_mode="exact",
+        matched_results=[{"chunk_id": 7, "document_id": 1, "score": 0.9}],
+        chunks_by_id={7: "FAISS 是向量检索库。支持多种索引。"},
+        context="FAISS 是向量检索库。支持多种索引。",
+        prompted_query="faiss",
+    )
+
+    events = _events(main._stream_chat(plan))
+    answer, _ = asyncio.run(main._generate_chat_answer(plan))
+
+    tokens = [data["text"] for name, data in events if name == "token"]
+    assert len(tokens) > 1 and "".join(tokens) == answer
+
+
+def test_async_client_streams_the_answer_after_tool_calls():
+    tool_round = "".join(
+        f"data: {json.dumps(chunk)}\n\n"
+        for chunk in (
+            {"choices": [{"delta": {"tool_calls": [
+                {"index": 0, "id": "call_1", "function": {"name": "calc", "arguments": "{\"expres"}}
+            ]}}]},
+            {"choices": [{"delta": {"tool_calls": [
+                {"index": 0, "function": {"arguments": "sion\": \"2*3\"}"}}
+            ]}}]},
+        )
+    ) + "data: [DONE]\n\n"
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payloads.append(json.loads(request.content))
+        body = tool_round if len(payloads) == 1 else STREAM_BODY
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    llm = AsyncRealLLMClient(
+        base_url="http://llm",
+        api_key="k",
+        model="deepseek-chat",
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    traces = []
+
+    async def run():
+        return [
+            piece
+            async for piece in llm.stream_answer_with_tools(
+                "2*3 等于多少", "资料", [calc_tool], max_calls=2, tool_traces=traces
+            )
+        ]
+
+    assert asyncio.run(run()) == ["答案", "完整"]
+    assert all(payload["stream"] and payload["tools"] for payload in payloads)
+    assert payloads[1]["messages"][-1] == {"role": "tool", "tool_call_id": "call_1", "content": "6"}
+    assert traces[0]["tool_name"] == "calc" and traces[0]["input"] == {"expression": "2*3"}
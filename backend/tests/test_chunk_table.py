@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+
+from app.services.chunk_table import ROW_DTYPE, V1_ROW_DTYPE, ChunkTable
+
+
+def test_lookup_is_vectorized_and_skips_tombstones():
+    table = ChunkTable.from_columns([30, 10, 20], [3, 1, 2], [0, 0, 0])
+    assert table.chunk_ids.tolist() == [10, 20, 30]
+
+    table = table.with_deleted(np.array([20]))
+    assert table.document_ids_for(np.array([30, 20, 99, -1])).tolist() == [3, -1, -1, -1]
+    assert table.live_count == 2
+    assert table.compacted().chunk_ids.tolist() == [10, 30]
+
+
+def test_append_replaces_tombstoned_rows():
+    table = ChunkTable.from_columns([1, 2], [1, 1], [0, 1]).with_deleted(np.array([2]))
+    table = table.append(ChunkTable.from_columns([2, 3], [5, 5], [0, 1]))
+    assert table.chunk_ids.tolist() == [1, 2, 3]
+    assert table.document_ids_for(np.array([2])).tolist() == [5]
+
+
+def test_save_load_mmap_and_legacy_json(tmp_path):
+    legacy = tmp_path / "mapping.json"
+    legacy.write_text(
+        json.dumps(
+            [
+                {"chunk_id": 1, "document_id": 7, "chunk_index": 0},
+                {"chunk_id": 2, "document_id": 7, "chunk_index": 1, "deleted": True},
+            ]
+        )
+    )
+    table = ChunkTable.load_legacy_json(legacy)
+    table.save(tmp_path / "mapping.npy")
+
+    loaded = ChunkTable.load(tmp_path / "mapping.npy", mmap=True)
+    assert isinstance(loaded.rows, np.memmap)
+    assert loaded.document_chunk_ids(7).tolist() == [1]
+    assert loaded.deleted_count == 1
+
+
+def test_v1_mapping_files_are_upgraded(tmp_path):
+    rows = np.zeros(2, dtype=V1_ROW_DTYPE)
+    rows["chunk_id"] = [3, 7]
+    rows["document_id"] = [1, 2]
+    np.save(tmp_path / "mapping.npy", rows)
+
+    table = ChunkTable.load(tmp_path / "mapping.npy")
+
+    assert table.rows.dtype == ROW_DTYPE
+    assert table.watermark() == {
+        "chunk_count": 2,
+        "max_chunk_id": 7,
+        "id_checksum": 10,
+        "content_checksum": 0,
+    }
@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+
+from app.services.embedding_store import DIGEST_SIZE, EmbeddingStore
+from app.services.embeddings import HashEmbedder
+from app.services.snapshot_store import file_lock
+
+
+class CountingEmbedder(HashEmbedder):
+    def __init__(self):
+        super().__init__(dim=16)
+        self.calls = []
+
+    def embed_texts(self, texts):
+        texts = list(texts)
+        self.calls.append(texts)
+        return super().embed_texts(texts)
+
+
+def test_only_misses_are_embedded_and_survive_reopen(tmp_path):
+    embedder = CountingEmbedder()
+    store = EmbeddingStore.for_embedder(tmp_path, embedder)
+
+    first = store.embed(embedder, ["alpha", "beta", "alpha"])
+    second = store.embed(embedder, ["beta", "gamma"])
+
+    assert embedder.calls == [["alpha", "beta"], ["gamma"]]
+    np.testing.assert_array_equal(first[1], second[0])
+    np.testing.assert_array_equal(first[0], first[2])
+
+    reopened = EmbeddingStore.for_embedder(tmp_path, embedder)
+    vectors = reopened.embed(embedder, ["gamma", "alpha"])
+    assert len(embedder.calls) == 2
+    np.testing.assert_array_equal(vectors, embedder.embed_texts(["gamma", "alpha"]))
+
+
+def test_stores_are_separated_by_fingerprint_and_torn_tails_dropped(tmp_path):
+    small, large = HashEmbedder(dim=8), HashEmbedder(dim=16)
+    store = EmbeddingStore.for_embedder(tmp_path, small)
+    store.embed(small, ["text"])
+    assert len(EmbeddingStore.for_embedder(tmp_path, large)) == 0
+
+    with store.vectors_path.open("ab") as handle:
+        handle.write(b"\0" * 12)
+    assert len(EmbeddingStore.for_embedder(tmp_path, small)) == 1
+    assert store.vectors_path.stat().st_size == 8 * 4
+
+
+def test_opening_waits_for_another_workers_append_instead_of_truncating_it(tmp_path):
+    embedder = HashEmbedder(dim=8)
+    store = EmbeddingStore.for_embedder(tmp_path, embedder)
+    store.embed(embedder, ["first"])
+    opened = []
+
+    with file_lock(store.lock_path):
+        # Another worker is between writing its vector and its key.
+        with store.vectors_path.open("ab") as handle:
+            handle.write(embedder.embed_texts(["second"]).tobytes())
+        opener = threading.Thread(target=lambda: opened.append(EmbeddingStore.for_embedder(tmp_path, embedder)))
+        opener.start()
+        opener.join(timeout=0.2)
+        assert not opened
+        with store.keys_path.open("ab") as handle:
+            handle.write(b"\1" * DIGEST_SIZE)
+    opener.join()
+
+    assert len(opened[0]) == 2
+    assert store.vectors_path.stat().st_size == 2 * 8 * 4
+
+
+def test_workers_sharing_a_store_see_each_others_rows(tmp_path):
+    embedder = CountingEmbedder()
+    first = EmbeddingStore.for_embedder(tmp_path, embedder)
+    second = EmbeddingStore.for_embedder(tmp_path, embedder)
+
+    first.embed(embedder, ["alpha"])
+    second.embed(embedder, ["alpha", "beta"])
+    first.embed(embedder, ["beta", "gamma"])
+
+    assert embedder.calls == [["alpha"], ["beta"], ["gamma"]]
+    assert len(first) == 3
+    reopened = EmbeddingStore.for_embedder(tmp_path, embedder)
+    np.testing.assert_array_equal(
+        reopened.embed(embedder, ["gamma", "beta", "alpha"]),
+        embedder.embed_texts(["gamma", "beta", "alpha"]),
+    )
+    assert len(reopened) == 3
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import threading
+
+import httpx
+import numpy as np
+import pytest
+
+from app.services.embeddings import (
+    AsyncRealEmbedder,
+    CharNgramEmbedder,
+    HashEmbedder,
+    QueryEmbeddingCache,
+    RealEmbedder,
+    embedder_fingerprint,
+)
+
+
+class CountingEmbedder(HashEmbedder):
+    def __init__(self, dim: int = 16):
+        super().__init__(dim=dim)
+        self.calls: list[list[str]] = []
+
+    def embed_texts(self, texts):
+        items = list(texts)
+        self.calls.append(items)
+        return super().embed_texts(items)
+
+
+def test_query_cache_skips_repeat_embeddings():
+    embedder = CountingEmbedder()
+    cache = QueryEmbeddingCache(max_items=8)
+
+    first = cache.embed(embedder, ["what is  faiss", "other"])
+    second = cache.embed(embedder, [" what is faiss ", "what is faiss"])
+
+    assert embedder.calls == [["what is faiss", "other"]]
+    np.testing.assert_array_equal(first[0], second[1])
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+
+def test_query_cache_evicts_by_size_and_ttl():
+    embedder = CountingEmbedder()
+    cache = QueryEmbeddingCache(max_items=1)
+    cache.embed(embedder, ["a"])
+    cache.embed(embedder, ["b"])
+    cache.embed(embedder, ["a"])
+    assert len(embedder.calls) == 3
+
+    expired = QueryEmbeddingCache(max_items=4, ttl_seconds=1e-9)
+    expired.embed(embedder, ["c"])
+    expired.embed(embedder, ["c"])
+    assert embedder.calls[-2:] == [["c"], ["c"]]
+
+
+def _reference_hash_vector(text: str, dim: int) -> np.ndarray:
+    data = text.encode("utf-8")
+    out = bytearray()
+    counter = 0
+    while len(out) < dim:
+        out.extend(hashlib.sha256(counter.to_bytes(4, "little") + data).digest())
+        counter += 1
+    return np.frombuffer(bytes(out[:dim]), dtype=np.uint8).astype(np.float32) / 255.0
+
+
+def test_hash_embedder_batches_are_bit_identical_to_per_text_vectors():
+    texts = ["", "hello", "机器学习 basics", "x" * 500] * 3
+    for dim in (16, 100, 384):
+        expected = np.vstack([_reference_hash_vector(text, dim) for text in texts])
+        assert HashEmbedder(dim=dim).embed_texts(texts).tobytes() == expected.tobytes()
+
+    pooled = HashEmbedder(dim=64, workers=2, parallel_min_batch=8)
+    try:
+        vectors = pooled.embed_texts(texts)
+    finally:
+        pooled.close()
+    assert vectors.tobytes() == HashEmbedder(dim=64).embed_texts(texts).tobytes()
+
+
+def test_char_ngram_embedder_ranks_shared_vocabulary_first():
+    embedder = CharNgramEmbedder(dim=256)
+    docs = embedder.embed_texts(
+        ["机器学习是人工智能的一个分支", "线性代数的矩阵运算", "Gradient descent minimizes the loss"]
+    )
+    queries = embedder.embed_texts(["什么是机器学习", "矩阵和线性代数", "minimizing a loss by gradient"])
+
+    np.testing.assert_allclose(np.linalg.norm(docs, axis=1), 1.0, rtol=1e-5)
+    assert (queries @ docs.T).argmax(axis=1).tolist() == [0, 1, 2]
+    assert not embedder.embed_texts([""]).any()
+
+    weighted = embedder.with_idf(embedder.fit_idf(["机器学习", "线性代数"]))
+    assert weighted.model != embedder.model and embedder.idf is None
+
+
+def test_real_embedder_batches_retries_and_keeps_input_order():
+    seen: list[list[str]] = []
+    throttled: set[str] = set()
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        batch = json.loads(request.content)["input"]
+        with lock:
+            seen.append(batch)
+            if batch[0] not in throttled:
+                throttled.add(batch[0])
+                return httpx.Response(429, headers={"Retry-After": "0"})
+        # Reversed on purpose: the client must reorder by "index".
+        data = [
+            {"index": position, "embedding": [float(text[1:]), 0.0]}
+            for position, text in reversed(list(enumerate(batch)))
+        ]
+        return httpx.Response(200, json={"data": data})
+
+    embedder = RealEmbedder(
+        base_url="http://embeddings.test",
+        api_key="key",
+        model="test-embed",
+        dim=2,
+        max_batch_size=2,
+        max_concurrency=3,
+        backoff_seconds=0.0,
+        client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+    texts = [f"t{position}" for position in range(7)]
+    try:
+        vectors = embedder.embed_texts(texts)
+    finally:
+        embedder.close()
+
+    assert vectors[:, 0].tolist() == list(range(7))
+    assert sorted(len(batch) for batch in seen) == [1, 1, 2, 2, 2, 2, 2, 2]
+
+
+def test_real_embedder_gives_up_after_max_retries():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(503)
+
+    embedder = RealEmbedder(
+        base_url="http://embeddings.test",
+        api_key="key",
+        model="test-embed",
+        dim=2,
+        max_retries=2,
+        backoff_seconds=0.0,
+        client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+    with pytest.raises(httpx.HTTPStatusError):
+        embedder.embed_texts(["a"])
+    assert len(calls) == 3
+
+
+def test_real_embedder_does_not_retry_conflicts():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(409)
+
+    embedder = RealEmbedder(
+        base_url="http://embeddings.test",
+        api_key="key",
+        model="test-embed",
+        dim=2,
+        max_retries=2,
+        backoff_seconds=0.0,
+        client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+    with pytest.raises(httpx.HTTPStatusError):
+        embedder.embed_texts(["a"])
+    assert len(calls) == 1
+
+
+def test_async_real_embedder_matches_batching_and_retries():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        batch = json.loads(request.content)["input"]
+        calls.append(batch)
+        if len(calls) == 1:
+            return httpx.Response(503)
+        data = [
+            {"index": position, "embedding": [float(text[1:]), 0.0]}
+            for position, text in reversed(list(enumerate(batch)))
+        ]
+        return httpx.Response(200, json={"data": data})
+
+    embedder = AsyncRealEmbedder(
+        base_url="http://embed",
+        api_key="k",
+        model="m",
+        dim=2,
+        max_batch_size=2,
+        max_concurrency=2,
+        backoff_seconds=0.0,
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    vectors = asyncio.run(embedder.embed_texts([f"t{position}" for position in range(5)]))
+
+    assert vectors[:, 0].tolist() == list(range(5))
+    assert len(calls) == 4
+    assert embedder_fingerprint(embedder) == "m:2"
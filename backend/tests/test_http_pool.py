@@ -0,0 +1,40 @@
+import httpx
+
+from app.services import http_pool
+from app.services.embeddings import RealEmbedder
+from app.services.llm.real import RealLLMClient
+
+
+def test_pool_client_is_shared_until_closed():
+    http_pool.configure(http_pool.PoolConfig(max_connections=4, max_keepalive_connections=2))
+    try:
+        first = http_pool.get_client()
+        assert http_pool.get_client() is first
+        http_pool.close()
+        assert first.is_closed
+        assert http_pool.get_client() is not first
+    finally:
+        http_pool.configure(http_pool.PoolConfig())
+
+
+def test_providers_reuse_the_pool_client(monkeypatch):
+    paths = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.path)
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, json={"data": [{"index": 0, "embedding": [1.0, 0.0]}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    shared = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_pool, "get_client", lambda: shared)
+
+    llm = RealLLMClient(base_url="http://llm", api_key="k", model="deepseek-chat")
+    embedder = RealEmbedder(base_url="http://llm", api_key="k", model="m", dim=2)
+    assert llm.generate_answer("q", "ctx") == "ok"
+    embedder.embed_texts(["a"])
+    embedder.close()
+
+    assert paths == ["/v1/chat/completions", "/embeddings"]
+    # Closing a provider must not tear down the process-wide pool.
+    assert not shared.is_closed
@@ -0,0 +1,634 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.models import Chunk, Document
+from app.db.session import Base
+from app.services.chunk_table import ChunkTable, content_hash
+from app.services.embedding_store import EmbeddingStore
+from app.services.embeddings import CharNgramEmbedder, HashEmbedder
+from app.services.index_factory import IndexSpec
+from app.services import index_manager as index_manager_module
+from app.services import index_snapshot as index_snapshot_module
+from app.services.index_manager import IndexManager
+from app.services.index_snapshot import IndexSnapshot
+
+
+@pytest.fixture()
+def db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture()
+def manager(tmp_path):
+    return IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+
+
+def _add_document(db, texts):
+    document = Document(filename="doc.txt", content_type="text/plain")
+    db.add(document)
+    db.flush()
+    for position, text in enumerate(texts):
+        db.add(Chunk(document_id=document.id, chunk_index=position, text=text, metadata_json={}))
+    db.commit()
+    return document.id
+
+
+def test_add_document_appends_without_rebuild(db, manager):
+    first = _add_document(db, ["alpha one", "alpha two"])
+    manager.rebuild(db)
+    second = _add_document(db, ["beta one"])
+
+    manager.embedder.embed_texts = _counting(manager.embedder.embed_texts)
+    result = manager.add_document(db, second)
+
+    assert result["added"] == 1
+    assert manager.embedder.embed_texts.calls == [1]
+    assert manager.snapshot.vector_count == 3
+    assert manager.snapshot.delta_count == 1
+    assert manager.staleness(db) == "current"
+    hits = manager.search("beta one", top_k=1, db=db, document_id=second)
+    assert [item["document_id"] for item in hits] == [second]
+    assert manager.search("alpha one", top_k=1, db=db, document_id=first)[0]["document_id"] == first
+
+
+def test_add_document_is_idempotent(db, manager):
+    manager.rebuild(db)
+    doc_id = _add_document(db, ["gamma"])
+    manager.add_document(db, doc_id)
+    assert manager.add_document(db, doc_id)["added"] == 0
+    assert manager.snapshot.vector_count == 1
+
+
+def test_load_persisted_index(db, manager, tmp_path):
+    doc_id = _add_document(db, ["delta"])
+    manager.rebuild(db)
+    reloaded = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    assert reloaded.load_if_exists()
+    assert reloaded.search("delta", top_k=1, db=db)[0]["document_id"] == doc_id
+
+
+def _counting(func):
+    def wrapper(texts):
+        items = list(texts)
+        wrapper.calls.append(len(items))
+        return func(items)
+
+    wrapper.calls = []
+    return wrapper
+
+
+def test_remove_document_tombstones_and_compacts(db, manager):
+    keep = _add_document(db, ["keep me"])
+    drop = _add_document(db, ["drop me", "drop me too"])
+    manager.rebuild(db)
+
+    result = manager.remove_document(drop)
+
+    assert result["removed"] == 2
+    assert manager.deleted_fraction() == pytest.approx(2 / 3)
+    assert all(item["document_id"] == keep for item in manager.search("drop me", top_k=3, db=db))
+
+    manager.compact()
+    assert manager.deleted_fraction() == 0.0
+    assert manager.snapshot.vector_count == 1
+    assert manager.snapshot.table.chunk_ids.tolist() == [
+        item["chunk_id"] for item in manager.search("keep me", top_k=1, db=db)
+    ]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_tombstones_are_skipped_inside_the_scan(db, tmp_path, monkeypatch, index_type):
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        spec=IndexSpec(index_type=index_type),
+    )
+    keep = _add_document(db, [f"keep {position}" for position in range(20)])
+    drop = _add_document(db, [f"drop {position}" for position in range(80)])
+    manager.rebuild(db)
+    manager.remove_document(drop)
+
+    ks = []
+    search = IndexSnapshot.search
+
+    def recording(self, vectors, k, **kwargs):
+        ks.append(k)
+        return search(self, vectors, k, **kwargs)
+
+    monkeypatch.setattr(IndexSnapshot, "search", recording)
+    [hits] = manager._vector_hits(manager.snapshot, ["drop 3"], top_k=5)
+
+    # k stays at top_k however many tombstones there are, and no slot is wasted on them.
+    assert ks == [5]
+    assert len(hits) == 5
+    assert set(manager.snapshot.table.document_ids_for(np.array([chunk_id for chunk_id, _ in hits]))) == {keep}
+
+
+def test_readding_a_tombstoned_chunk_replaces_its_vector(db, manager):
+    doc_id = _add_document(db, ["old text"])
+    manager.rebuild(db)
+    manager.remove_document(doc_id)
+    chunk = db.query(Chunk).filter(Chunk.document_id == doc_id).one()
+    chunk.text = "new text"
+    db.commit()
+
+    manager.add_document(db, doc_id)
+
+    # The stale base vector is merged away rather than left under a live id.
+    assert manager.snapshot.vector_count == 1
+    assert manager.snapshot.delta_count == 0
+    assert manager.search("new text", top_k=1, db=db)[0]["score"] == pytest.approx(0.0, abs=1e-5)
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf", "ivfpq"])
+def test_index_types_build_and_search(db, tmp_path, monkeypatch, index_type):
+    spec = IndexSpec(index_type=index_type, nlist=2, pq_m=8)
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        spec=spec,
+    )
+    doc_id = _add_document(db, [f"chunk {position}" for position in range(300)])
+    other_id = _add_document(db, ["other one", "other two", "other three"])
+    result = manager.rebuild(db)
+
+    assert result["index_type"] == index_type
+    hits = manager.search("chunk 7", top_k=3, db=db, nprobe=2, ef_search=16)
+    assert hits and hits[0]["document_id"] == doc_id
+
+    # Document-scoped search scans only the document's vectors, looked up by id,
+    # including in a snapshot loaded back from disk.
+    base_search = manager.snapshot.base.search
+    manager.snapshot.base.search = None
+    scoped = manager.search("chunk 7", top_k=5, db=db, document_id=other_id)
+    manager.snapshot.base.search = base_search
+    assert len(scoped) == 3 and {hit["document_id"] for hit in scoped} == {other_id}
+    reloaded = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        spec=spec,
+    )
+    assert reloaded.load_if_exists()
+    assert reloaded.search("chunk 7", top_k=5, db=db, document_id=other_id) == scoped
+    # Scanning the document in blocks merges to the same result.
+    monkeypatch.setattr(index_snapshot_module, "DOCUMENT_SCAN_BLOCK", 2)
+    assert manager.search("chunk 7", top_k=5, db=db, document_id=other_id) == scoped
+
+    assert manager.remove_document(doc_id)["removed"] == 300
+    assert {hit["document_id"] for hit in manager.search("chunk 7", top_k=3, db=db)} == {other_id}
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf", "ivfpq"])
+def test_merges_keep_every_index_type_searchable(db, tmp_path, monkeypatch, index_type):
+    monkeypatch.setattr(index_manager_module, "DELTA_MERGE_MIN_VECTORS", 4)
+    monkeypatch.setattr(index_manager_module, "DELTA_MERGE_FRACTION", 0.0)
+    spec = IndexSpec(index_type=index_type, nlist=2, pq_m=8)
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        spec=spec,
+    )
+    _add_document(db, [f"chunk {position}" for position in range(300)])
+    readded = _add_document(db, ["readded one", "readded two"])
+    dropped = _add_document(db, ["dropped one", "dropped two"])
+    manager.rebuild(db)
+
+    def top_document(text):
+        return manager.search(text, top_k=1, db=db, nprobe=2)[0]["document_id"]
+
+    # Re-adding a tombstoned document forces a merge.
+    manager.remove_document(readded)
+    manager.add_document(db, readded)
+    assert manager.snapshot.delta_count == 0 and manager.snapshot.vector_count == 304
+    assert top_document("readded two") == readded
+
+    # Compaction drops the tombstoned vectors.
+    manager.remove_document(dropped)
+    manager.compact()
+    assert manager.snapshot.vector_count == 302
+    assert manager.snapshot.active_spec.index_type == index_type
+
+    # A full delta merges into the base.
+    added = _add_document(db, [f"late {position}" for position in range(4)])
+    manager.add_document(db, added)
+    assert manager.snapshot.delta_count == 0 and manager.snapshot.vector_count == 306
+    assert top_document("late 3") == added
+    assert len(manager.search("late 3", top_k=5, db=db, document_id=added)) == 4
+
+
+def test_rebuild_streams_pages_and_trains_ivf_on_a_sample(db, tmp_path):
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        spec=IndexSpec(index_type="ivf", nlist=2, train_sample=100),
+        rebuild_batch_size=64,
+    )
+    doc_id = _add_document(db, [f"paged chunk {position}" for position in range(150)])
+    manager.embedder.embed_texts = _counting(manager.embedder.embed_texts)
+
+    result = manager.rebuild(db)
+
+    assert result["index_type"] == "ivf" and result["chunk_total"] == 150
+    # Two pages of training sample, then three pages of chunks.
+    assert manager.embedder.embed_texts.calls == [64, 36, 64, 64, 22]
+    assert manager.snapshot.table.chunk_ids.tolist() == list(range(1, 151))
+    assert manager.search("paged chunk 149", top_k=1, db=db, nprobe=2)[0]["chunk_id"] == 150
+    assert manager.lexical_search("paged", 3, db)[0]["document_id"] == doc_id
+
+
+def test_failed_rebuild_resumes_from_checkpoint(db, manager):
+    _add_document(db, [f"resumable chunk {position}" for position in range(10)])
+    manager.rebuild_batch_size = 3
+    embed = manager.embedder.embed_texts
+    calls = []
+
+    def flaky(texts):
+        calls.append(len(texts))
+        if len(calls) == 3:
+            raise RuntimeError("provider unavailable")
+        return embed(texts)
+
+    manager.embedder.embed_texts = flaky
+    with pytest.raises(RuntimeError):
+        manager.rebuild(db)
+    build = manager.status()["build"]
+    assert build["state"] == "failed" and build["done"] == 6
+    assert build["checkpoint"]["last_chunk_id"] == 6
+
+    result = manager.rebuild(db)
+
+    # The failed page is embedded again; the first two are not.
+    assert calls == [3, 3, 3, 3, 1]
+    assert result["resumed_from"] == 6 and result["chunk_total"] == 10
+    assert manager.status()["build"]["state"] == "completed"
+    assert manager.status()["build"]["checkpoint"] is None
+    assert manager.search("resumable chunk 2", top_k=1, db=db)[0]["chunk_id"] == 3
+    assert len(manager.snapshot.lexical) == 10
+
+
+def test_ivf_degrades_to_flat_until_trainable(db, manager):
+    manager.spec = IndexSpec(index_type="ivf", nlist=64)
+    _add_document(db, ["tiny corpus"])
+    assert manager.rebuild(db)["index_type"] == "flat"
+    assert manager.staleness(db) == "current"
+
+
+def test_mmap_load_copies_before_mutation(db, manager, tmp_path):
+    _add_document(db, ["mapped one", "mapped two"])
+    manager.rebuild(db)
+    reader = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        mmap=True,
+    )
+    assert reader.load_if_exists()
+    assert reader.search("mapped one", top_k=1, db=db)[0]["chunk_id"] == 1
+
+    doc_id = _add_document(db, ["mapped three"])
+    assert reader.add_document(db, doc_id)["added"] == 1
+    assert reader.remove_document(doc_id)["removed"] == 1
+    reader.compact()
+    assert reader.snapshot.vector_count == 2
+    assert reader.search("mapped two", top_k=1, db=db)[0]["chunk_id"] == 2
+
+
+def test_compact_rebuilds_indexes_without_remove_support(db, tmp_path):
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        spec=IndexSpec(index_type="hnsw"),
+    )
+    keep = _add_document(db, ["hnsw keep"])
+    drop = _add_document(db, ["hnsw drop"])
+    manager.rebuild(db)
+    manager.remove_document(drop)
+    assert manager.snapshot.vector_count == 2
+
+    manager.compact()
+    assert manager.snapshot.vector_count == 1
+    assert manager.search("hnsw keep", top_k=2, db=db)[0]["document_id"] == keep
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+def test_document_filter_returns_exact_k_for_rare_documents(db, tmp_path, index_type):
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        spec=IndexSpec(index_type=index_type, nlist=4, nprobe=1),
+    )
+    _add_document(db, [f"bulk {position}" for position in range(400)])
+    rare = _add_document(db, ["rare a", "rare b", "rare c"])
+    manager.rebuild(db)
+
+    hits = manager.search("bulk 3", top_k=3, db=db, document_id=rare)
+    assert len(hits) == 3
+    assert {item["document_id"] for item in hits} == {rare}
+
+
+def test_search_many_embeds_once_and_matches_single_search(db, manager):
+    first = _add_document(db, ["first topic"])
+    second = _add_document(db, ["second topic"])
+    manager.rebuild(db)
+    manager.embedder.embed_texts = _counting(manager.embedder.embed_texts)
+
+    batched = manager.search_many(["first topic", "second topic"], top_k=1, db=db)
+
+    assert manager.embedder.embed_texts.calls == [2]
+    assert [items[0]["document_id"] for items in batched] == [first, second]
+    assert batched[1] == manager.search("second topic", top_k=1, db=db)
+
+
+def test_search_serves_chunk_text_without_db_reads(db, manager):
+    doc_id = _add_document(db, ["stored text"])
+    manager.rebuild(db)
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    hits = manager.search("stored text", top_k=1, db=db)
+    assert hits[0]["text_preview"] == "stored text"
+    assert manager.get_chunks([hits[0]["chunk_id"]], db)[hits[0]["chunk_id"]].document_id == doc_id
+    assert statements == []
+
+    manager.remove_document(doc_id)
+    assert len(manager.chunk_store) == 0
+
+
+def test_lexical_search_per_document_and_corpus(db, manager, tmp_path):
+    first = _add_document(db, ["机器学习入门", "线性代数"])
+    second = _add_document(db, ["机器学习进阶"])
+    manager.rebuild(db)
+
+    assert {item["document_id"] for item in manager.lexical_search("机器学习", 5, db)} == {first, second}
+    hits = manager.lexical_search("机器学习", 5, db, document_id=second)
+    assert [item["document_id"] for item in hits] == [second]
+
+    manager.remove_document(second)
+    assert manager.lexical_search("进阶", 5, db) == []
+
+    reloaded = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    reloaded.load_if_exists()
+    assert reloaded.sync_lexical(db) == 0
+    assert reloaded.lexical_search("线性代数", 1, db)[0]["document_id"] == first
+
+    (reloaded.snapshot.source / "lexical.npz").unlink()
+    reloaded.load_if_exists()
+    assert reloaded.sync_lexical(db) == 2
+
+
+def test_hybrid_search_fuses_ranks_with_provenance(db, manager):
+    _add_document(db, [f"filler passage {position}" for position in range(30)])
+    target = _add_document(db, ["梯度下降 optimizer notes"])
+    manager.rebuild(db)
+
+    hits = manager.hybrid_search("梯度下降", top_k=3, db=db, candidates=5)
+
+    found = next(item for item in hits if item["document_id"] == target)
+    assert found["retrievers"]["lexical"]["rank"] == 1
+    assert found["rrf_score"] >= 1.0 / (manager.rrf_k + 1)
+    assert all(set(item["retrievers"]) <= {"vector", "lexical"} for item in hits)
+    assert [item["rrf_score"] for item in hits] == sorted((item["rrf_score"] for item in hits), reverse=True)
+    # score keeps the vector distance of search(); BM25-only hits have none.
+    for item in hits:
+        vector = item["retrievers"].get("vector")
+        assert item["score"] == (vector["score"] if vector else None)
+
+
+def test_writers_publish_new_snapshots_without_touching_old_ones(db, manager, tmp_path):
+    first = _add_document(db, ["snapshot one"])
+    manager.rebuild(db)
+    before = manager.snapshot
+
+    second = _add_document(db, ["snapshot two"])
+    manager.add_document(db, second)
+    manager.remove_document(first)
+
+    after = manager.snapshot
+    assert after.version == before.version + 2
+    assert before.vector_count == 1 and before.table.live_count == 1
+    assert [item["document_id"] for item in manager.search("snapshot", top_k=2, db=db)] == [second]
+
+    manager.compact()
+    assert manager.snapshot.delta is None
+    reloaded = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    reloaded.load_if_exists()
+    assert reloaded.snapshot.version == manager.snapshot.version
+    assert reloaded.search("snapshot two", top_k=1, db=db)[0]["document_id"] == second
+
+
+def test_delta_segment_is_searched_and_reloaded(db, manager, tmp_path):
+    _add_document(db, [f"base {position}" for position in range(20)])
+    manager.rebuild(db)
+    extra = _add_document(db, ["delta a", "delta b"])
+    manager.add_document(db, extra)
+
+    hits = manager.search("delta a", top_k=2, db=db, document_id=extra)
+    assert {item["document_id"] for item in hits} == {extra}
+    reloaded = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    reloaded.load_if_exists()
+    assert reloaded.snapshot.delta_count == 2
+    assert reloaded.search("delta b", top_k=1, db=db)[0]["document_id"] == extra
+
+
+def test_staleness_detects_same_size_swap_and_applies_delta(db, manager):
+    gone = _add_document(db, ["goes away"])
+    keep = _add_document(db, ["stays put"])
+    manager.rebuild(db)
+    assert manager.staleness(db) == "current"
+
+    db.query(Chunk).filter(Chunk.document_id == gone).delete()
+    db.commit()
+    fresh = _add_document(db, ["arrives later"])
+    assert manager.staleness(db) == "delta"
+
+    manager.embedder.embed_texts = _counting(manager.embedder.embed_texts)
+    assert manager.apply_database_delta(db) == {"added": 1, "removed": 1}
+    assert manager.embedder.embed_texts.calls == [1]
+    assert manager.staleness(db) == "current"
+    assert {item["document_id"] for item in manager.search("text", top_k=5, db=db)} == {keep, fresh}
+
+
+def test_manifest_is_persisted_with_content_checksum(db, manager):
+    _add_document(db, ["checksum me"])
+    manager.rebuild(db)
+    with (manager.snapshot.source / "manifest.json").open("r", encoding="utf-8") as handle:
+        manifest = json.load(handle)["watermark"]
+    assert manifest["chunk_count"] == 1
+    assert manifest["max_chunk_id"] == 1
+    assert manifest["id_checksum"] == 1
+    assert manifest["content_checksum"] == content_hash("checksum me")
+
+
+def test_snapshots_share_base_and_flag_embedder_change(db, manager, tmp_path):
+    _add_document(db, ["first version"])
+    manager.rebuild(db)
+    first = manager.snapshot.source
+    manager.add_document(db, _add_document(db, ["second version"]))
+    second = manager.snapshot.source
+
+    assert second != first
+    assert (second / "base.index").stat().st_ino == (first / "base.index").stat().st_ino
+    assert (tmp_path / "index" / "CURRENT").read_text() == second.name
+
+    reloaded = IndexManager(
+        embedder=HashEmbedder(dim=32),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    reloaded.load_if_exists()
+    assert reloaded.snapshot.version == 2
+    assert reloaded.staleness(db) == "rebuild"
+
+
+def test_workers_sharing_snapshots_follow_and_build_on_each_other(db, manager, tmp_path):
+    first = _add_document(db, ["written by worker one"])
+    manager.rebuild(db)
+    other = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    other.load_if_exists()
+    assert other.reload_if_changed() is False
+
+    second = _add_document(db, ["written by worker two"])
+    manager.add_document(db, second)
+    assert other.reload_if_changed() is True
+    assert other.snapshot.version == manager.snapshot.version
+
+    third = _add_document(db, ["written by worker three"])
+    manager.add_document(db, third)
+    # The writer adopts the newer snapshot under the lock instead of overwriting it.
+    db.query(Chunk).filter(Chunk.document_id == first).delete()
+    db.commit()
+    other.remove_document(first)
+    assert other.snapshot.version == manager.snapshot.version + 1
+    live = other.snapshot.table.document_ids_for(other.snapshot.table.live_chunk_ids())
+    assert set(live.tolist()) == {second, third}
+    assert other.refresh(db) == "current"
+
+
+def test_legacy_flat_files_are_imported(db, tmp_path):
+    doc_id = _add_document(db, ["legacy chunk"])
+    vectors = HashEmbedder(dim=64).embed_texts(["legacy chunk"])
+    index = faiss.IndexFlatL2(64)
+    index.add(vectors)
+    faiss.write_index(index, str(tmp_path / "faiss.index"))
+    ChunkTable.from_columns([1], [doc_id], [0]).save(tmp_path / "mapping.npy")
+
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    assert manager.load_if_exists()
+    assert manager.snapshot.source == tmp_path / "index" / "snapshots" / "v00000001"
+    assert manager.search("legacy chunk", top_k=1, db=db)[0]["document_id"] == doc_id
+
+
+def test_rebuild_reuses_stored_embeddings(db, tmp_path):
+    embedder = HashEmbedder(dim=64)
+    manager = IndexManager(
+        embedder=embedder,
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+        embedding_store=EmbeddingStore.for_embedder(tmp_path / "embeddings", embedder),
+    )
+    _add_document(db, [f"stored chunk {position}" for position in range(5)])
+    manager.rebuild(db)
+
+    embedder.embed_texts = _counting(embedder.embed_texts)
+    manager.spec = IndexSpec(index_type="hnsw")
+    assert manager.rebuild(db)["index_type"] == "hnsw"
+    assert embedder.embed_texts.calls == []
+    assert manager.search("stored chunk 3", top_k=1, db=db)[0]["chunk_id"] == 4
+
+
+def test_rebuild_fits_char_ngram_idf_and_reload_adopts_it(db, tmp_path):
+    def build():
+        return IndexManager(
+            embedder=CharNgramEmbedder(dim=64),
+            index_path=str(tmp_path / "faiss.index"),
+            mapping_path=str(tmp_path / "mapping.npy"),
+        )
+
+    manager = build()
+    doc_id = _add_document(db, ["向量检索库 FAISS", "关键词检索算法 BM25", "线性代数与矩阵"])
+    _add_document(db, ["向量检索与关键词检索的融合"])
+    manager.rebuild(db)
+
+    assert manager.embedder.idf is not None
+    assert "-idf" in manager.snapshot.embedder
+    assert (manager.snapshot.source / "idf.npy").exists()
+    assert manager.staleness(db) == "current"
+
+    reloaded = build()
+    assert reloaded.staleness(db) == "rebuild"
+    assert reloaded.load_if_exists()
+    assert reloaded.embedder.model == manager.embedder.model
+    assert reloaded.staleness(db) == "current"
+    assert [hit["chunk_id"] for hit in reloaded.search("FAISS 向量", top_k=2, db=db)] == [
+        hit["chunk_id"] for hit in manager.search("FAISS 向量", top_k=2, db=db)
+    ]
+    assert reloaded.search("FAISS 向量", top_k=1, db=db)[0]["document_id"] == doc_id
+
+
+def test_rebuild_checkpoints_are_spaced_geometrically(db, manager):
+    _add_document(db, [f"checkpointed chunk {position}" for position in range(40)])
+    manager.rebuild_batch_size = 1
+    manager.checkpoint_seconds = 1e-9
+    save_checkpoint = manager.snapshots.save_checkpoint
+    saved = []
+
+    def recording(files, state):
+        saved.append(state["done"])
+        return save_checkpoint(files, state)
+
+    manager.snapshots.save_checkpoint = recording
+    manager.rebuild(db)
+
+    assert saved == [1, 2, 3, 5, 8, 12, 18, 27]
+    assert all(later >= earlier * index_manager_module.CHECKPOINT_GROWTH for earlier, later in zip(saved, saved[1:]))
@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.models import Chunk, Document
+from app.db.session import Base
+from app.services.embeddings import HashEmbedder
+from app.services.index_manager import IndexManager
+from app.services.index_scheduler import IndexScheduler
+
+
+@pytest.fixture()
+def session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture()
+def scheduler(tmp_path, session_factory):
+    manager = IndexManager(
+        embedder=HashEmbedder(dim=64),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    scheduler = IndexScheduler(manager, session_factory, debounce_seconds=0.05)
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def _add_document(session_factory, text):
+    db = session_factory()
+    document = Document(filename="doc.txt", content_type="text/plain")
+    db.add(document)
+    db.flush()
+    db.add(Chunk(document_id=document.id, chunk_index=0, text=text, metadata_json={}))
+    db.commit()
+    document_id = document.id
+    db.close()
+    return document_id
+
+
+def test_burst_of_uploads_coalesces_into_one_apply(scheduler, session_factory):
+    scheduler.wait_for(scheduler.request_rebuild("initial"))
+
+    generation = 0
+    for position in range(10):
+        generation = scheduler.enqueue_add(_add_document(session_factory, f"upload {position}"))
+
+    assert scheduler.wait_for(generation, timeout=5)
+    status = scheduler.status()
+    assert status["queue_depth"] == 0
+    assert status["last_applied_generation"] == generation
+    assert status["rebuilds"] == 1
+    assert status["incremental_applies"] == 1
+    assert scheduler.manager.snapshot.table.live_count == 10
+
+
+def test_events_during_an_apply_are_picked_up_next(scheduler, session_factory):
+    scheduler.wait_for(scheduler.request_rebuild("initial"))
+    manager = scheduler.manager
+    late = {}
+    add_documents = manager.add_documents
+
+    def add_and_race(db, document_ids):
+        if not late:
+            late["id"] = _add_document(session_factory, "arrived mid apply")
+            late["generation"] = scheduler.enqueue_add(late["id"])
+        return add_documents(db, document_ids)
+
+    manager.add_documents = add_and_race
+    scheduler.enqueue_add(_add_document(session_factory, "first upload"))
+
+    assert scheduler.wait_for(scheduler.status()["generation"], timeout=5)
+    assert scheduler.wait_for(late["generation"], timeout=5)
+    assert manager.snapshot.table.live_count == 2
+    assert scheduler.status()["incremental_applies"] == 2
+
+
+def test_uploads_before_first_build_trigger_a_rebuild(scheduler, session_factory):
+    first = scheduler.enqueue_add(_add_document(session_factory, "cold start"))
+    second = scheduler.enqueue_delete(12345)
+
+    assert scheduler.wait_for(max(first, second), timeout=5)
+    assert scheduler.status()["rebuilds"] == 1
+    assert scheduler.manager.snapshot.table.live_count == 1
+
+
+class FlakyEmbedder(HashEmbedder):
+    def __init__(self, failures):
+        super().__init__(dim=64)
+        self.failures = failures
+
+    def embed_texts(self, texts):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("embedding service unavailable")
+        return super().embed_texts(texts)
+
+
+def test_failed_apply_is_requeued_and_retried(tmp_path, session_factory):
+    manager = IndexManager(
+        embedder=FlakyEmbedder(failures=0),
+        index_path=str(tmp_path / "faiss.index"),
+        mapping_path=str(tmp_path / "mapping.npy"),
+    )
+    scheduler = IndexScheduler(manager, session_factory, retry_base_seconds=0.2)
+    scheduler.start()
+    try:
+        assert scheduler.wait_for(scheduler.request_rebuild("initial"), timeout=5)
+        manager.embedder.failures = 2
+        generation = scheduler.enqueue_add(_add_document(session_factory, "flaky upload"))
+
+        # The failed batch is not counted as applied, and its error stays visible.
+        assert not scheduler.wait_for(generation, timeout=5, fail_fast=True)
+        status = scheduler.status()
+        assert status["last_error"] == "embedding service unavailable"
+        assert status["failures"] >= 1
+        assert status["last_applied_generation"] < generation
+
+        assert scheduler.wait_for(generation, timeout=5)
+        status = scheduler.status()
+        assert status["last_error"] is None and status["failures"] == 0
+        assert status["queue_depth"] == 0
+        assert manager.snapshot.table.live_count == 1
+    finally:
+        scheduler.stop()
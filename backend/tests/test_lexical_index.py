@@ -0,0 +1,70 @@
+import numpy as np
+
+from app.services.chunk_store import StoredChunk
+from app.services.lexical_index import LexicalIndex, _decode_varints, _write_varint, query_terms
+
+
+def _chunk(chunk_id, text, document_id=1):
+    return StoredChunk(id=chunk_id, document_id=document_id, text=text, metadata_json={})
+
+
+def _ids(hits):
+    return [chunk_id for chunk_id, _ in hits]
+
+
+def test_query_terms_split_cjk_into_bigrams():
+    assert query_terms("机器学习 with Python") == ["机器", "器学", "学习", "with", "python"]
+    assert query_terms("猫") == ["猫"]
+
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 300, 2**40]
+    buffer = bytearray()
+    for value in values:
+        _write_varint(buffer, value)
+    assert _decode_varints(buffer).tolist() == values
+
+
+def test_bm25_ranks_and_restricts_to_chunk_ids():
+    index = LexicalIndex.build(
+        [
+            _chunk(1, "机器学习是人工智能的一个分支"),
+            _chunk(2, "深度学习 neural networks 学习", document_id=2),
+            _chunk(3, "烹饪 recipes and cooking"),
+        ]
+    )
+
+    assert _ids(index.search("机器学习", top_k=2)) == [1, 2]
+    assert _ids(index.search("猫 neural", top_k=3)) == [2]
+    assert _ids(index.search("学习", top_k=5, chunk_ids=np.array([2]))) == [2]
+    assert index.search("quantum", top_k=3) == []
+
+
+def test_remove_compact_and_reload(tmp_path):
+    index = LexicalIndex.build([_chunk(1, "alpha beta"), _chunk(2, "alpha gamma")])
+    original = index
+    index = index.with_added([_chunk(5, "alpha delta")]).with_removed([2])
+    assert _ids(index.search("alpha", top_k=5)) == [1, 5]
+    assert _ids(original.search("alpha", top_k=5)) == [1, 2]
+
+    index = index.compacted()
+    assert index.deleted_count() == 0
+    assert index.search("gamma", top_k=5) == []
+    assert original.search("gamma", top_k=5) != []
+    index.save(tmp_path / "lexical.npz")
+
+    reloaded = LexicalIndex.load(tmp_path / "lexical.npz")
+    assert len(reloaded) == 2
+    assert reloaded.search("alpha delta", top_k=5) == index.search("alpha delta", top_k=5)
+    reloaded = reloaded.with_added([_chunk(2, "gamma again")])
+    assert _ids(reloaded.search("gamma", top_k=5)) == [2]
+
+
+def test_tombstones_do_not_count_towards_idf():
+    index = LexicalIndex.build([_chunk(chunk_id, "faiss index") for chunk_id in range(1, 11)])
+    index = index.with_removed(range(1, 9))
+
+    hits = index.search("faiss", top_k=5)
+    assert _ids(hits) == [9, 10]
+    assert all(score > 0 for _, score in hits)
+    assert hits == index.compacted().search("faiss", top_k=5)
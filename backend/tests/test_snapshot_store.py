@@ -0,0 +1,47 @@
+from app.services.snapshot_store import SnapshotStore
+
+
+def _writer(payload: bytes):
+    def write(path):
+        path.write_bytes(payload)
+
+    return write
+
+
+def test_publish_moves_pointer_and_collects_old_versions(tmp_path):
+    store = SnapshotStore(tmp_path, keep=2)
+    for version in range(1, 4):
+        store.publish(version, {"data.bin": _writer(b"v%d" % version)}, {"note": version})
+
+    path, manifest = store.current()
+    assert path.name == "v00000003"
+    assert manifest["version"] == 3 and manifest["files"] == ["data.bin"]
+    assert sorted(item.name for item in store.snapshots_dir.iterdir()) == ["v00000002", "v00000003"]
+
+    store.publish(4, {"data.bin": path / "data.bin"}, {})
+    assert (store.snapshots_dir / "v00000004" / "data.bin").read_bytes() == b"v3"
+
+
+def test_interrupted_publish_keeps_last_complete_snapshot(tmp_path):
+    store = SnapshotStore(tmp_path)
+    store.publish(1, {"data.bin": _writer(b"good")}, {})
+    # A crash mid-write leaves a staging directory (from another pid) and a
+    # renamed snapshot the pointer never reached.
+    (store.snapshots_dir / ".v00000002.99999999.tmp").mkdir()
+    (store.snapshots_dir / "v00000002").mkdir()
+
+    path, _ = SnapshotStore(tmp_path).current()
+    assert path.name == "v00000001"
+
+    store.publish(2, {"data.bin": _writer(b"better")}, {})
+    assert store.current()[0].joinpath("data.bin").read_bytes() == b"better"
+    assert not (store.snapshots_dir / ".v00000002.99999999.tmp").exists()
+
+
+def test_lock_is_reentrant_within_a_thread(tmp_path):
+    store = SnapshotStore(tmp_path)
+    with store.lock():
+        with store.lock():
+            store.publish(1, {"data.bin": _writer(b"locked")}, {})
+    assert (tmp_path / "build.lock").exists()
+    assert store.current_version() == 1
@@ -78,8 +78,13 @@ export function generateDocSummary(docId, force = false, sessionId) {
   );
 }
 
-export function rebuildIndex(sessionId) {
-  return request('/index/rebuild', { method: 'POST' }, sessionId);
+export function rebuildIndex(sessionId, { wait = true } = {}) {
+  const query = wait ? '?wait=true' : '';
+  return request(`/index/rebuild${query}`, { method: 'POST' }, sessionId);
+}
+
+export function getIndexStatus(sessionId) {
+  return request('/index/status', { method: 'GET' }, sessionId);
 }
 
 export function chat(query, topK, sessionId, documentId) {
@@ -97,6 +102,75 @@ export function chat(query, topK, sessionId, documentId) {
   );
 }
 
+// POST /chat/stream: calls onSources/onToken as events arrive and resolves with
+// the final body, which has the same shape as the /chat response.
+export async function chatStream(query, topK, sessionId, documentId, { onSources, onToken } = {}) {
+  const headers = new Headers({ 'Content-Type': 'application/json' });
+  const trimmedSession = (sessionId || '').trim();
+  if (trimmedSession) {
+    headers.set('X-Session-Id', trimmedSession);
+  }
+  const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify({
+      query,
+      top_k: topK,
+      document_id: Number.isInteger(documentId) ? documentId : null,
+    }),
+  });
+  if (!response.ok) {
+    const contentType = response.headers.get('content-type') || '';
+    const payload = contentType.includes('application/json') ? await response.json() : await response.text();
+    const error = new Error(payload?.detail || payload?.message || response.statusText);
+    error.status = response.status;
+    error.payload = payload;
+    throw error;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          data += line.slice(5).trim();
+        }
+      }
+      if (!data) {
+        continue;
+      }
+      const payload = JSON.parse(data);
+      if (event === 'sources') {
+        onSources?.(payload.sources || []);
+      } else if (event === 'token') {
+        onToken?.(payload.text || '');
+      } else if (event === 'done') {
+        result = payload;
+      }
+    }
+  }
+  if (!result) {
+    throw new Error('回答流意外中断。');
+  }
+  return result;
+}
+
 export function generateQuiz(payload, sessionId) {
   return request(
     '/quiz/generate',
@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react';
 import { useLocation } from 'react-router-dom';
-import { chat, resolveSources } from '../lib/api';
+import { chatStream, resolveSources } from '../lib/api';
 
 export default function ChatPage({ sessionId }) {
   const location = useLocation();
@@ -47,24 +47,36 @@ export default function ChatPage({ sessionId }) {
     setSourceStatus('');
     setSourceError(null);
     setShowTools(false);
-    try {
-      const result = await chat(query.trim(), Number(topK), sessionId, documentId);
-      setAnswer(result);
-      setStatus('');
-      const chunkIds = (result?.sources || [])
+    // Sources arrive before the answer, so citations load while tokens stream in.
+    const loadSources = async (sources) => {
+      const chunkIds = (sources || [])
         .map((item) => item?.chunk_id)
         .filter((id) => Number.isInteger(id));
-      if (chunkIds.length) {
-        setSourceStatus('正在加载引用...');
-        try {
-          const resolved = await resolveSources({ chunk_ids: chunkIds }, sessionId);
-          setSourceItems(resolved?.items || []);
-          setSourceStatus('');
-        } catch (err) {
-          setSourceError(err);
-          setSourceStatus('');
-        }
+      if (!chunkIds.length) {
+        return;
+      }
+      setSourceStatus('正在加载引用...');
+      try {
+        const resolved = await resolveSources({ chunk_ids: chunkIds }, sessionId);
+        setSourceItems(resolved?.items || []);
+        setSourceStatus('');
+      } catch (err) {
+        setSourceError(err);
+        setSourceStatus('');
       }
+    };
+    try {
+      const result = await chatStream(query.trim(), Number(topK), sessionId, documentId, {
+        onSources: (sources) => {
+          loadSources(sources);
+        },
+        onToken: (text) => {
+          setStatus('正在生成...');
+          setAnswer((prev) => ({ answer: `${prev?.answer || ''}${text}` }));
+        },
+      });
+      setAnswer(result);
+      setStatus('');
     } catch (err) {
       setError(err);
       setStatus('');
@@ -1,19 +1,59 @@
-import { useState } from 'react';
-import { rebuildIndex } from '../lib/api';
+import { useEffect, useRef, useState } from 'react';
+import { getIndexStatus, rebuildIndex } from '../lib/api';
+
+const POLL_INTERVAL_MS = 1000;
+
+function describeBuild(build) {
+  if (!build || build.state !== 'running') {
+    return '正在重建索引...';
+  }
+  if (build.phase === 'training') {
+    return '正在训练索引...';
+  }
+  const eta = build.eta_seconds != null ? `，预计剩余 ${Math.ceil(build.eta_seconds)} 秒` : '';
+  return `正在重建索引：${build.done}/${build.total}（${build.percent}%）${eta}`;
+}
 
 export default function IndexPage({ sessionId }) {
   const [status, setStatus] = useState('');
   const [response, setResponse] = useState(null);
   const [error, setError] = useState(null);
+  const pollRef = useRef(null);
+
+  useEffect(() => () => clearTimeout(pollRef.current), []);
+
+  const poll = (generation) => {
+    pollRef.current = setTimeout(async () => {
+      try {
+        const current = await getIndexStatus(sessionId);
+        const scheduler = current.scheduler || {};
+        if (scheduler.last_applied_generation >= generation) {
+          setResponse(current);
+          if (scheduler.last_error) {
+            setError(new Error(scheduler.last_error));
+            setStatus('索引重建失败，再次重建将从检查点继续。');
+          } else {
+            setStatus('索引已重建。');
+          }
+          return;
+        }
+        setStatus(describeBuild(current.build));
+        poll(generation);
+      } catch (err) {
+        setError(err);
+        setStatus('无法获取索引状态。');
+      }
+    }, POLL_INTERVAL_MS);
+  };
 
   const handleRebuild = async () => {
+    clearTimeout(pollRef.current);
     setStatus('正在重建索引...');
     setError(null);
     setResponse(null);
     try {
-      const result = await rebuildIndex(sessionId);
-      setResponse(result);
-      setStatus('索引已重建。');
+      const result = await rebuildIndex(sessionId, { wait: false });
+      poll(result.generation);
     } catch (err) {
       setError(err);
       setStatus('索引重建失败。');